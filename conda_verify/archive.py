@@ -0,0 +1,369 @@
+"""Read access to the members of a conda package.
+
+CondaPackageCheck reads package members through one of the classes below
+rather than from the filesystem directly. Compressed packages are extracted
+to a temporary directory and read back from there, while uncompressed
+``.tar`` packages are memory-mapped and read in place.
+
+Both are held to the Limits given for them while they are read in:
+extraction stops at the first member that takes a package over one of its
+limits, before that member is written to disk.
+"""
+import errno
+import io
+import mmap
+import os
+import tarfile
+from collections import namedtuple
+from contextlib import closing
+
+import conda_package_handling.api
+
+from conda_verify.errors import Error
+from conda_verify.utilities import checksum, find_first
+
+try:
+    from conda_package_streaming.package_streaming import stream_conda_component
+except ImportError:
+    # conda-package-handling 1.x, which reads .conda packages by itself
+    stream_conda_component = None
+
+# Uncompressed size below which the compression ratio is not limited, as
+# small packages of sparse or repeated data compress far beyond any ratio
+# that a large package reaches
+RATIO_FLOOR = 1 << 24
+
+
+def _missing(member):
+    return IOError(errno.ENOENT, os.strerror(errno.ENOENT), member)
+
+
+class Limits(
+    namedtuple("Limits", ["max_bytes", "max_members", "max_ratio", "max_path_length"])
+):
+    """What a package may expand to: uncompressed bytes, members, the ratio of
+    uncompressed to archive size, and characters in a member path (None for
+    no limit)."""
+
+    __slots__ = ()
+
+
+DEFAULT_LIMITS = Limits(
+    max_bytes=32 << 30, max_members=1000000, max_ratio=1000, max_path_length=4096
+)
+
+
+class LimitExceeded(IOError):
+    """Raised when a package goes over one of its Limits while it is read in.
+
+    error is the C1154 Error to report for the package.
+    """
+
+    def __init__(self, path, message):
+        super(LimitExceeded, self).__init__(message)
+        self.error = Error(path, "C1154", message)
+
+    def __str__(self):
+        return "[{}] {}".format(self.error.code, self.error.message)
+
+
+class _Tally(object):
+    """Count the members of a package as they are read, against its Limits."""
+
+    def __init__(self, path, limits, archive_size):
+        self.path = path
+        self.limits = limits
+        self.archive_size = archive_size
+        self.members = 0
+        self.bytes = 0
+
+    def add(self, name, size):
+        """Count a member, raising LimitExceeded if it takes the package over."""
+        limits = self.limits
+        self.members += 1
+        self.bytes += size
+        if limits.max_path_length is not None and len(name) > limits.max_path_length:
+            raise LimitExceeded(
+                self.path,
+                "Found member path longer than {} characters: {}...".format(
+                    limits.max_path_length, name[:100]
+                ),
+            )
+        if limits.max_members is not None and self.members > limits.max_members:
+            raise LimitExceeded(
+                self.path, "Package has more than {} members".format(limits.max_members)
+            )
+        if limits.max_bytes is not None and self.bytes > limits.max_bytes:
+            raise LimitExceeded(
+                self.path,
+                "Package expands to more than {} bytes".format(limits.max_bytes),
+            )
+        if (
+            limits.max_ratio is not None
+            and self.bytes > RATIO_FLOOR
+            and self.bytes > self.archive_size * limits.max_ratio
+        ):
+            raise LimitExceeded(
+                self.path,
+                "Package expands to more than {} times its {} bytes".format(
+                    limits.max_ratio, self.archive_size
+                ),
+            )
+
+
+def _iter_tars(path):
+    """Yield the tar streams of the compressed package at path, in order."""
+    if stream_conda_component is None:
+        with tarfile.open(path, "r|*") as tar:
+            yield tar
+        return
+    components = ("info", "pkg") if path.endswith(".conda") else ("pkg",)
+    with open(path, "rb") as f:
+        for component in components:
+            # closing the stream releases its tar and decompressor
+            with closing(stream_conda_component(path, f, component)) as stream:
+                for tar, _ in stream:
+                    # tar hands out its members again from the first one
+                    yield tar
+                    break
+
+
+def _checked_members(path, tar, tally, dest):
+    for info in tar:
+        tally.add(info.name, info.size)
+        target = os.path.realpath(os.path.join(dest, info.name))
+        if os.path.commonprefix([dest + os.sep, target + os.sep]) != dest + os.sep:
+            raise conda_package_handling.api.InvalidArchiveError(
+                path, "contains unsafe path: {}".format(info.name)
+            )
+        yield info
+
+
+def extract(path, dest, limits=None):
+    """Extract the compressed package at path to the directory dest.
+
+    With limits, members are checked against them as they are read from
+    the archive, in a single pass, and LimitExceeded is raised at the first
+    one that takes the package over, before it is written.  An archive that
+    cannot be read, such as a truncated one, raises InvalidArchiveError.
+    """
+    try:
+        _extract(path, dest, limits)
+    except (tarfile.TarError, EOFError) as e:
+        raise conda_package_handling.api.InvalidArchiveError(
+            path, "failed to extract: {}".format(e)
+        )
+
+
+def _extract(path, dest, limits):
+    if limits is None:
+        conda_package_handling.api.extract(path, dest)
+        return
+    tally = _Tally(path, limits, os.path.getsize(path))
+    if path.endswith(".conda") and stream_conda_component is None:
+        # without streaming access, the limits are checked once extracted
+        conda_package_handling.api.extract(path, dest)
+        archive = ExtractedArchive(dest)
+        for member in archive.members:
+            tally.add(member, archive.size(member))
+        return
+    dest = os.path.realpath(dest)
+    # members are trusted as conda-package-handling trusts them, once
+    # _checked_members has kept them inside dest
+    options = {"filter": "fully_trusted"} if hasattr(tarfile, "data_filter") else {}
+    for tar in _iter_tars(path):
+        tar.extractall(dest, members=_checked_members(path, tar, tally, dest), **options)
+
+
+class _ViewReader(io.RawIOBase):
+    """A read-only binary file over a memoryview, without copying it."""
+
+    def __init__(self, view):
+        super(_ViewReader, self).__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._view[self._pos : self._pos + len(b)]
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+
+class ExtractedArchive(object):
+    """Package members that have been extracted to a directory on disk."""
+
+    def __init__(self, root):
+        self.root = root
+        self.members = [
+            os.path.relpath(os.path.join(dp, f), root)
+            for dp, dn, filenames in os.walk(root)
+            for f in filenames
+        ]
+
+    def _join(self, member):
+        return os.path.join(self.root, member)
+
+    def read(self, member):
+        """Return the full contents of member as bytes."""
+        with open(self._join(member), "rb") as f:
+            return f.read()
+
+    def head(self, member, size):
+        """Return at most the first size bytes of member."""
+        with open(self._join(member), "rb") as f:
+            return f.read(size)
+
+    def open(self, member):
+        """Return member as a binary file object, for reading it in pieces."""
+        return open(self._join(member), "rb")
+
+    def size(self, member):
+        return os.stat(self._join(member)).st_size
+
+    def checksum(self, member, algorithm="sha256"):
+        with open(self._join(member), "rb") as f:
+            return checksum(f, algorithm)
+
+    def find(self, member, patterns):
+        """Return (offset, pattern) for the first of patterns in member, or None.
+
+        The file is memory-mapped and searched in place.
+        """
+        with open(self._join(member), "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return find_first(data, patterns)
+        finally:
+            data.close()
+
+    def isfile(self, member):
+        return os.path.isfile(self._join(member))
+
+    def isdir(self, member):
+        return os.path.isdir(self._join(member))
+
+    def islink(self, member):
+        return os.path.islink(self._join(member))
+
+    def close(self):
+        pass
+
+
+class MappedTarArchive(object):
+    """An uncompressed tar package read in place through a memory map.
+
+    The member headers are indexed once when the archive is opened.  After
+    that, member contents are handed out as memoryview slices of the mapping,
+    so hashing and header sniffing neither copy the data nor write anything
+    to disk.
+    """
+
+    # guard against symlink cycles inside the archive
+    max_link_depth = 32
+
+    def __init__(self, path, limits=None):
+        """Map and index the package at path, raising LimitExceeded if its
+        members go over limits."""
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self._index = {}
+        tally = _Tally(path, limits, len(self._map)) if limits is not None else None
+        try:
+            with tarfile.open(fileobj=self._map, mode="r:") as tar:
+                for info in tar:
+                    if tally is not None:
+                        tally.add(info.name, info.size)
+                    self._index[os.path.normpath(info.name)] = info
+        except Exception:
+            self.close()
+            raise
+        self.members = [
+            name for name, info in self._index.items() if not info.isdir()
+        ]
+
+    @property
+    def data(self):
+        """The whole archive, as a memoryview of the mapping."""
+        return self._view
+
+    def _resolve(self, member):
+        """Follow symlinks and hardlinks to the member holding the data."""
+        info = self._index.get(member)
+        for _ in range(self.max_link_depth):
+            if info is None or not (info.issym() or info.islnk()):
+                return info
+            if info.issym():
+                target = os.path.join(os.path.dirname(member), info.linkname)
+            else:
+                target = info.linkname
+            member = os.path.normpath(target)
+            info = self._index.get(member)
+        return None
+
+    def _data(self, member):
+        info = self._resolve(member)
+        if info is None or not info.isreg():
+            raise _missing(member)
+        return self._view[info.offset_data:info.offset_data + info.size]
+
+    def read(self, member):
+        """Return the full contents of member as bytes."""
+        return self._data(member).tobytes()
+
+    def head(self, member, size):
+        """Return a zero-copy view of at most the first size bytes of member."""
+        return self._data(member)[:size]
+
+    def open(self, member):
+        """Return member as a binary file object reading from the mapping."""
+        return io.BufferedReader(_ViewReader(self._data(member)))
+
+    def size(self, member):
+        return self._data(member).nbytes
+
+    def checksum(self, member, algorithm="sha256"):
+        return checksum(self._data(member), algorithm)
+
+    def find(self, member, patterns):
+        """Return (offset, pattern) for the first of patterns in member, or None.
+
+        The search runs over the member's range of the archive's mapping.
+        """
+        info = self._resolve(member)
+        if info is None or not info.isreg():
+            raise _missing(member)
+        match = find_first(
+            self._map, patterns, info.offset_data, info.offset_data + info.size
+        )
+        if match is not None:
+            match = (match[0] - info.offset_data, match[1])
+        return match
+
+    def isfile(self, member):
+        info = self._resolve(member)
+        return info is not None and info.isreg()
+
+    def isdir(self, member):
+        info = self._resolve(member)
+        return info is not None and info.isdir()
+
+    def islink(self, member):
+        info = self._index.get(member)
+        return info is not None and info.issym()
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # a caller still holds a view; the mapping is released with it
+            pass
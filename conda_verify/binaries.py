@@ -0,0 +1,189 @@
+"""Read the architecture of the executables and libraries in a package.
+
+Only the headers are read: the ELF identification and machine fields, the
+Mach-O CPU type of a thin binary or of every slice of a fat one, and the
+machine field of the PE header that the MZ stub points to.  A first read
+of HEADER_SIZE bytes holds all of them for nearly every binary; the rest
+take a second, exactly sized read.
+
+Architectures are named the same across the three formats, so that they
+can be compared with the one the package was built for.
+"""
+import struct
+from collections import namedtuple
+
+# Bytes read from the start of every file
+HEADER_SIZE = 512
+
+ELF_MACHINES = {
+    3: "x86",
+    8: "mips",
+    20: "ppc",
+    21: "ppc64",
+    22: "s390x",
+    40: "arm",
+    62: "x86_64",
+    183: "arm64",
+    243: "riscv64",
+}
+
+MACHO_CPU_TYPES = {
+    7: "x86",
+    12: "arm",
+    18: "ppc",
+    0x01000007: "x86_64",
+    0x0100000C: "arm64",
+    0x01000012: "ppc64",
+}
+
+PE_MACHINES = {
+    0x14C: "x86",
+    0x1C0: "arm",
+    0x1C4: "arm",
+    0x8664: "x86_64",
+    0xAA64: "arm64",
+}
+
+# The architectures of conda's subdir suffixes and index.json arch values
+CONDA_ARCHS = {
+    "32": "x86",
+    "64": "x86_64",
+    "x86": "x86",
+    "x86_64": "x86_64",
+    "aarch64": "arm64",
+    "arm64": "arm64",
+    "armv6l": "arm",
+    "armv7l": "arm",
+    "ppc64le": "ppc64le",
+    "ppc64": "ppc64",
+    "s390x": "s390x",
+}
+
+# The binary format native to each conda platform
+PLATFORM_FORMATS = {"linux": "ELF", "osx": "MachO", "win": "PE"}
+
+_MACHO_MAGICS = {
+    b"\xfe\xed\xfa\xce": (">", 32),
+    b"\xfe\xed\xfa\xcf": (">", 64),
+    b"\xce\xfa\xed\xfe": ("<", 32),
+    b"\xcf\xfa\xed\xfe": ("<", 64),
+}
+
+# fat Mach-O magics, with the size of their per-slice entries
+_FAT_MAGICS = {b"\xca\xfe\xba\xbe": 20, b"\xca\xfe\xba\xbf": 32}
+
+# Java class files share the fat magic; they have far more "slices"
+_MAX_FAT_SLICES = 20
+
+
+class Binary(namedtuple("Binary", ["format", "bits", "archs"])):
+    """The format (ELF, MachO or PE), word size and architectures of a binary.
+
+    archs has one entry per slice of a fat Mach-O binary, and one otherwise.
+    bits is None where the format does not tell.
+    """
+
+    def __str__(self):
+        return "{}{} {}".format(self.format, self.bits or "", "+".join(self.archs))
+
+
+def _bytes(data):
+    return data.tobytes() if isinstance(data, memoryview) else data
+
+
+def _arch(names, key):
+    return names.get(key, "unknown-{:#x}".format(key))
+
+
+def _elf(data):
+    if len(data) < 20:
+        return None
+    ei_class, ei_data = struct.unpack_from("BB", data, 4)
+    order = "<" if ei_data == 1 else ">"
+    (machine,) = struct.unpack_from(order + "H", data, 18)
+    arch = _arch(ELF_MACHINES, machine)
+    if arch == "ppc64" and order == "<":
+        arch = "ppc64le"
+    return Binary("ELF", {1: 32, 2: 64}.get(ei_class), (arch,))
+
+
+def _macho(data):
+    if len(data) < 8:
+        return None
+    order, bits = _MACHO_MAGICS[data[:4]]
+    (cpu_type,) = struct.unpack_from(order + "i", data, 4)
+    return Binary("MachO", bits, (_arch(MACHO_CPU_TYPES, cpu_type),))
+
+
+def _fat(data, head):
+    if len(data) < 8:
+        return None
+    entry_size = _FAT_MAGICS[data[:4]]
+    (slices,) = struct.unpack_from(">I", data, 4)
+    if not 0 < slices < _MAX_FAT_SLICES:
+        return None
+    size = 8 + slices * entry_size
+    if len(data) < size:
+        data = _bytes(head(size))
+        if len(data) < size:
+            return None
+    archs = tuple(
+        _arch(MACHO_CPU_TYPES, struct.unpack_from(">i", data, 8 + i * entry_size)[0])
+        for i in range(slices)
+    )
+    return Binary("MachO", None, archs)
+
+
+def _pe(data, head):
+    if len(data) < 64:
+        return None
+    (offset,) = struct.unpack_from("<I", data, 0x3C)
+    size = offset + 6
+    if len(data) < size:
+        data = _bytes(head(size))
+        if len(data) < size:
+            return None
+    if data[offset : offset + 4] != b"PE\0\0":
+        return None
+    (machine,) = struct.unpack_from("<H", data, offset + 4)
+    return Binary("PE", None, (_arch(PE_MACHINES, machine),))
+
+
+def inspect(head):
+    """Return the Binary a file holds, or None if it is not a binary.
+
+    head(size) returns at most the first size bytes of the file.
+    """
+    data = _bytes(head(HEADER_SIZE))
+    magic = data[:4]
+    if magic == b"\x7fELF":
+        return _elf(data)
+    if magic in _MACHO_MAGICS:
+        return _macho(data)
+    if magic in _FAT_MAGICS:
+        return _fat(data, head)
+    if data[:2] == b"MZ":
+        return _pe(data, head)
+    return None
+
+
+def inspect_members(archive, members):
+    """Yield (member, Binary or None) for each of members of archive.
+
+    Members are read through archive.head, so only their headers are read
+    from an extracted tree, and nothing is copied out of a mapped archive
+    beyond the headers.
+    """
+    for member in members:
+        yield member, inspect(lambda size: archive.head(member, size))
+
+
+def package_arch(info):
+    """Return the architecture that the package with index.json info is built for.
+
+    Returns None for noarch packages and unknown architectures.
+    """
+    subdir = info.get("subdir") or ""
+    if "-" in subdir:
+        return CONDA_ARCHS.get(subdir.split("-", 1)[1])
+    return CONDA_ARCHS.get(info.get("arch") or "")
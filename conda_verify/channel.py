@@ -0,0 +1,270 @@
+"""Walk a conda channel by its repodata.json files.
+
+A channel is a directory of subdirs (linux-64, noarch, ...), each holding
+package archives and a repodata.json that lists them.  The checks here are
+about the channel as a whole rather than about any one archive's contents;
+they are numbered C3101 onwards.
+"""
+import itertools
+import json
+import os
+from collections import namedtuple
+
+from six import string_types
+
+from conda_verify.checks import IndexChecks, RepodataRecordCheck
+from conda_verify.errors import Error, PackageError
+from conda_verify.matchspec import ChannelIndex
+from conda_verify.utilities import ensure_list
+
+PACKAGE_EXTENSIONS = (".tar.bz2", ".tar", ".conda")
+
+# The fields of a repodata record that are checked against the archive itself
+ARCHIVE_FIELDS = ("size", "sha256", "md5")
+
+
+class ChannelInput(namedtuple("ChannelInput", ["path", "record", "errors"])):
+    """A package of a channel.
+
+    record is the package's entry in repodata.json, cut down to
+    ARCHIVE_FIELDS, or None if it is not listed or not on disk, so there is
+    nothing to check the archive against.  errors are the channel checks it
+    failed.
+    """
+
+
+def iter_subdirs(channel):
+    """Yield the subdirs of channel that have a repodata.json, in order."""
+    for name in sorted(os.listdir(channel)):
+        subdir = os.path.join(channel, name)
+        if os.path.isfile(os.path.join(subdir, "repodata.json")):
+            yield subdir
+
+
+def load_repodata(subdir):
+    """Map each package filename in subdir/repodata.json to its record."""
+    with open(os.path.join(subdir, "repodata.json")) as f:
+        repodata = json.load(f)
+    records = {}
+    for key in ("packages", "packages.conda"):
+        records.update(repodata.get(key) or {})
+    return records
+
+
+def iter_channel(channel):
+    """Yield a ChannelInput for every package listed in or found in channel."""
+    for subdir in iter_subdirs(channel):
+        for channel_input in iter_subdir(subdir, load_repodata(subdir)):
+            yield channel_input
+
+
+def iter_subdir(subdir, records):
+    """Yield a ChannelInput for every package listed in records or found in subdir.
+
+    Packages listed in repodata.json but missing on disk fail C3102, and
+    archives on disk that repodata.json does not list fail C3101.
+    """
+    on_disk = set(fn for fn in os.listdir(subdir) if fn.endswith(PACKAGE_EXTENSIONS))
+    for fn in sorted(records):
+        path = os.path.join(subdir, fn)
+        if fn not in on_disk:
+            error = Error(
+                path, "C3102", "Found package listed in repodata.json missing on disk"
+            )
+            yield ChannelInput(path, None, [error])
+            continue
+        record = records[fn]
+        yield ChannelInput(
+            path,
+            dict((field, record[field]) for field in ARCHIVE_FIELDS if field in record),
+            [],
+        )
+    for fn in sorted(on_disk.difference(records)):
+        path = os.path.join(subdir, fn)
+        error = Error(path, "C3101", "Found package not listed in repodata.json")
+        yield ChannelInput(path, None, [error])
+
+
+# the unbound check methods, looked up once rather than for every record
+INDEX_CHECKS = [
+    getattr(IndexChecks, name) for name in sorted(dir(IndexChecks)) if name.startswith("check")
+]
+
+
+def lint_records(subdir, records, checks_to_ignore=None):
+    """Run the index checks against each of records, without opening any archive.
+
+    Yields a (path, issues) pair for every record.
+    """
+    ignore = set(ensure_list(checks_to_ignore))
+    for fn in sorted(records):
+        path = os.path.join(subdir, fn)
+        try:
+            record_check = RepodataRecordCheck(path, records[fn])
+            errors = [check(record_check) for check in INDEX_CHECKS]
+        except PackageError as e:
+            yield path, [str(e)]
+            continue
+        except (AttributeError, TypeError) as e:
+            # a record too malformed for the checks to make sense of
+            yield path, [u"Could not check repodata.json record: {}".format(e)]
+            continue
+        yield path, sorted(
+            "[{}] {}".format(error.code, error.message)
+            for error in errors
+            if error is not None and error.code not in ignore
+        )
+
+
+def subdir_index(subdir, records):
+    """Return the ChannelIndex the dependencies of the packages of subdir resolve in.
+
+    That is the packages of subdir itself and of the channel's noarch subdir.
+    A noarch package can be installed on any platform, so the dependencies
+    of the noarch subdir resolve in all the subdirs of the channel.
+    """
+    channel, name = os.path.split(os.path.normpath(subdir))
+    if name == "noarch":
+        others = [other for other in iter_subdirs(channel) if os.path.basename(other) != name]
+    else:
+        others = [os.path.join(channel, "noarch")]
+    index = ChannelIndex(records.values())
+    for other in others:
+        try:
+            other_records = load_repodata(other)
+        except IOError:
+            continue
+        for record in other_records.values():
+            index.add(record)
+    return index
+
+
+def iter_unresolvable(subdir, records, index):
+    """Yield a ChannelInput for each of records with dependencies not in index.
+
+    Such dependencies fail C3104.  Each distinct dependency is only matched
+    against the index once, however many records share it.
+    """
+    for fn in sorted(records):
+        depends = records[fn].get("depends")
+        if not isinstance(depends, list):
+            # malformed records are reported by the index checks
+            continue
+        path = os.path.join(subdir, fn)
+        errors = [
+            Error(
+                path,
+                "C3104",
+                u'Found dependency "{}" that no package in the channel satisfies'.format(
+                    dependency
+                ),
+            )
+            for dependency in depends
+            if isinstance(dependency, string_types) and not index.resolvable(dependency)
+        ]
+        if errors:
+            yield ChannelInput(path, None, errors)
+
+
+def lint_subdir(subdir, checks_to_ignore=None):
+    """Check a subdir from its repodata.json and directory listing alone.
+
+    Returns a sorted list of (path, issues) pairs for the packages with
+    issues, combining the index checks and the channel checks.
+    """
+    ignore = set(ensure_list(checks_to_ignore))
+    records = load_repodata(subdir)
+    results = dict(
+        (path, issues) for path, issues in lint_records(subdir, records, checks_to_ignore)
+        if issues
+    )
+    channel_inputs = iter_subdir(subdir, records)
+    if "C3104" not in ignore:
+        channel_inputs = itertools.chain(
+            channel_inputs,
+            iter_unresolvable(subdir, records, subdir_index(subdir, records)),
+        )
+    for channel_input in channel_inputs:
+        issues = [
+            "[{}] {}".format(error.code, error.message)
+            for error in channel_input.errors
+            if error.code not in ignore
+        ]
+        if issues:
+            results[channel_input.path] = sorted(results.get(channel_input.path, []) + issues)
+    return sorted(results.items())
+
+
+class Snapshot(object):
+    """An earlier copy of a channel's repodata.json files.
+
+    directory mirrors the channel: directory/<subdir>/repodata.json.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._sha256 = {}
+
+    def sha256(self, path):
+        """Return the sha256 the snapshot lists for the package at path, if any."""
+        subdir, fn = os.path.split(path)
+        name = os.path.basename(subdir)
+        if name not in self._sha256:
+            try:
+                records = load_repodata(os.path.join(self.directory, name))
+            except IOError:
+                records = {}
+            self._sha256[name] = dict(
+                (key, record.get("sha256")) for key, record in records.items()
+            )
+        return self._sha256[name].get(fn)
+
+
+class Manifest(object):
+    """The results of verifying the packages of a channel, keyed by sha256.
+
+    The manifest is a JSON file mapping package paths to the sha256 they had
+    when they were verified and the issues found.  A package whose sha256 in
+    repodata.json still matches need not be verified again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except IOError:
+            self.entries = {}
+        # the sha256 of every package listed in the channel in this run
+        self.current = {}
+
+    def lookup(self, path, sha256):
+        """Note that path is listed with sha256, and return its stored issues.
+
+        Returns None if the package is new or has changed.
+        """
+        self.current[path] = sha256
+        entry = self.entries.get(path)
+        if entry is not None and entry["sha256"] == sha256:
+            return entry["issues"]
+        return None
+
+    def record(self, path, issues):
+        sha256 = self.current.get(path)
+        if sha256 is not None:
+            self.entries[path] = {"sha256": sha256, "issues": issues or []}
+
+    def save(self, prune=False):
+        """Write the manifest back.
+
+        With prune, packages no longer listed in the channel are dropped; this
+        is only right once every package has been looked up.
+        """
+        if prune:
+            self.entries = dict(
+                (path, entry) for path, entry in self.entries.items() if path in self.current
+            )
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=0, sort_keys=True)
+        os.rename(tmp, self.path)
@@ -5,99 +5,62 @@ Each class contains specific checks that relate to validating packages
 and recipes. These checks start with the letter 'C', which is an
 abbreviation for 'conda'.
 
-Checks C1101 through C1148 are housed in CondaPackageCheck.
+Checks C1101 through C1148, C1150 through C1153 and C1155 are housed in CondaPackageCheck.
+Checks C1101 through C1115 only need info/index.json and are housed in IndexChecks,
+which CondaPackageCheck shares with RepodataRecordCheck.
 Checks C2101 through C2126 are housed in CondaRecipeCheck.
 """
-import hashlib
 import json
 import os
 import re
-import sys
-
-import conda_package_handling.api
+from collections import OrderedDict
 
 try:
     from tempfile import TemporaryDirectory
 except:
     from backports.tempfile import TemporaryDirectory
 
+from conda_verify.archive import (
+    DEFAULT_LIMITS,
+    ExtractedArchive,
+    MappedTarArchive,
+    extract,
+)
+from conda_verify.binaries import PLATFORM_FORMATS, inspect_members, package_arch
 from conda_verify.errors import Error, PackageError
+from conda_verify.matchspec import is_version_spec
+from conda_verify.paths import PathsTable
 from conda_verify.constants import FIELDS, LICENSE_FAMILIES, CONDA_FORGE_COMMENTS
 from conda_verify.utilities import (
     all_ascii,
+    checksum,
+    checksums,
     get_bad_seq,
-    get_object_type,
     ensure_list,
-    fullmatch,
-    rm_rf,
 )
 
 
+# The syntax of version specs.  Matching it backtracks exponentially on some
+# malformed specs, so the checks use matchspec.is_version_spec instead,
+# which accepts the same strings in linear time.
 ver_spec_pat = r"^(?:[><=]{0,2}(?:(?:[\d\*]+[!\._]?){1,})[+\w\*]*[|,]?){1,}"
 
 
-def _checksum(fd, algorithm, buffersize=65536):
-    hash_impl = getattr(hashlib, algorithm)
-    if not hash_impl:
-        raise ValueError("Unrecognized hash algorithm: {}".format(algorithm))
-    else:
-        hash_impl = hash_impl()
-    for block in iter(lambda: fd.read(buffersize), b""):
-        hash_impl.update(block)
-    return hash_impl.hexdigest()
-
-
 def sha256_checksum(fd):
-    return _checksum(fd, "sha256")
+    return checksum(fd, "sha256")
 
 
-class CondaPackageCheck(object):
-    """Create checks in order to validate conda package tarballs."""
-
-    def __init__(self, path):
-        """Initialize conda package information for use with package checks."""
-        super(CondaPackageCheck, self).__init__()
-        self.path = path
-        self.dist = self.retrieve_package_name(self.path)
+class IndexChecks(object):
+    """Checks of the package metadata in info/index.json.
 
-        self._tmpdir = TemporaryDirectory()
-        self.tmpdir = self._tmpdir.name
-        conda_package_handling.api.extract(self.path, self.tmpdir)
-        self.name, self.version, self.build = self.dist.rsplit("-", 2)
-        self.paths = self.archive_members = [
-            os.path.relpath(os.path.join(dp, f), self.tmpdir)
-            for dp, dn, filenames in os.walk(self.tmpdir)
-            for f in filenames
-        ]
-        with open(os.path.join(self.tmpdir, "info", "index.json"), "rb") as f:
-            self.index = f.read()
-        self.info = json.loads(self.index.decode("utf-8"))
+    These need nothing but the index and the package filename, so besides
+    CondaPackageCheck they back RepodataRecordCheck, which runs them against
+    the copy of the index kept in a channel's repodata.json.  Subclasses set
+    path, info (the index), and name, version and build (from the filename).
+    """
 
-        with open(os.path.join(self.tmpdir, "info", "files"), "rb") as f:
-            self.files_file = f.read()
-
-        try:
-            with open(os.path.join(self.tmpdir, "info", "has_prefix"), "rb") as f:
-                self.prefix_file = f.read()
-        except IOError:
-            self.prefix_file = None
-
-        self.paths_json_path = dict()
-        try:
-            with open(os.path.join(self.tmpdir, 'info', 'paths.json')) as f:
-                self.paths_json = json.load(f)
-                for path in self.paths_json['paths']:
-                    self.paths_json_path[path["_path"]] = path
-        except IOError:
-            self.paths_json = {}
-
-        self.win_pkg = bool(self.info["platform"] == "win")
-        self.name_pat = re.compile(r"[a-z0-9_][a-z0-9_\-\.]*$")
-        self.hash_pat = re.compile(r"[gh][0-9a-f]{5,}", re.I)
-        self.version_pat = re.compile(r"[\w\.]+$")
-
-    def __exit__(self, exc, value, tb):
-        rm_rf(self._tmpdir.name)
+    name_pat = re.compile(r"[a-z0-9_][a-z0-9_\-\.]*$")
+    version_pat = re.compile(r"[\w\.]+$")
 
     @staticmethod
     def retrieve_package_name(path):
@@ -234,7 +197,7 @@ class CondaPackageCheck(object):
                     )
                 elif (
                     len(dependency_parts) == 2
-                    and not fullmatch(ver_spec_pat, dependency_parts[1])
+                    and not is_version_spec(dependency_parts[1])
                     or len(dependency_parts) > 3
                 ):
                     return Error(
@@ -255,6 +218,119 @@ class CondaPackageCheck(object):
                 'Found invalid license "{}" in info/index.json'.format(license),
             )
 
+
+class RepodataRecordCheck(IndexChecks):
+    """Run the index checks against a record of a channel's repodata.json."""
+
+    def __init__(self, path, record):
+        """path is where the package would be in the channel, record its entry."""
+        self.path = path
+        self.info = record
+        self.dist = self.retrieve_package_name(path)
+        self.name, self.version, self.build = self.dist.rsplit("-", 2)
+
+
+class CondaPackageCheck(IndexChecks):
+    """Create checks in order to validate conda package tarballs."""
+
+    # Build prefixes that files must not contain unless info/has_prefix or
+    # info/paths.json lists them, so that the prefix is replaced on install;
+    # the default for the build_prefixes argument
+    build_prefixes = (
+        b"/home/conda/feedstock_root/",
+        b"/conda-bld/",
+        b"/opt/anaconda1anaconda2anaconda3",
+    )
+    # Files that record the build prefix harmlessly and are never relocated
+    build_prefix_exempt = (".pyc", ".pyo")
+
+    def __init__(
+        self, path, repodata_record=None, limits=DEFAULT_LIMITS, build_prefixes=None
+    ):
+        """Initialize conda package information for use with package checks.
+
+        repodata_record is the entry for the package in its channel's
+        repodata.json, if the archive is to be checked against it.  The
+        package is read in within limits, an archive.Limits or None, and
+        archive.LimitExceeded is raised as soon as it goes over them.
+        build_prefixes, if given, replaces the class's build_prefixes as the
+        prefixes that C1153 looks for.
+        """
+        super(CondaPackageCheck, self).__init__()
+        self.path = path
+        if build_prefixes is not None:
+            self.build_prefixes = tuple(
+                prefix if isinstance(prefix, bytes) else prefix.encode("utf-8")
+                for prefix in build_prefixes
+            )
+        self.dist = self.retrieve_package_name(self.path)
+        self.repodata_record = repodata_record
+        algorithms = [
+            algorithm
+            for algorithm in ("sha256", "md5")
+            if repodata_record and algorithm in repodata_record
+        ]
+
+        if self.path.endswith(".tar"):
+            # uncompressed packages are verified in place, without extraction
+            self._tmpdir = self.tmpdir = None
+            self.archive = MappedTarArchive(self.path, limits)
+            self.archive_size = len(self.archive.data)
+            self.archive_digests = checksums(self.archive.data, algorithms)
+        else:
+            self.archive_size = os.path.getsize(self.path)
+            self.archive_digests = {}
+            if algorithms:
+                # hashing first leaves the archive in the page cache for extraction
+                with open(self.path, "rb") as f:
+                    self.archive_digests = checksums(f, algorithms)
+            self._tmpdir = TemporaryDirectory()
+            self.tmpdir = self._tmpdir.name
+            try:
+                extract(self.path, self.tmpdir, limits)
+            except Exception:
+                # do not leave a partial extraction behind until collection
+                self._tmpdir.cleanup()
+                raise
+            self.archive = ExtractedArchive(self.tmpdir)
+        self.name, self.version, self.build = self.dist.rsplit("-", 2)
+        self.paths = self.archive_members = self.archive.members
+        self.index = self.archive.read(os.path.join("info", "index.json"))
+        self.info = json.loads(self.index.decode("utf-8"))
+
+        self.files_file = self.archive.read(os.path.join("info", "files"))
+
+        try:
+            self.prefix_file = self.archive.read(os.path.join("info", "has_prefix"))
+        except IOError:
+            self.prefix_file = None
+
+        try:
+            paths_json = self.archive.open(os.path.join("info", "paths.json"))
+        except IOError:
+            self.paths_table = None
+        else:
+            with paths_json:
+                self.paths_table = PathsTable.load(paths_json)
+        self._prefix_table = None
+        self._prefix_errors = None
+        self._file_errors = None
+
+        self.win_pkg = bool(self.info["platform"] == "win")
+        self.hash_pat = re.compile(r"[gh][0-9a-f]{5,}", re.I)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self.close()
+
+    def close(self):
+        """Release the package archive and remove any extracted files."""
+        self.archive.close()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
     def check_index_encoding(self):
         """Check that contents of info/index.json are all ascii characters."""
         if not all_ascii(self.index, self.win_pkg):
@@ -264,18 +340,14 @@ class CondaPackageCheck(object):
 
     def check_members(self):
         """Check the tar archive members for non ascii characters."""
-        for member in self.archive_members:
-            if sys.version_info.major == 2:
-                unicode_path = member.decode("utf-8")
-            else:
-                unicode_path = member.encode("utf-8")
-
-            if not all_ascii(unicode_path):
-                return Error(
-                    self.path,
-                    "C1118",
-                    "Found archive member names containing non-ascii characters",
-                )
+        # scan all the names in one go; joining them by LF, which counts
+        # as ascii, leaves the answer the same as scanning each of them
+        if not all_ascii("\n".join(self.archive_members)):
+            return Error(
+                self.path,
+                "C1118",
+                "Found archive member names containing non-ascii characters",
+            )
 
     def check_files_file_encoding(self):
         """Check the info/files file for non ascii characters."""
@@ -307,43 +379,176 @@ class CondaPackageCheck(object):
         if len(filenames) != len(set(filenames)):
             return Error(self.path, "C1121", "Found duplicate filenames in info/files")
 
-    def check_files_file_for_validity(self):
-        """Check that the files listed in info/files exist in the tar archive and vice versa."""
-        members = set([
-            member
-            for member in self.archive_members
-            if not os.path.isdir(os.path.join(self.tmpdir, member))
-            and not member.startswith("info")
-        ])
-        filenames = set([
-            os.path.normpath(path.strip())
-            for path in self.files_file.decode("utf-8").splitlines()
-            if not path.strip().startswith("info")
-        ])
-
-        sorted_union_filenames = sorted(members.union(filenames))
-        for filename in sorted_union_filenames:
-            if filename not in members:
-                return Error(
-                    self.path,
-                    "C1122",
-                    (
-                        u"Found filename in info/files missing from tar " "archive: {}"
-                    ).format(filename),
+    @property
+    def paths_json(self):
+        """The contents of info/paths.json, or {} if there is none.
+
+        This is rebuilt from paths_table on every access; the checks use
+        paths_table directly.
+        """
+        return self.paths_table.to_json() if self.paths_table is not None else {}
+
+    @property
+    def paths_json_path(self):
+        """Map each _path in info/paths.json to its entry."""
+        if self.paths_table is None:
+            return {}
+        return dict(
+            (path, self.paths_table.entry(row))
+            for row, path in enumerate(self.paths_table.paths)
+        )
+
+    def _iter_file_sources(self):
+        """Merge-walk the archive members, info/files and info/paths.json in order.
+
+        Each source is sorted once, and the walk yields a (name, in_archive,
+        in_files, row) tuple for every distinct name in any of them, where
+        row is the row of name in paths_table or None.  Files in info/ are
+        left out.
+        """
+
+        def walk(names):
+            # skip duplicates, which C1121 reports
+            previous = None
+            for name, value in names:
+                if name != previous:
+                    yield name, value
+                    previous = name
+
+        lines = (line.strip() for line in self.files_file.decode("utf-8").splitlines())
+        sources = [
+            walk(
+                (member, True)
+                for member in sorted(self.archive_members)
+                if not member.startswith("info")
+            ),
+            walk(
+                (name, True)
+                for name in sorted(
+                    os.path.normpath(line)
+                    for line in lines
+                    if line and not line.startswith("info")
                 )
-            elif filename not in filenames:
-                return Error(
-                    self.path,
-                    "C1123",
-                    u"Found filename in tar archive missing from info/files: {}".format(
-                        filename
-                    ),
+            ),
+            walk(
+                (os.path.normpath(self.paths_table.paths[row]), row)
+                for row in (
+                    self.paths_table.sorted_rows() if self.paths_table is not None else ()
+                )
+            ),
+        ]
+        members, files, rows = (next(source, None) for source in sources)
+        while members or files or rows:
+            if members and files and rows and members[0] == files[0] == rows[0]:
+                # the usual case, where all three agree
+                yield members[0], True, True, rows[1]
+                members, files, rows = (next(source, None) for source in sources)
+                continue
+            name = min(head[0] for head in (members, files, rows) if head)
+            in_archive = in_files = False
+            row = None
+            if members and members[0] == name:
+                in_archive = True
+                members = next(sources[0], None)
+            if files and files[0] == name:
+                in_files = True
+                files = next(sources[1], None)
+            if rows and rows[0] == name:
+                row = rows[1]
+                rows = next(sources[2], None)
+            yield name, in_archive, in_files, row
+
+    def reconcile_files(self):
+        """Check the archive members, info/files and info/paths.json against each other.
+
+        All three are compared in a single merge-walk, and every mismatch is
+        reported rather than only the first, grouped by the check method that
+        returns it.  The result is computed once.
+        """
+        if self._file_errors is not None:
+            return self._file_errors
+        errors = dict(
+            (method, [])
+            for method in (
+                "check_files_file_for_validity",
+                "check_package_hashes_and_size",
+                "check_paths_json_for_validity",
+            )
+        )
+        for name, in_archive, in_files, row in self._iter_file_sources():
+            if in_files and not in_archive:
+                errors["check_files_file_for_validity"].append(
+                    Error(
+                        self.path,
+                        "C1122",
+                        u"Found filename in info/files missing from tar archive: {}".format(
+                            name
+                        ),
+                    )
+                )
+            elif in_archive and not in_files and not self.archive.isdir(name):
+                errors["check_files_file_for_validity"].append(
+                    Error(
+                        self.path,
+                        "C1123",
+                        u"Found filename in tar archive missing from info/files: {}".format(
+                            name
+                        ),
+                    )
+                )
+            if self.paths_table is not None and in_files != (row is not None):
+                errors["check_paths_json_for_validity"].append(
+                    Error(
+                        self.path,
+                        "C1155",
+                        u"Found filename in {} missing from {}: {}".format(
+                            "info/files" if in_files else "info/paths.json",
+                            "info/paths.json" if in_files else "info/files",
+                            name,
+                        ),
+                    )
                 )
+            if row is not None and in_archive and self.archive.isfile(name):
+                error = self._check_file_entry(name, row)
+                if error is not None:
+                    errors["check_package_hashes_and_size"].append(error)
+        self._file_errors = errors
+        return errors
+
+    def _check_file_entry(self, member, row):
+        """Check the size and sha256 of member against its row of paths_table."""
+        size = self.paths_table.size(row)
+        if size is not None and self.archive.size(member) != size:
+            return Error(
+                self.path,
+                "C1147",
+                'Found file "{}" with filesize different than listed in paths.json'.format(
+                    member
+                ),
+            )
+        sha256 = self.paths_table.sha256(row)
+        if sha256 is not None and self.archive.checksum(member, "sha256") != sha256:
+            return Error(
+                self.path,
+                "C1146",
+                'Found file "{}" with sha256 hash different than listed in paths.json'.format(
+                    member
+                ),
+            )
+        return None
+
+    def check_files_file_for_validity(self):
+        """Check that the files listed in info/files exist in the tar archive and vice versa."""
+        return self.reconcile_files()["check_files_file_for_validity"]
+
+    def check_paths_json_for_validity(self):
+        """Check that info/files and info/paths.json list the same files."""
+        return self.reconcile_files()["check_paths_json_for_validity"]
 
     def check_for_hardlinks(self):
         """Check the tar archive for hardlinks."""
         for member in self.archive_members:
-            if os.path.islink(os.path.join(self.tmpdir, member)):
+            if self.archive.islink(member):
                 return Error(
                     self.path,
                     "C1124",
@@ -407,77 +612,151 @@ class CondaPackageCheck(object):
                     self.path, "C1128", "Found non-ascii characters in info/has_prefix"
                 )
 
+    @property
+    def prefix_table(self):
+        """Map each file that has a prefix placeholder to (placeholder, mode, source).
+
+        Entries are read from every line of info/has_prefix, then from
+        info/paths.json for files that has_prefix does not list; source is
+        the file an entry was read from.  The table is built on first use.
+        """
+        if self._prefix_table is None:
+            table = OrderedDict()
+            if self.prefix_file is not None:
+                for line in self.prefix_file.decode("utf-8").splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        placeholder, mode, filename = line.split()
+                        placeholder = placeholder.strip("'\"")
+                        filename = filename.strip("'\"")
+                    except ValueError:
+                        placeholder, mode, filename = "/<dummy>/<placeholder>", "text", line
+                    table.setdefault(filename, (placeholder, mode, "info/has_prefix"))
+            if self.paths_table is not None:
+                for path, placeholder, mode in self.paths_table.placeholders():
+                    if placeholder:
+                        table.setdefault(path, (placeholder, mode, "info/paths.json"))
+            self._prefix_table = table
+        return self._prefix_table
+
     @property
     def prefix_file_contents(self):
-        """Extract the contents of the has_prefix file and return them.
+        """Return the (placeholder, mode, filename) of the first has_prefix entry.
 
         If the has_prefix file does not exist, None is returned.
         """
-        if self.prefix_file is not None:
-            for line in self.prefix_file.decode("utf-8").splitlines():
-                line = line.strip()
-                try:
-                    placeholder, mode, filename = line.split()
-                    placeholder = placeholder.strip("'\"")
-                    filename = filename.strip("'\"")
-                except ValueError:
-                    placeholder, mode, filename = "/<dummy>/<placeholder>", "text", line
-
+        for filename, (placeholder, mode, source) in self.prefix_table.items():
+            if source == "info/has_prefix":
                 return (placeholder, mode, filename)
         return None
 
+    def validate_prefix_table(self):
+        """Check every entry of the prefix table in one pass.
+
+        Returns a dict with the first error found by each of the has_prefix
+        checks, keyed by check method name.
+        """
+        if self._prefix_errors is None:
+            errors = {}
+            members = set(self.paths)
+            for filename, (placeholder, mode, source) in self.prefix_table.items():
+                if (
+                    "check_prefix_file_filename" not in errors
+                    and os.path.normpath(filename) not in members
+                ):
+                    errors["check_prefix_file_filename"] = Error(
+                        self.path,
+                        "C1129",
+                        u'Found filename "{}" in {} not included in archive'.format(
+                            filename, source
+                        ),
+                    )
+                if mode not in ("binary", "text"):
+                    errors.setdefault(
+                        "check_prefix_file_mode",
+                        Error(
+                            self.path,
+                            "C1130",
+                            u'Found invalid mode "{}" in {}'.format(mode, source),
+                        ),
+                    )
+                elif mode == "binary" and "check_prefix_file_binary_mode" not in errors:
+                    error = self._binary_placeholder_error(placeholder, source)
+                    if error is not None:
+                        errors["check_prefix_file_binary_mode"] = error
+            self._prefix_errors = errors
+        return self._prefix_errors
+
+    def _binary_placeholder_error(self, placeholder, source):
+        if self.name == "python":
+            return Error(
+                self.path,
+                "C1131",
+                "Binary placeholder found in {} not allowed when building Python".format(
+                    source
+                ),
+            )
+        elif self.win_pkg:
+            return Error(
+                self.path,
+                "C1132",
+                "Binary placeholder found in {} not allowed in Windows package".format(
+                    source
+                ),
+            )
+        elif len(placeholder) != 255:
+            return Error(
+                self.path,
+                "C1133",
+                u'Binary placeholder "{}" found in {} does not have a length of 255 bytes'.format(
+                    placeholder, source
+                ),
+            )
+        return None
+
     def check_prefix_file_filename(self):
         """Check that the filenames in has_prefix exist in the archive."""
-        if self.prefix_file_contents is not None:
-            _, _, filename = self.prefix_file_contents
-
-            if os.path.normpath(filename) not in self.paths:
-                return Error(
-                    self.path,
-                    "C1129",
-                    u'Found filename "{}" in info/has_prefix not included in archive'.format(
-                        filename
-                    ),
-                )
+        return self.validate_prefix_table().get("check_prefix_file_filename")
 
     def check_prefix_file_mode(self):
         """Check that the has_prefix mode is either binary or text."""
-        if self.prefix_file_contents is not None:
-            _, mode, _ = self.prefix_file_contents
-
-            if mode not in ["binary", "text"]:
-                return Error(
-                    self.path,
-                    "C1130",
-                    u'Found invalid mode "{}" in info/has_prefix'.format(mode),
-                )
+        return self.validate_prefix_table().get("check_prefix_file_mode")
 
     def check_prefix_file_binary_mode(self):
         """Check that the has_prefix file binary mode is correct."""
-        if self.prefix_file_contents is not None:
-            placeholder, mode, _ = self.prefix_file_contents
+        return self.validate_prefix_table().get("check_prefix_file_binary_mode")
 
-            if mode == "binary":
-                if self.name == "python":
-                    return Error(
-                        self.path,
-                        "C1131",
-                        "Binary placeholder found in info/has_prefix not allowed when building Python",
-                    )
-                elif self.win_pkg:
-                    return Error(
-                        self.path,
-                        "C1132",
-                        "Binary placeholder found in info/has_prefix not allowed in Windows package",
-                    )
-                elif len(placeholder) != 255:
-                    return Error(
-                        self.path,
-                        "C1133",
-                        u'Binary placeholder "{}" found in info/has_prefix does not have a length of 255 bytes'.format(
-                            placeholder
-                        ),
-                    )
+    def check_for_build_prefix(self):
+        """Check that files missing from info/has_prefix contain no build prefix.
+
+        The placeholders declared in the prefix table are searched for too:
+        a file that contains one but is not listed is never relocated.
+        """
+        patterns = set(self.build_prefixes)
+        for placeholder, _, _ in self.prefix_table.values():
+            patterns.add(placeholder.encode("utf-8"))
+        patterns = sorted(patterns)
+        listed = set(os.path.normpath(filename) for filename in self.prefix_table)
+        for member in self.archive_members:
+            if (
+                member.startswith("info")
+                or member.endswith(self.build_prefix_exempt)
+                or member in listed
+                or self.archive.islink(member)
+                or not self.archive.isfile(member)
+            ):
+                continue
+            match = self.archive.find(member, patterns)
+            if match is not None:
+                return Error(
+                    self.path,
+                    "C1153",
+                    u'Found build prefix "{}" in file "{}" not listed in info/has_prefix'.format(
+                        match[1].decode("utf-8", "replace"), member
+                    ),
+                )
 
     def check_for_post_links(self):
         """Check the tar archive for pre and post link files."""
@@ -602,8 +881,15 @@ class CondaPackageCheck(object):
         elif len(menu_json_files) > 1:
             return Error(self.path, "C1143", "Found more than one Menu json file")
 
-    def check_windows_arch(self):
-        """Check that Windows package .exes and .dlls contain the correct headers."""
+    def check_binary_arch(self):
+        """Check that the executables and libraries are built for the package's arch.
+
+        The headers of all the files are read in one pass.  Binaries of the
+        platform's own format must match the arch in info/index.json, while
+        those of other formats are taken to be data, such as the Windows
+        launchers that setuptools ships on every platform.  In Windows
+        packages every .exe and .dll must be a PE binary of the right arch.
+        """
         if self.win_pkg:
             arch = self.info["arch"]
             if arch not in ("x86", "x86_64"):
@@ -613,49 +899,65 @@ class CondaPackageCheck(object):
                     u'Found unrecognized Windows architecture "{}"'.format(arch),
                 )
 
-            for member in self.archive_members:
-                if member.endswith((".exe", ".dll")):
-                    with open(os.path.join(self.tmpdir, member), "rb") as file_object:
-                        file_header = file_object.read(4096)
-                        file_object_type = get_object_type(file_header)
-                        if (arch == "x86" and file_object_type != "DLL I386") or (
-                            arch == "x86_64" and file_object_type != "DLL AMD64"
-                        ):
-
-                            return Error(
-                                self.path,
-                                "C1145",
-                                u'Found file "{}" with object type "{}" but with arch "{}"'.format(
-                                    member, file_object_type, arch
-                                ),
-                            )
+        expected = package_arch(self.info)
+        if expected is None:
+            return None
+        native = PLATFORM_FORMATS.get(self.info.get("platform"))
+        members = [
+            member
+            for member in self.archive_members
+            if not member.startswith("info")
+            and not self.archive.islink(member)
+            and self.archive.isfile(member)
+        ]
+        for member, binary in inspect_members(self.archive, members):
+            required = self.win_pkg and member.endswith((".exe", ".dll"))
+            if not required and (binary is None or binary.format != native):
+                continue
+            if binary is None or expected not in binary.archs:
+                return Error(
+                    self.path,
+                    "C1145",
+                    u'Found file "{}" with object type "{}" but with arch "{}"'.format(
+                        member, binary, self.info.get("arch") or self.info.get("subdir")
+                    ),
+                )
 
     def check_package_hashes_and_size(self):
         """Check the sha256 checksum and filesize of each file in the package."""
-        for member in self.archive_members:
-            file_path = os.path.join(self.tmpdir, member)
-            if member in self.paths_json_path:
-                if os.path.isfile(file_path):
-                    path = self.paths_json_path[member]
-                    size = os.stat(file_path).st_size
-                    if size != path["size_in_bytes"]:
-                        return Error(
-                            self.path,
-                            "C1147",
-                            'Found file "{}" with filesize different than listed in paths.json'.format(
-                                member
-                            ),
-                        )
-                    with open(file_path, "rb") as file_object:
-                        sha256_digest = sha256_checksum(file_object)
-                    if sha256_digest != path["sha256"]:
-                        return Error(
-                            self.path,
-                            "C1146",
-                            'Found file "{}" with sha256 hash different than listed in paths.json'.format(
-                                member
-                            ),
-                        )
+        return self.reconcile_files()["check_package_hashes_and_size"]
+
+    def check_repodata_size(self):
+        """Check the size of the package archive against repodata.json."""
+        expected = (self.repodata_record or {}).get("size")
+        if expected is not None and expected != self.archive_size:
+            return Error(
+                self.path,
+                "C1150",
+                "Found package size {} different than {} listed in repodata.json".format(
+                    self.archive_size, expected
+                ),
+            )
+
+    def check_repodata_sha256(self):
+        """Check the sha256 checksum of the package archive against repodata.json."""
+        expected = (self.repodata_record or {}).get("sha256")
+        if expected is not None and expected != self.archive_digests["sha256"]:
+            return Error(
+                self.path,
+                "C1151",
+                "Found package with sha256 hash different than listed in repodata.json",
+            )
+
+    def check_repodata_md5(self):
+        """Check the md5 checksum of the package archive against repodata.json."""
+        expected = (self.repodata_record or {}).get("md5")
+        if expected is not None and expected != self.archive_digests["md5"]:
+            return Error(
+                self.path,
+                "C1152",
+                "Found package with md5 hash different than listed in repodata.json",
+            )
 
     def check_noarch_files(self):
         """Check that noarch packages do not contain architecture specific files."""
@@ -828,8 +1130,8 @@ class CondaRecipeCheck(object):
                     self.recipe_dir, "C2113", "Found empty dependencies in meta.yaml"
                 )
 
-            elif len(requirement_parts) >= 2 and not fullmatch(
-                ver_spec_pat, requirement_parts[1]
+            elif len(requirement_parts) >= 2 and not is_version_spec(
+                requirement_parts[1]
             ):
                 return Error(
                     self.recipe_dir,
@@ -1,55 +1,868 @@
 from __future__ import print_function
+import hashlib
+import heapq
+import itertools
 import json
 import os
 import sys
-from glob import glob
+import tarfile
+from collections import namedtuple
+from glob import iglob
 
 import click
 import tqdm
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, wait
 
 from conda_verify import __version__
-from conda_verify.verify import Verify
-from conda_verify.utilities import DummyExecutor, render_metadata, iter_cfgs
+from conda_verify.archive import DEFAULT_LIMITS, Limits
+from conda_verify.executors import (
+    AUTO_PEEK_TASKS,
+    EXECUTOR_KINDS,
+    Budget,
+    TaskTimeout,
+    WorkerDied,
+    WorkerPool,
+    cpu_count,
+    make_executor,
+    select_executor_kind,
+)
+from conda_verify.checks import CondaPackageCheck
+from conda_verify.channel import (
+    PACKAGE_EXTENSIONS,
+    Manifest,
+    Snapshot,
+    iter_channel,
+    iter_subdirs,
+    lint_subdir,
+)
+from conda_verify.clobber import ClobberIndex, read_package_files
+from conda_verify.errors import Error, PackageError, RecipeError
+from conda_verify.journal import Journal
+from conda_verify.workqueue import DEFAULT_LEASE, WorkQueue
+from conda_verify.verify import Verify, prefetch_package_checks
+from conda_verify.utilities import ensure_list, lru_cache, render_metadata, iter_cfgs
 
+# Nominal cost of verifying one rendered recipe variant, expressed in bytes so
+# that recipes and packages can share one progress bar and one schedule.
+RECIPE_VARIANT_WEIGHT = 1 << 20
 
-def _submit_verify_recipe(path, executor, ignore):
-    futures = []
+# Codes reported for inputs whose verification ran out of time
+TIMEOUT_CODES = {"package": "C1149", "recipe": "C2127"}
+
+# Reported for inputs whose worker process died while verifying them
+WORKER_DIED_ISSUE = "Verification did not finish"
+
+# With --prefetch, packages are verified in batches of this many per task so
+# that each worker can overlap extracting one package with checking another.
+PIPELINE_BATCH_SIZE = 8
+
+# How many tasks beyond the in-flight limit are read ahead of time, so that
+# the largest of them can be submitted first.
+LOOKAHEAD_FACTOR = 4
+
+SHARD_BALANCE = ("hash", "size")
+
+# Kinds of tasks that only report issues already known, which _run_tasks
+# resolves in place rather than sending them to a worker
+REPORT_KINDS = ("channel", "skipped")
+
+
+class _Task(namedtuple("_Task", ["kind", "paths", "weight", "fn", "args"])):
+    """A unit of work for the executor, weighted by its expected cost.
+
+    kind is "package" or "recipe" (or "channel" and "skipped" for inputs
+    reported without any verifying), and paths are the inputs it covers.
+    """
+
+
+@lru_cache(maxsize=None)
+def _repodata_sizes(directory):
+    """Map package filenames to the sizes recorded in directory/repodata.json."""
+    try:
+        with open(os.path.join(directory, "repodata.json")) as f:
+            repodata = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    sizes = {}
+    for key in ("packages", "packages.conda"):
+        for fn, record in repodata.get(key, {}).items():
+            if "size" in record:
+                sizes[fn] = record["size"]
+    return sizes
+
+
+def _package_weight(path):
+    directory, fn = os.path.split(os.path.abspath(path))
+    size = _repodata_sizes(directory).get(fn)
+    if size is None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            # missing on disk, such as a package only listed in repodata.json
+            size = 0
+    return size
+
+
+def _is_recipe(path):
+    return os.path.isfile(os.path.join(path, "meta.yaml"))
+
+
+def _iter_input_paths(paths, files_from=None):
+    """Lazily expand path specs, directories and a file list into input paths.
+
+    Directories that are not recipes are walked for packages.
+    """
+    for path in paths:
+        for match in iglob(os.path.expanduser(path)):
+            if os.path.isdir(match) and not _is_recipe(match):
+                for dirpath, dirnames, filenames in os.walk(match):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        if filename.endswith(PACKAGE_EXTENSIONS):
+                            yield os.path.join(dirpath, filename)
+            else:
+                yield match
+    if files_from is not None:
+        for line in files_from:
+            line = line.strip()
+            if line:
+                yield line
+
+
+class _ShardParam(click.ParamType):
+    """A shard given as i/n, where 1 <= i <= n."""
+
+    name = "i/n"
+
+    def convert(self, value, param, ctx):
+        try:
+            index, count = (int(part) for part in value.split("/"))
+        except ValueError:
+            self.fail("{!r} is not of the form i/n".format(value), param, ctx)
+        if not 1 <= index <= count:
+            self.fail("shard {} is not between 1 and {}".format(index, count), param, ctx)
+        return index - 1, count
+
+
+def _path_shard(path, count):
+    """Pick a shard for path that is the same on every machine and every run."""
+    digest = hashlib.md5(os.path.normpath(path).encode("utf-8")).hexdigest()
+    return int(digest, 16) % count
+
+
+def _input_weight(path):
+    return RECIPE_VARIANT_WEIGHT if _is_recipe(path) else _package_weight(path)
+
+
+def _shard_paths(input_paths, shard, balance="hash", dropped=None):
+    """Keep the input paths that belong to shard, an (index, count) pair.
+
+    hash assigns paths by a stable hash and streams them.  size reads the
+    whole input set and deals the inputs, largest first, to the shard with
+    the least total size so far, so that the shards finish at about the same
+    time.  Either way, every machine computes the same partition without any
+    coordination as long as they are given the same inputs.  The paths of
+    other shards are passed to dropped(path), if given.
+    """
+    index, count = shard
+    if balance == "hash":
+        for path in input_paths:
+            if _path_shard(path, count) == index:
+                yield path
+            elif dropped is not None:
+                dropped(path)
+        return
+    inputs = sorted((-_input_weight(path), path) for path in set(input_paths))
+    loads = [(0, i) for i in range(count)]
+    for negative_weight, path in inputs:
+        load, i = heapq.heappop(loads)
+        heapq.heappush(loads, (load - negative_weight, i))
+        if i == index:
+            yield path
+        elif dropped is not None:
+            dropped(path)
+
+
+def _iter_channel_paths(channel, channel_inputs, manifest=None, since=None, replay=None):
+    """Yield the paths of the packages of channel.
+
+    The ChannelInput for each path is left in channel_inputs, for _iter_tasks
+    to pick up, so that the stages in between only deal with paths.  Stages
+    that filter paths out must drop their ChannelInputs as they do.
+
+    Packages whose sha256 in repodata.json is unchanged are skipped: those
+    in the manifest have their stored issues passed to replay(path, issues)
+    instead, and those in the since snapshot are left out altogether.
+    """
+    for channel_input in iter_channel(channel):
+        path = channel_input.path
+        sha256 = (channel_input.record or {}).get("sha256")
+        if sha256 is not None:
+            if manifest is not None:
+                issues = manifest.lookup(path, sha256)
+                if issues is not None:
+                    replay(path, issues)
+                    continue
+            if since is not None and since.sha256(path) == sha256:
+                continue
+        channel_inputs[path] = channel_input
+        yield path
+
+
+def _iter_repodata_tasks(channels, ignore):
+    for channel in channels:
+        for subdir in iter_subdirs(channel):
+            yield _Task(
+                "repodata",
+                [subdir],
+                os.path.getsize(os.path.join(subdir, "repodata.json")),
+                lint_subdir,
+                (subdir, ignore),
+            )
+
+
+def _iter_tasks(
+    input_paths,
+    ignore,
+    prefetch=0,
+    fail_fast=False,
+    channel_inputs=None,
+    limits=DEFAULT_LIMITS,
+    batch_size=PIPELINE_BATCH_SIZE,
+    build_prefixes=None,
+    channel_issues=None,
+):
+    """Yield a _Task for every input path, with exactly one result per path.
+
+    Inputs with nothing to verify, such as recipes whose variants are all
+    skipped, get a "skipped" task that reports no issues.  Packages of a
+    channel that are missing on disk get a "channel" task that reports
+    their channel issues.  Other packages with channel issues, such as those
+    not listed in repodata.json, are verified as usual, and their channel
+    issues are left in the channel_issues dict, if given, for the caller to
+    add to their results.
+    """
+    batch = []
+    records = {}
+    batch_size = max(batch_size, prefetch + 1)
+    for path in input_paths:
+        channel_input = channel_inputs.pop(path, None) if channel_inputs else None
+        record = channel_input.record if channel_input is not None else None
+        if channel_input is not None and channel_input.errors:
+            issues = [
+                "[{}] {}".format(error.code, error.message)
+                for error in channel_input.errors
+                if error.code not in ensure_list(ignore)
+            ]
+            if any(error.code == "C3102" for error in channel_input.errors):
+                yield _Task("channel", [path], 0, _report_issues, (path, issues))
+                continue
+            if issues and channel_issues is not None:
+                channel_issues[path] = issues
+        if _is_recipe(path):
+            task = _recipe_task(path, ignore, fail_fast)
+            yield task if task is not None else _skipped_task(path)
+        elif path.endswith(PACKAGE_EXTENSIONS):
+            weight = (record or {}).get("size") or _package_weight(path)
+            if not prefetch:
+                yield _Task(
+                    "package",
+                    [path],
+                    weight,
+                    _submit_verify_package,
+                    (path, ignore, fail_fast, record, limits, build_prefixes),
+                )
+                continue
+            batch.append((path, weight))
+            if record:
+                records[path] = record
+            if len(batch) == batch_size:
+                yield _package_batch_task(
+                    batch, ignore, prefetch, fail_fast, records, limits, build_prefixes
+                )
+                batch, records = [], {}
+        else:
+            yield _skipped_task(path)
+    if batch:
+        yield _package_batch_task(
+            batch, ignore, prefetch, fail_fast, records, limits, build_prefixes
+        )
+
+
+def _skipped_task(path):
+    return _Task("skipped", [path], 0, _report_issues, (path, []))
+
+
+def _package_batch_task(
+    batch, ignore, prefetch, fail_fast, records, limits=DEFAULT_LIMITS, build_prefixes=None
+):
+    paths = [path for path, _ in batch]
+    return _Task(
+        "package",
+        paths,
+        sum(weight for _, weight in batch),
+        _submit_verify_packages,
+        (paths, ignore, prefetch, fail_fast, records or None, limits, build_prefixes),
+    )
+
+
+def _recipe_task(path, ignore, fail_fast=False):
+    metas = []
     for cfg in iter_cfgs():
         meta = render_metadata(path, cfg)
         if meta.get("build", {}).get("skip", "").lower() != "true":
-            futures.append(
-                executor.submit(
-                    Verify.verify_recipe,
-                    rendered_meta=meta,
-                    recipe_dir=path,
-                    checks_to_ignore=ignore,
-                    exit_on_error=False,
-                )
+            metas.append(meta)
+    if metas:
+        return _Task(
+            "recipe",
+            [path],
+            RECIPE_VARIANT_WEIGHT * len(metas),
+            _submit_verify_recipe,
+            (path, metas, ignore, fail_fast),
+        )
+
+
+def _first_error(exception):
+    """Format the error carried by a PackageError or RecipeError as issues."""
+    error = exception.args[0] if exception.args else None
+    if isinstance(error, Error):
+        return ["[{}] {}".format(error.code, error.message)]
+    return [str(exception)]
+
+
+def _submit_verify_recipe(path, metas, ignore, fail_fast=False):
+    recipe_issues = set()
+    for meta in metas:
+        try:
+            _, issues = Verify.verify_recipe(
+                rendered_meta=meta,
+                recipe_dir=path,
+                checks_to_ignore=ignore,
+                exit_on_error=fail_fast,
             )
-    return futures
+        except RecipeError as e:
+            return path, _first_error(e)
+        recipe_issues.update(issues)
+    return path, sorted(recipe_issues)
+
 
+def _report_issues(path, issues):
+    return path, issues
 
-def _submit_verify_package(path, ignore):
+
+def _submit_verify_package(
+    path, ignore, fail_fast=False, record=None, limits=DEFAULT_LIMITS, build_prefixes=None
+):
     package_issues = (path, None)
     try:
         package_issues = Verify.verify_package(
-            path_to_package=path, checks_to_ignore=ignore, exit_on_error=False
+            path_to_package=path,
+            checks_to_ignore=ignore,
+            exit_on_error=fail_fast,
+            repodata_record=record,
+            limits=limits,
+            build_prefixes=build_prefixes,
         )
     except (KeyError, OSError) as e:
         package_issues = (path, [str(e)])
+    except PackageError as e:
+        if not fail_fast:
+            raise
+        package_issues = (path, _first_error(e))
     return package_issues
 
 
-@click.command()
+def _submit_verify_packages(
+    paths,
+    ignore,
+    prefetch,
+    fail_fast=False,
+    records=None,
+    limits=DEFAULT_LIMITS,
+    build_prefixes=None,
+):
+    """Verify several packages, extracting up to prefetch of them ahead.
+
+    With fail_fast, the packages after the first one with issues are skipped.
+    records maps paths to the repodata.json entries to check them against,
+    packages are read in within limits, and build_prefixes replaces the
+    prefixes C1153 looks for.
+    """
+    packages_issues = []
+    for path, package_check in prefetch_package_checks(
+        paths, prefetch, records, limits, build_prefixes
+    ):
+        try:
+            if isinstance(package_check, Exception):
+                raise package_check
+            packages_issues.append(
+                Verify.run_package_checks(
+                    package_check, checks_to_ignore=ignore, exit_on_error=fail_fast
+                )
+            )
+        except (KeyError, OSError) as e:
+            packages_issues.append((path, [str(e)]))
+        except PackageError as e:
+            if not fail_fast:
+                raise
+            packages_issues.append((path, _first_error(e)))
+        if fail_fast and packages_issues[-1][1]:
+            break
+    return packages_issues
+
+
+def _cancel_outstanding(executor, futures=()):
+    """Abandon all queued and running work on the executor.
+
+    futures are the outstanding futures, which are cancelled one by one
+    where shutdown cannot cancel them itself.
+    """
+    if isinstance(executor, WorkerPool):
+        executor.terminate()
+        return
+    # running threads cannot be interrupted, but nothing new is started
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        # cancel_futures is new in Python 3.9
+        for future in list(futures):
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _submit_task(executor, task, budgets):
+    budget = budgets.get(task.kind)
+    if budget and hasattr(executor, "submit_with_budget"):
+        # a batch gets the combined budget of the packages in it
+        return executor.submit_with_budget(budget * len(task.paths), task.fn, *task.args)
+    return executor.submit(task.fn, *task.args)
+
+
+def _timeout_issues(task, timeout):
+    code = TIMEOUT_CODES[task.kind]
+    message = "[{}] Verification {}".format(code, timeout)
+    return [(path, [message]) for path in task.paths]
+
+
+def _worker_died_issues(task, error):
+    message = "{}: {}".format(WORKER_DIED_ISSUE, error)
+    return [(path, [message]) for path in task.paths]
+
+
+def _run_tasks(
+    executor, tasks, max_in_flight, progress, budgets=None, lookahead=None, pending=None
+):
+    """Submit tasks with at most max_in_flight outstanding, yielding results.
+
+    Tasks are pulled lazily from the tasks iterable into a window of up to
+    lookahead tasks beyond those in flight (max_in_flight * LOOKAHEAD_FACTOR
+    by default), and the heaviest task in the window is submitted whenever a
+    slot frees up (LPT scheduling), so memory stays proportional to
+    max_in_flight however many inputs there are.  With a lookahead of 0,
+    a task is only pulled once there is a slot for it.  Tasks of the
+    REPORT_KINDS are not worth a round trip to a worker, and yield their
+    results as soon as they are pulled.  budgets maps task
+    kinds to the Budget each task of that kind is held to, where the
+    executor supports it.  pending, if given, is the dict that maps the
+    outstanding futures to their tasks, for the caller to cancel them.
+    """
+    budgets = budgets or {}
+    tasks = iter(tasks)
+    if lookahead is None:
+        lookahead = max_in_flight * LOOKAHEAD_FACTOR
+    counter = itertools.count()
+    window = []
+    pending = {} if pending is None else pending
+    exhausted = False
+    while True:
+        while not exhausted and len(window) + len(pending) < max_in_flight + lookahead:
+            task = next(tasks, None)
+            if task is None:
+                exhausted = True
+            elif task.kind in REPORT_KINDS:
+                yield task.fn(*task.args)
+            else:
+                heapq.heappush(window, (-task.weight, next(counter), task))
+                progress.total += task.weight
+                progress.refresh()
+        while window and len(pending) < max_in_flight:
+            _, _, task = heapq.heappop(window)
+            pending[_submit_task(executor, task, budgets)] = task
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            task = pending.pop(future)
+            progress.update(task.weight)
+            try:
+                results = future.result()
+            except TaskTimeout as e:
+                results = _timeout_issues(task, e)
+            except WorkerDied as e:
+                # killed, such as by the OOM killer; the other tasks carry on
+                results = _worker_died_issues(task, e)
+            # batched tasks return a list of results
+            for result in results if isinstance(results, list) else [results]:
+                yield result
+
+
+def _iter_queue_results(queue, iter_tasks, run_tasks):
+    """Verify the inputs claimed from queue, yielding their results.
+
+    Inputs are claimed in rounds.  A round ends when nothing is left to
+    claim and every claimed input has its result, and only then does this
+    wait for the inputs other runs hold, so that runs sharing the queue never
+    wait on each other's claims.
+    """
+    while True:
+        for result in run_tasks(iter_tasks(queue.claim_iter(wait=False))):
+            yield result
+        if not queue.wait_for_work():
+            return
+
+
+def _submit_read_package_files(path):
+    try:
+        return path, read_package_files(path)
+    except (EnvironmentError, KeyError, ValueError, tarfile.TarError) as e:
+        # unreadable packages are reported by the package checks
+        return path, []
+
+
+def _check_clobbers(executor, channels, max_in_flight, progress):
+    """Find the packages of each subdir of channels that install the same files.
+
+    Yields a (subdir, issues) pair for each subdir with clobbering packages.
+    """
+    tasks = (
+        _Task("files", [path], _package_weight(path), _submit_read_package_files, (path,))
+        for channel in channels
+        for subdir in iter_subdirs(channel)
+        for path in sorted(
+            os.path.join(subdir, fn)
+            for fn in os.listdir(subdir)
+            if fn.endswith(PACKAGE_EXTENSIONS)
+        )
+    )
+    with ClobberIndex() as index:
+        for path, files in _run_tasks(executor, tasks, max_in_flight, progress):
+            subdir, fn = os.path.split(path)
+            name = fn.rsplit("-", 2)[0]
+            index.add(subdir, fn, name, files)
+        for subdir, pairs in sorted(index.clobbers().items()):
+            yield subdir, [
+                u'[C3103] Found {} files installed by both {} and {}, such as "{}" in {} and {}'.format(
+                    count, name, other, filename, package, other_package
+                )
+                for name, other, count, (filename, package, other_package) in pairs
+            ]
+
+
+def _timed_out(issues):
+    """Whether issues include a timeout or a dead worker, which is worth
+    retrying on a later run."""
+    prefixes = tuple("[{}]".format(code) for code in TIMEOUT_CODES.values())
+    prefixes += (WORKER_DIED_ISSUE,)
+    return any(issue.startswith(prefixes) for issue in issues or [])
+
+
+def _report_worker_stats(stats):
+    print("worker  processes  tasks  peak memory", file=sys.stderr)
+    for slot, processes, tasks, peak_rss in stats:
+        peak = "unknown" if peak_rss is None else tqdm.tqdm.format_sizeof(peak_rss, "B", 1024)
+        print(
+            "{:<6}  {:>9}  {:>5}  {:>11}".format(slot, processes, tasks, peak),
+            file=sys.stderr,
+        )
+
+
+class _ResultWriter(object):
+    """Write out verification results as they arrive instead of collecting them.
+
+    Results are printed, or streamed into out_file as one JSON object.
+    """
+
+    def __init__(self, out_file=None):
+        self.out_file = out_file
+        self.failed = False
+        self._file = open(out_file, "w") if out_file else None
+
+    def write(self, path, issues):
+        if not issues:
+            return
+        if self._file is not None:
+            self._file.write(", " if self.failed else "{")
+            self._file.write("{}: {}".format(json.dumps(path), json.dumps(issues)))
+        else:
+            with tqdm.tqdm.external_write_mode():
+                print("-" * len(path))
+                print(path)
+                print("-" * len(path))
+                for check in sorted(issues):
+                    try:
+                        print(check, file=sys.stderr)
+                    except UnicodeEncodeError:
+                        print(
+                            "Could not print message for error code {} due to unicode error".format(
+                                check.code
+                            ),
+                            file=sys.stderr,
+                        )
+        self.failed = True
+
+    def close(self):
+        if self._file is not None:
+            self._file.write("}" if self.failed else "{}")
+            self._file.close()
+            print("saved to %s" % self.out_file)
+
+
+class _DefaultGroup(click.Group):
+    """A group that runs its default command when no subcommand is named.
+
+    This keeps ``conda-verify path ...`` working alongside the subcommands.
+    """
+
+    default_command = "verify"
+
+    def parse_args(self, ctx, args):
+        if args[:1] not in (["--help"], ["--version"]) and (
+            not args or args[0] not in self.commands
+        ):
+            args = [self.default_command] + list(args)
+        return super(_DefaultGroup, self).parse_args(ctx, args)
+
+
+@click.group(cls=_DefaultGroup)
+@click.version_option(prog_name="conda-verify", version=__version__)
+def cli():
+    """conda-verify is a tool for validating conda packages and recipes.
+
+    Without a command, the arguments are passed to verify.
+    """
+
+
+@cli.command()
 @click.argument("paths", nargs=-1, type=str)
 @click.option("--ignore", nargs=1, type=str)
 @click.option("--exit", is_flag=True)
-@click.option("--debug", is_flag=True)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    help="Stop at the first failure: skip the remaining checks, cancel all outstanding "
+    "work and exit with status 1.  Running thread workers cannot be interrupted and "
+    "finish their current task.",
+)
+@click.option("--debug", is_flag=True, help="Same as --executor serial.")
 @click.option("--out-file", nargs=1, type=click.Path())
+@click.option(
+    "--channel",
+    multiple=True,
+    type=click.Path(file_okay=False, exists=True),
+    help="Verify every package of this channel against its subdirs' repodata.json, and "
+    "report packages listed there but missing on disk and the reverse.  May be repeated.",
+)
+@click.option(
+    "--clobber",
+    is_flag=True,
+    help="After verifying each --channel, report packages of one subdir that install "
+    "the same files.",
+)
+@click.option(
+    "--manifest",
+    type=click.Path(dir_okay=False),
+    help="Keep the results of --channel runs in this file, keyed by sha256, and only "
+    "verify packages that are new or changed since.  Packages removed from the "
+    "channel are dropped from it.",
+)
+@click.option(
+    "--since",
+    type=click.Path(file_okay=False, exists=True),
+    help="Only verify the packages of --channel that are new or changed compared to "
+    "this earlier copy of the channel's repodata.json files (<dir>/<subdir>/repodata.json).",
+)
+@click.option(
+    "--repodata-only",
+    is_flag=True,
+    help="Check each --channel from its repodata.json records and directory listings "
+    "alone, without opening any package.",
+)
+@click.option(
+    "--shard",
+    type=_ShardParam(),
+    help="Only verify the i-th of n parts of the inputs, so that n machines can share "
+    "the work.  Every machine must be given the same inputs.",
+)
+@click.option(
+    "--shard-balance",
+    type=click.Choice(SHARD_BALANCE),
+    default="hash",
+    show_default=True,
+    help="Split the inputs by a stable hash of their paths, or into shards of about equal "
+    "total size (this reads the whole input set before starting).",
+)
+@click.option(
+    "--queue",
+    type=click.Path(file_okay=False, exists=True),
+    help="Take the inputs from this work queue, made with conda-verify enqueue, instead "
+    "of from the command line.  Any number of runs can share one queue.",
+)
+@click.option(
+    "--lease",
+    type=click.FloatRange(min=1),
+    default=DEFAULT_LEASE,
+    show_default=True,
+    help="Seconds after which an input claimed from --queue by a run that stopped "
+    "renewing its claim is handed to another run.",
+)
+@click.option(
+    "--journal",
+    type=click.Path(dir_okay=False),
+    help="Append each input and its results to this file as soon as it is verified.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the run recorded in --journal: inputs journalled with an unchanged "
+    "size and mtime are not verified again, and their results are reported with the new ones.",
+)
+@click.option(
+    "--files-from",
+    type=click.File("r"),
+    help="Read further input paths from this file, one per line ('-' for stdin).",
+)
+@click.option(
+    "--max-in-flight",
+    type=click.IntRange(min=1),
+    help="Maximum number of tasks submitted but not yet finished.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="Number of workers.  Defaults to the CPUs available, honouring cgroup quotas.",
+)
+@click.option(
+    "--executor",
+    type=click.Choice(EXECUTOR_KINDS),
+    default="auto",
+    show_default=True,
+    help="Run tasks in worker processes, in threads (for I/O-bound runs), or serially. "
+    "auto runs small inputs serially and everything else in processes.",
+)
+@click.option(
+    "--prefetch",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Verify packages in batches, extracting up to this many packages ahead of the "
+    "one being checked on a background thread in each worker.",
+)
+@click.option(
+    "--package-timeout",
+    type=click.FloatRange(min=0),
+    help="Wall-clock seconds allowed for verifying one package.",
+)
+@click.option(
+    "--package-cpu-time",
+    type=click.FloatRange(min=0),
+    help="CPU seconds allowed for verifying one package.",
+)
+@click.option(
+    "--recipe-timeout",
+    type=click.FloatRange(min=0),
+    help="Wall-clock seconds allowed for verifying all variants of one recipe.",
+)
+@click.option(
+    "--recipe-cpu-time",
+    type=click.FloatRange(min=0),
+    help="CPU seconds allowed for verifying all variants of one recipe.",
+)
+@click.option(
+    "--max-tasks-per-worker",
+    type=click.IntRange(min=1),
+    help="Replace each worker process after it has run this many tasks.",
+)
+@click.option(
+    "--max-worker-memory",
+    type=click.IntRange(min=1),
+    metavar="MB",
+    help="Replace a worker process, between tasks, once its resident memory exceeds this.",
+)
+@click.option(
+    "--max-unpacked-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_LIMITS.max_bytes >> 20,
+    show_default=True,
+    metavar="MB",
+    help="Stop reading a package (C1154) once its members add up to more than this.",
+)
+@click.option(
+    "--max-members",
+    type=click.IntRange(min=1),
+    default=DEFAULT_LIMITS.max_members,
+    show_default=True,
+    help="Stop reading a package (C1154) once it has more members than this.",
+)
+@click.option(
+    "--max-compression-ratio",
+    type=click.FloatRange(min=1),
+    default=DEFAULT_LIMITS.max_ratio,
+    show_default=True,
+    help="Stop reading a package (C1154) once it expands to more than this many times "
+    "the size of its archive.",
+)
+@click.option(
+    "--max-path-length",
+    type=click.IntRange(min=1),
+    default=DEFAULT_LIMITS.max_path_length,
+    show_default=True,
+    help="Stop reading a package (C1154) at a member path longer than this.",
+)
+@click.option(
+    "--build-prefix",
+    multiple=True,
+    help="A build prefix that files not listed in info/has_prefix must not contain "
+    "(C1153).  May be repeated; replaces the defaults, which are {}.".format(
+        ", ".join(prefix.decode("utf-8") for prefix in CondaPackageCheck.build_prefixes)
+    ),
+)
 @click.version_option(prog_name="conda-verify", version=__version__)
-def cli(paths, ignore, exit, debug, out_file):
-    """conda-verify is a tool for validating conda packages and recipes.
+def verify(
+    paths,
+    ignore,
+    exit,
+    fail_fast,
+    debug,
+    out_file,
+    channel,
+    clobber,
+    manifest,
+    since,
+    repodata_only,
+    shard,
+    shard_balance,
+    queue,
+    lease,
+    journal,
+    resume,
+    files_from,
+    max_in_flight,
+    jobs,
+    executor,
+    prefetch,
+    package_timeout,
+    package_cpu_time,
+    recipe_timeout,
+    recipe_cpu_time,
+    max_tasks_per_worker,
+    max_worker_memory,
+    max_unpacked_size,
+    max_members,
+    max_compression_ratio,
+    max_path_length,
+    build_prefix,
+):
+    """Verify conda packages and recipes.
 
     To validate a package:\n
     $  conda-verify path/to/package.tar.bz2
@@ -59,47 +872,233 @@ def cli(paths, ignore, exit, debug, out_file):
     """
     if ignore:
         ignore = ignore.split(",")
+    if resume and not journal:
+        raise click.UsageError("--resume requires --journal")
+    if repodata_only and not channel:
+        raise click.UsageError("--repodata-only requires --channel")
+    if (manifest or since) and (not channel or repodata_only):
+        raise click.UsageError("--manifest and --since require --channel")
+    if clobber and not channel:
+        raise click.UsageError("--clobber requires --channel")
+    if queue and (paths or files_from or channel or shard):
+        raise click.UsageError(
+            "--queue cannot be combined with paths, --files-from, --channel or --shard"
+        )
 
-    package_issues = {}
-    futures = []
-    paths_glob = []
     for path in paths:
-        glob_paths = glob(os.path.expanduser(path))
-        if not glob_paths:
+        if next(iglob(os.path.expanduser(path)), None) is None:
             print("Error: path spec %s didn't match any files" % path)
             sys.exit(1)
-        paths_glob.extend(glob_paths)
-    with (DummyExecutor if debug else ProcessPoolExecutor)() as executor:
-        for path in paths_glob:
-            meta_file = os.path.join(path, "meta.yaml")
-            if os.path.isfile(meta_file):
-                futures.extend(_submit_verify_recipe(path, executor, ignore))
-            elif path.endswith((".tar.bz2", ".tar", ".conda")):
-                futures.append(executor.submit(_submit_verify_package, path, ignore))
-        for f in tqdm.tqdm(as_completed(futures), total=len(futures), leave=False):
-            path, issues = f.result()
-            if issues:
-                package_issues[path] = issues
-
-    if out_file:
-        with open(out_file, "w") as f:
-            json.dump(package_issues, f)
-            print("saved to %s" % out_file)
-    else:
-        for path, issues in package_issues.items():
-            print("-" * len(path))
-            print(path)
-            print("-" * len(path))
-            for check in sorted(issues):
-                try:
-                    print(check, file=sys.stderr)
-                except UnicodeEncodeError:
-                    print(
-                        "Could not print message for error code {} due to unicode error".format(
-                            check.code
-                        ),
-                        file=sys.stderr,
+
+    if jobs is None:
+        jobs = cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 4 * jobs
+    if debug:
+        executor = "serial"
+    limits = None
+    if "C1154" not in ensure_list(ignore):
+        limits = Limits(
+            max_unpacked_size << 20, max_members, max_compression_ratio, max_path_length
+        )
+    budgets = {
+        "package": Budget(package_timeout, package_cpu_time),
+        "recipe": Budget(recipe_timeout, recipe_cpu_time),
+    }
+    if executor == "auto" and any(budgets.values()):
+        # budgets are only enforced by killing worker processes
+        executor = "process"
+
+    writer = _ResultWriter(out_file)
+    journal = Journal(journal, resume) if journal else None
+    queue = WorkQueue(queue, lease) if queue else None
+    manifest = Manifest(manifest) if manifest else None
+    since = Snapshot(since) if since else None
+    completed = False
+    try:
+        input_paths = _iter_input_paths(paths, files_from)
+        channel_inputs = {}
+        # the channel issues of packages still being verified
+        channel_issues = {}
+        if channel and not repodata_only:
+            input_paths = itertools.chain(
+                itertools.chain.from_iterable(
+                    _iter_channel_paths(
+                        directory, channel_inputs, manifest, since, writer.write
+                    )
+                    for directory in channel
+                ),
+                input_paths,
+            )
+
+        def drop_channel_input(path):
+            channel_inputs.pop(path, None)
+
+        def replay(path, issues):
+            drop_channel_input(path)
+            if queue is not None:
+                queue.complete(path, issues)
+            writer.write(path, issues)
+
+        def iter_tasks(input_paths):
+            if shard is not None:
+                input_paths = _shard_paths(
+                    input_paths, shard, shard_balance, drop_channel_input
+                )
+            if journal is not None:
+                input_paths = journal.skip_unchanged(input_paths, replay, _timed_out)
+            return _iter_tasks(
+                input_paths,
+                ignore,
+                prefetch,
+                fail_fast,
+                channel_inputs,
+                limits,
+                PIPELINE_BATCH_SIZE if queue is None else 1,
+                build_prefix or None,
+                channel_issues,
+            )
+
+        if queue is None:
+            tasks = iter_tasks(input_paths)
+            if repodata_only:
+                tasks = itertools.chain(_iter_repodata_tasks(channel, ignore), tasks)
+            if executor == "auto":
+                head = list(itertools.islice(tasks, AUTO_PEEK_TASKS))
+                executor = select_executor_kind(
+                    executor,
+                    jobs,
+                    [task.weight for task in head],
+                    len(head) < AUTO_PEEK_TASKS,
+                )
+                tasks = itertools.chain(head, tasks)
+        elif executor == "auto":
+            # claiming tasks to peek at would take them from other runs
+            executor = select_executor_kind(executor, jobs, [], False)
+
+        max_rss = max_worker_memory << 20 if max_worker_memory else None
+        with make_executor(executor, jobs, max_tasks_per_worker, max_rss) as pool:
+            with tqdm.tqdm(total=0, unit="B", unit_scale=True, leave=False) as progress:
+                # the futures of the tasks in flight, to cancel on --fail-fast
+                outstanding = {}
+
+                def run_tasks(tasks):
+                    # inputs claimed from a queue are claimed no sooner than
+                    # they can be started, so that runs joining later find
+                    # work left
+                    lookahead = 0 if queue is not None else None
+                    return _run_tasks(
+                        pool,
+                        tasks,
+                        max_in_flight,
+                        progress,
+                        budgets,
+                        lookahead,
+                        outstanding,
                     )
 
-    if exit and package_issues:
+                if queue is not None:
+                    results = _iter_queue_results(queue, iter_tasks, run_tasks)
+                else:
+                    results = run_tasks(tasks)
+                for path, issues in results:
+                    if path in channel_issues:
+                        issues = sorted((issues or []) + channel_issues.pop(path))
+                    if journal is not None:
+                        journal.record(path, issues)
+                    if queue is not None:
+                        queue.complete(path, issues)
+                    if manifest is not None and not _timed_out(issues):
+                        manifest.record(path, issues)
+                    writer.write(path, issues)
+                    if fail_fast and issues:
+                        _cancel_outstanding(pool, outstanding)
+                        break
+                else:
+                    completed = True
+                if clobber and completed and "C3103" not in ensure_list(ignore):
+                    for subdir, issues in _check_clobbers(
+                        pool, channel, max_in_flight, progress
+                    ):
+                        writer.write(subdir, issues)
+    finally:
+        if manifest is not None:
+            manifest.save(prune=completed)
+        writer.close()
+        if journal is not None:
+            journal.close()
+        if queue is not None:
+            # hand back whatever was claimed but not verified
+            queue.close()
+    if isinstance(pool, WorkerPool):
+        _report_worker_stats(pool.stats())
+
+    if (exit or fail_fast) and writer.failed:
         sys.exit(1)
+
+
+def _load_results(path):
+    """Read the results in a JSON report, a JSONL journal or a work queue.
+
+    Returns a mapping of input paths to their issues.
+    """
+    if os.path.isdir(path):
+        return WorkQueue(path).results()
+    with open(path) as f:
+        try:
+            results = json.load(f)
+        except ValueError:
+            results = None
+    # a report maps paths to lists of issues, unlike a one-line journal
+    if isinstance(results, dict) and all(
+        isinstance(issues, list) for issues in results.values()
+    ):
+        return results
+    return {
+        entry["path"]: entry["issues"] for entry in Journal.load(path).values()
+    }
+
+
+@cli.command()
+@click.argument("results", nargs=-1, type=click.Path(exists=True))
+@click.option("--out-file", nargs=1, type=click.Path())
+@click.option("--exit", is_flag=True, help="Exit with status 1 if any input has issues.")
+def merge(results, out_file, exit):
+    """Combine the results of several runs, such as shards, into one report.
+
+    RESULTS are --out-file reports, --journal files or --queue directories.  Where an input appears
+    in more than one of them, the last one given wins.
+    """
+    merged = {}
+    for path in results:
+        merged.update(_load_results(path))
+    writer = _ResultWriter(out_file)
+    try:
+        for path in sorted(merged):
+            writer.write(path, merged[path])
+    finally:
+        writer.close()
+    if exit and writer.failed:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument("queue", type=click.Path(file_okay=False))
+@click.argument("paths", nargs=-1, type=str)
+@click.option(
+    "--files-from",
+    type=click.File("r"),
+    help="Read further input paths from this file, one per line ('-' for stdin).",
+)
+def enqueue(queue, paths, files_from):
+    """Add inputs to a work queue for runs of verify --queue to share.
+
+    The queue directory is created if needed.  Inputs already in the queue
+    are not added again.
+    """
+    work_queue = WorkQueue(queue)
+    work_queue.create()
+    added = work_queue.enqueue(
+        (path, _input_weight(path)) for path in _iter_input_paths(paths, files_from)
+    )
+    print("queued {} inputs in {}".format(added, queue))
@@ -0,0 +1,194 @@
+"""Find files that more than one package of a channel installs.
+
+Two packages with different names that install the same path clobber each
+other when installed into one environment.  Spotting this needs the file
+lists of every package of a subdir at once, which for a large channel runs
+to millions of paths, so ClobberIndex keeps them on disk: each path is
+spilled to a file as it is added, while two Bloom filters record which
+paths have been seen once and which probably more than once.  Only the
+probable duplicates are then loaded into an sqlite index and grouped,
+which keeps memory bounded whatever the size of the channel.
+"""
+import hashlib
+import io
+import itertools
+import json
+import math
+import os
+import shutil
+import sqlite3
+import struct
+import tarfile
+import tempfile
+
+import conda_package_handling.api
+
+# Number of paths the Bloom filters are sized for, and their false
+# positive rate at that size.  Beyond it, more paths go through sqlite.
+BLOOM_CAPACITY = 1 << 24
+BLOOM_ERROR_RATE = 0.01
+
+
+class BloomFilter(object):
+    """A fixed-size Bloom filter of 16-byte digests."""
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(8, int(bits))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, digest):
+        # double hashing: k positions from the two halves of one digest
+        h1, h2 = struct.unpack("<QQ", digest)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, digest):
+        """Add digest, returning whether it was (probably) present already."""
+        present = True
+        for position in self._positions(digest):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                present = False
+                self.bits[byte] |= bit
+        return present
+
+    def __contains__(self, digest):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+
+def _files_from_info(read):
+    """Pick the installed paths out of info/paths.json or info/files."""
+    paths_json = read("info/paths.json")
+    if paths_json is not None:
+        return [entry["_path"] for entry in json.loads(paths_json.decode("utf-8"))["paths"]]
+    files = read("info/files")
+    if files is not None:
+        return [line for line in files.decode("utf-8").splitlines() if line.strip()]
+    return []
+
+
+def read_package_files(path):
+    """Return the paths a package installs, reading as little of it as possible."""
+    if path.endswith(".conda"):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            conda_package_handling.api.extract(path, tmpdir, components="info")
+
+            def read(member):
+                try:
+                    with open(os.path.join(tmpdir, member), "rb") as f:
+                        return f.read()
+                except IOError:
+                    return None
+
+            return _files_from_info(read)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    found = {}
+    with tarfile.open(path, "r:*") as tar:
+        for info in tar:
+            if info.name in ("info/paths.json", "info/files"):
+                found[info.name] = tar.extractfile(info).read()
+                if info.name == "info/paths.json":
+                    # the most complete listing; no need to read further
+                    break
+    return _files_from_info(found.get)
+
+
+class ClobberIndex(object):
+    """An on-disk index of the files installed by the packages of a channel.
+
+    Packages are added in groups (subdirs); only packages of the same group
+    with different names can clobber each other.
+    """
+
+    def __init__(self, capacity=BLOOM_CAPACITY):
+        self._tmpdir = tempfile.mkdtemp(prefix="conda-verify-clobber-")
+        self._spill = io.open(os.path.join(self._tmpdir, "paths"), "w", encoding="utf-8")
+        self._seen = BloomFilter(capacity)
+        self._repeated = BloomFilter(capacity)
+        self.packages = []
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.md5(key.encode("utf-8")).digest()
+
+    def add(self, group, package, name, files):
+        """Add the files installed by package, whose name is name, to group."""
+        package_id = len(self.packages)
+        self.packages.append((package, name))
+        for filename in files:
+            key = u"{}\0{}".format(group, filename)
+            digest = self._digest(key)
+            if self._seen.add(digest):
+                self._repeated.add(digest)
+            self._spill.write(u"{}\t{}\n".format(package_id, key))
+
+    def _shared_paths(self):
+        """Yield each (group, path) installed by more than one package, with them."""
+        self._spill.close()
+        db = sqlite3.connect(os.path.join(self._tmpdir, "index.db"))
+        try:
+            db.execute("CREATE TABLE entries (key TEXT, package INTEGER)")
+            with io.open(self._spill.name, encoding="utf-8") as spill:
+                rows = (line.rstrip("\n").split("\t", 1) for line in spill)
+                db.executemany(
+                    "INSERT INTO entries VALUES (?, ?)",
+                    (
+                        (key, int(package_id))
+                        for package_id, key in rows
+                        if self._digest(key) in self._repeated
+                    ),
+                )
+            db.execute("CREATE INDEX entries_key ON entries (key)")
+            cursor = db.execute("SELECT key, package FROM entries ORDER BY key, package")
+            for key, entries in itertools.groupby(cursor, lambda row: row[0]):
+                package_ids = sorted(set(package_id for _, package_id in entries))
+                if len(package_ids) > 1:
+                    group, filename = key.split(u"\0", 1)
+                    yield group, filename, package_ids
+        finally:
+            db.close()
+
+    def clobbers(self):
+        """Return the clobbering pairs of package names of each group.
+
+        Versions of one package are never installed together, so clobbers
+        are reported between package names.  The result maps groups to a
+        sorted list of (name, other name, number of shared paths, example)
+        tuples, where example is a shared path and a package of each name
+        that installs it.
+        """
+        pairs = {}
+        for group, filename, package_ids in self._shared_paths():
+            names = {}
+            for package_id in package_ids:
+                package, name = self.packages[package_id]
+                names.setdefault(name, package)
+            for (name_a, package_a), (name_b, package_b) in itertools.combinations(
+                sorted(names.items()), 2
+            ):
+                pair = (group, name_a, name_b)
+                if pair in pairs:
+                    pairs[pair][0] += 1
+                else:
+                    pairs[pair] = [1, (filename, package_a, package_b)]
+        clobbers = {}
+        for (group, name_a, name_b), (count, example) in sorted(pairs.items()):
+            clobbers.setdefault(group, []).append((name_a, name_b, count, example))
+        return clobbers
+
+    def close(self):
+        if not self._spill.closed:
+            self._spill.close()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
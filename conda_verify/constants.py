@@ -102,39 +102,6 @@ except ImportError:
         "extra": {"recipe-maintainers", "final", "parent_recipe"},
     }
 
-MAGIC_HEADERS = {
-    b"\xca\xfe\xba\xbe": "MachO-universal",
-    b"\xce\xfa\xed\xfe": "MachO-i386",
-    b"\xcf\xfa\xed\xfe": "MachO-x86_64",
-    b"\xfe\xed\xfa\xce": "MachO-ppc",
-    b"\xfe\xed\xfa\xcf": "MachO-ppc64",
-    b"MZ\x90\x00": "DLL",
-    b"\x7fELF": "ELF",
-}
-
-DLL_TYPES = {
-    0x0: "UNKNOWN",
-    0x1D3: "AM33",
-    0x8664: "AMD64",
-    0x1C0: "ARM",
-    0xEBC: "EBC",
-    0x14C: "I386",
-    0x200: "IA64",
-    0x9041: "M32R",
-    0x266: "MIPS16",
-    0x366: "MIPSFPU",
-    0x466: "MIPSFPU16",
-    0x1F0: "POWERPC",
-    0x1F1: "POWERPCFP",
-    0x166: "R4000",
-    0x1A2: "SH3",
-    0x1A3: "SH3DSP",
-    0x1A6: "SH4",
-    0x1A8: "SH5",
-    0x1C2: "THUMB",
-    0x169: "WCEMIPSV2",
-}
-
 CONDA_FORGE_COMMENTS = """
 # Note: there are many handy hints in comments in this example -- remove them when you've finalized your recipe
 # Jinja variables help maintain the recipe as you'll update the version only here.
@@ -0,0 +1,439 @@
+"""Executors used by the CLI to run verification tasks.
+
+The CLI can run its tasks in a pool of processes, in a pool of threads, or
+serially in the calling process.  The worker count defaults to the number of
+CPUs the process may actually use, which inside a container can be much lower
+than the number of CPUs on the host.
+
+The process pool is a WorkerPool rather than a ProcessPoolExecutor, because it
+needs to kill and replace a single worker whose task overruns its budget
+without breaking the rest of the pool, and to recycle workers during long
+runs before their memory use grows out of hand.
+"""
+import collections
+import itertools
+import math
+import mmap
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+
+from concurrent.futures import CancelledError, Executor, Future, ThreadPoolExecutor
+
+from conda_verify.utilities import DummyExecutor
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where CPU budgets are not enforced
+    resource = None
+
+EXECUTOR_KINDS = ("auto", "process", "thread", "serial")
+
+# With "auto", runs whose tasks weigh up to this many bytes in total are
+# verified serially, since starting worker processes would cost more than
+# the work itself.  At most AUTO_PEEK_TASKS tasks are inspected to decide.
+AUTO_SERIAL_MAX_WEIGHT = 32 << 20
+AUTO_PEEK_TASKS = 16
+
+# Seconds that terminated workers get to clean up before they are killed
+TERMINATE_GRACE = 1.0
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+def cgroup_cpu_limit():
+    """Return the CPU quota of the current cgroup as a number of CPUs, or None.
+
+    Both the unified (v2) and the legacy (v1) cgroup hierarchies are
+    consulted.  None means there is no quota, or that it cannot be determined.
+    """
+    cpu_max = _read_first_line("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+    else:
+        quota = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        # "max" in v2, or no cgroup files at all
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return float(quota) / period
+
+
+def cpu_count():
+    """Return the number of CPUs this process can use.
+
+    This honours both the CPU affinity mask and any cgroup CPU quota, rounding
+    a fractional quota up, and is always at least 1.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = multiprocessing.cpu_count()
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        count = min(count, int(math.ceil(limit)))
+    return max(count, 1)
+
+
+def select_executor_kind(kind, jobs, weights, exhausted):
+    """Resolve the "auto" executor kind for a run.
+
+    weights are the weights of the tasks seen so far, and exhausted tells
+    whether that is all of them.  Small runs are done serially; anything
+    else goes to a process pool.
+    """
+    if kind != "auto":
+        return kind
+    if jobs == 1 or (exhausted and (len(weights) <= 1 or sum(weights) <= AUTO_SERIAL_MAX_WEIGHT)):
+        return "serial"
+    return "process"
+
+
+def make_executor(kind, jobs, max_tasks=None, max_rss=None):
+    """Create an executor of the given kind with jobs workers.
+
+    max_tasks and max_rss set when process workers are recycled.
+    """
+    if kind == "serial":
+        return DummyExecutor()
+    elif kind == "thread":
+        return ThreadPoolExecutor(max_workers=jobs)
+    elif kind == "process":
+        return WorkerPool(max_workers=jobs, max_tasks=max_tasks, max_rss=max_rss)
+    raise ValueError("Unrecognized executor kind: {}".format(kind))
+
+
+class Budget(collections.namedtuple("Budget", ["wall", "cpu"])):
+    """Wall-clock and CPU time allowed for one task, in seconds (None for no limit)."""
+
+    def __bool__(self):
+        return bool(self.wall or self.cpu)
+
+    __nonzero__ = __bool__
+
+    def __mul__(self, n):
+        return Budget(*(limit * n if limit else limit for limit in self))
+
+
+class TaskTimeout(Exception):
+    """Raised for a task that was stopped because it exceeded its time budget."""
+
+    def __init__(self, kind, seconds):
+        super(TaskTimeout, self).__init__(kind, seconds)
+        self.kind = kind
+        self.seconds = seconds
+
+    def __str__(self):
+        return "exceeded its {} budget of {:g} seconds".format(self.kind, self.seconds)
+
+
+class WorkerDied(Exception):
+    """Raised for a task whose worker process exited while running it."""
+
+
+def _set_cpu_budget(seconds):
+    """Allow the calling process seconds more CPU time, returning the old limit.
+
+    Once the limit is reached the kernel sends SIGXCPU, which terminates the
+    process.
+    """
+    if resource is None or not seconds:
+        return None
+    old_limit = resource.getrlimit(resource.RLIMIT_CPU)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft, hard = int(math.ceil(usage.ru_utime + usage.ru_stime + seconds)), old_limit[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    return old_limit
+
+
+def _peak_rss():
+    """Return the peak resident set size of the calling process in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _current_rss():
+    """Return the resident set size of the calling process in bytes, or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (IOError, OSError, IndexError, ValueError):
+        # without procfs, the peak is a conservative stand-in
+        return _peak_rss()
+
+
+def _exit_on_sigterm(signum, frame):
+    # unwind, so that temporary directories of the current task are removed
+    sys.exit(128 + signum)
+
+
+def _worker_main(conn, max_tasks=None, max_rss=None):
+    # interrupts are handled by the parent, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    for tasks_run, (task_id, fn, args, kwargs, cpu_budget) in enumerate(
+        iter(conn.recv, None), 1
+    ):
+        old_limit = _set_cpu_budget(cpu_budget)
+        try:
+            ok, value = True, fn(*args, **kwargs)
+        except Exception as e:
+            ok, value = False, e
+        if old_limit is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, old_limit)
+        # retire between tasks once the task quota or the memory ceiling is hit
+        rss = _current_rss() if max_rss else None
+        retiring = bool(max_tasks and tasks_run >= max_tasks) or bool(
+            rss is not None and rss > max_rss
+        )
+        try:
+            conn.send((task_id, ok, value, _peak_rss(), retiring))
+        except Exception as e:
+            # the result or exception could not be pickled
+            conn.send((task_id, False, RuntimeError(repr(e)), _peak_rss(), retiring))
+        if retiring:
+            return
+
+
+class _WorkItem(object):
+    def __init__(self, future, budget, fn, args, kwargs):
+        self.future = future
+        self.budget = budget or Budget(None, None)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = None
+
+
+class WorkerStats(
+    collections.namedtuple("WorkerStats", ["slot", "processes", "tasks", "peak_rss"])
+):
+    """Totals for one worker slot of a WorkerPool, across recycled processes.
+
+    peak_rss is the highest resident set size, in bytes, that any of the
+    slot's processes reported, or None where that is not available.
+    """
+
+
+class _Worker(object):
+    def __init__(self, context, slot, max_tasks, max_rss):
+        self.slot = slot
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, max_tasks, max_rss)
+        )
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.item = None
+
+    def kill(self, deadline=None):
+        """Stop the worker, killing it outright if it is still alive at deadline."""
+        if deadline is None:
+            self.process.terminate()
+            deadline = time.time() + TERMINATE_GRACE
+        self.process.join(max(deadline - time.time(), 0))
+        if self.process.is_alive() and hasattr(self.process, "kill"):
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(Executor):
+    """A process pool that enforces a time budget on each task.
+
+    Tasks are submitted with submit_with_budget.  A task that runs past its
+    wall-clock budget has its worker killed, and one that uses up its CPU
+    budget is killed by the kernel.  Either way its future fails with
+    TaskTimeout and the worker is replaced, while the other workers carry on.
+
+    Workers are also replaced, between tasks, after running max_tasks tasks
+    or once their resident memory exceeds max_rss bytes.
+    """
+
+    def __init__(self, max_workers=None, context=None, max_tasks=None, max_rss=None):
+        self._max_workers = max_workers or cpu_count()
+        self._context = context or multiprocessing.get_context()
+        self._max_tasks = max_tasks
+        self._max_rss = max_rss
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._workers = []
+        self._task_ids = itertools.count()
+        self._shutdown = False
+        self._terminating = False
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        self._manager = None
+
+    def submit(self, fn, *args, **kwargs):
+        return self.submit_with_budget(None, fn, *args, **kwargs)
+
+    def submit_with_budget(self, budget, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) to run within budget, a Budget or None."""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self._queue.append(_WorkItem(future, budget, fn, args, kwargs))
+            if self._manager is None:
+                self._manager = threading.Thread(target=self._manage)
+                self._manager.daemon = True
+                self._manager.start()
+        self._wakeup()
+        return future
+
+    def stats(self):
+        """Return WorkerStats for every worker slot that has been used."""
+        return [self._stats[slot] for slot in sorted(self._stats)]
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+        self._wakeup()
+        if wait and self._manager is not None:
+            self._manager.join()
+
+    def terminate(self):
+        """Shut the pool down at once, abandoning outstanding work.
+
+        Queued tasks are cancelled, and running tasks fail with CancelledError
+        as their workers are stopped.
+        """
+        with self._lock:
+            self._shutdown = self._terminating = True
+        self._wakeup()
+        if self._manager is not None:
+            self._manager.join()
+
+    def _wakeup(self):
+        self._wakeup_writer.send(None)
+
+    def _assign(self):
+        """Hand queued work to idle workers, starting workers as needed."""
+        idle = [worker for worker in self._workers if worker.item is None]
+        while self._queue and (idle or len(self._workers) < self._max_workers):
+            item = self._queue.popleft()
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            if idle:
+                worker = idle.pop()
+            else:
+                worker = self._start_worker()
+            if item.budget.wall:
+                item.deadline = time.time() + item.budget.wall
+            try:
+                worker.conn.send(
+                    (next(self._task_ids), item.fn, item.args, item.kwargs, item.budget.cpu)
+                )
+            except Exception as e:
+                # the task could not be pickled; nothing was sent
+                item.future.set_exception(e)
+                idle.append(worker)
+                continue
+            worker.item = item
+
+    def _start_worker(self):
+        used = set(worker.slot for worker in self._workers)
+        slot = min(set(range(self._max_workers)) - used)
+        worker = _Worker(self._context, slot, self._max_tasks, self._max_rss)
+        self._workers.append(worker)
+        stats = self._stats.get(slot, WorkerStats(slot, 0, 0, None))
+        self._stats[slot] = stats._replace(processes=stats.processes + 1)
+        return worker
+
+    def _retire(self, worker, exception=None):
+        """Remove a worker from the pool, failing its current task with exception."""
+        worker.kill()
+        self._workers.remove(worker)
+        if worker.item is not None:
+            worker.item.future.set_exception(exception)
+
+    def _manage(self):
+        while True:
+            with self._lock:
+                if self._terminating:
+                    break
+                self._assign()
+                busy = [worker for worker in self._workers if worker.item is not None]
+                if self._shutdown and not busy and not self._queue:
+                    break
+            deadlines = [w.item.deadline for w in busy if w.item.deadline is not None]
+            timeout = max(min(deadlines) - time.time(), 0) if deadlines else None
+            ready = wait([self._wakeup_reader] + [worker.conn for worker in busy], timeout)
+            while self._wakeup_reader.poll():
+                self._wakeup_reader.recv()
+            for worker in busy:
+                if worker.conn in ready:
+                    self._collect(worker)
+                elif worker.item.deadline is not None and time.time() >= worker.item.deadline:
+                    self._retire(worker, TaskTimeout("wall-clock", worker.item.budget.wall))
+        if self._terminating:
+            self._stop_workers()
+        for worker in self._workers:
+            worker.conn.send(None)
+            worker.process.join()
+
+    def _stop_workers(self):
+        with self._lock:
+            while self._queue:
+                self._queue.popleft().future.cancel()
+        # signal every worker before waiting for any of them
+        for worker in self._workers:
+            worker.process.terminate()
+        deadline = time.time() + TERMINATE_GRACE
+        for worker in list(self._workers):
+            worker.kill(deadline)
+            self._workers.remove(worker)
+            if worker.item is not None:
+                worker.item.future.set_exception(CancelledError())
+
+    def _collect(self, worker):
+        item = worker.item
+        try:
+            _, ok, value, peak_rss, retiring = worker.conn.recv()
+        except EOFError:
+            worker.process.join()
+            exitcode = worker.process.exitcode
+            if hasattr(signal, "SIGXCPU") and exitcode == -signal.SIGXCPU:
+                self._retire(worker, TaskTimeout("CPU", item.budget.cpu))
+            else:
+                self._retire(
+                    worker,
+                    WorkerDied("worker process exited with code {}".format(exitcode)),
+                )
+            return
+        stats = self._stats[worker.slot]
+        self._stats[worker.slot] = stats._replace(
+            tasks=stats.tasks + 1,
+            peak_rss=max(stats.peak_rss, peak_rss) if stats.peak_rss else peak_rss,
+        )
+        worker.item = None
+        if retiring:
+            worker.process.join()
+            worker.conn.close()
+            self._workers.remove(worker)
+        if ok:
+            item.future.set_result(value)
+        else:
+            item.future.set_exception(value)
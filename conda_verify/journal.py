@@ -0,0 +1,116 @@
+"""An append-only journal of verified inputs, used to resume interrupted runs.
+
+Each line of the journal is a JSON object holding an input path, the size and
+modification time the input had when it was verified, and the issues found.
+Lines are flushed as soon as they are written, so a run that is killed loses
+at most the line it was writing.  A torn last line is ignored on reading, and
+ended before a resumed run appends to the journal.
+"""
+import json
+import os
+
+
+def _stat_key(path):
+    """Return the (size, mtime) pair that identifies this version of an input.
+
+    A recipe directory is identified by its meta.yaml.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "meta.yaml")
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def _is_torn(path):
+    """Whether the file at path is not empty and does not end in a newline."""
+    try:
+        f = open(path, "rb")
+    except IOError:
+        return False
+    with f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+class Journal(object):
+    """Record verification results as they arrive, and replay them on resume.
+
+    With resume, the entries already in the journal at path are loaded and
+    new entries are appended after them; otherwise the journal starts empty.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = self.load(path) if resume else {}
+        torn = resume and _is_torn(path)
+        self._file = open(path, "a" if resume else "w")
+        if torn:
+            # so that the first new entry does not continue the torn line
+            self._file.write("\n")
+
+    @staticmethod
+    def load(path):
+        """Map each input path in the journal at path to its last entry."""
+        entries = {}
+        try:
+            f = open(path)
+        except IOError:
+            return entries
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the run was interrupted while writing this line
+                    continue
+                entries[entry["path"]] = entry
+        return entries
+
+    def lookup(self, path):
+        """Return the journalled issues of path if it is unchanged, else None."""
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            size, mtime = _stat_key(path)
+        except OSError:
+            return None
+        if entry["size"] != size or entry["mtime"] != mtime:
+            return None
+        return entry["issues"]
+
+    def skip_unchanged(self, paths, replay, retry=None):
+        """Yield the paths that need verifying.
+
+        Inputs journalled with their current size and mtime are passed to
+        replay(path, issues) instead, unless retry(issues) is true, as for
+        verification that timed out.
+        """
+        for path in paths:
+            issues = self.lookup(path)
+            if issues is None or (retry is not None and retry(issues)):
+                yield path
+            else:
+                replay(path, issues)
+
+    def record(self, path, issues):
+        try:
+            size, mtime = _stat_key(path)
+        except OSError:
+            # nothing to compare against on resume, so verify it again then
+            return
+        entry = {"path": path, "size": size, "mtime": mtime, "issues": issues or []}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,338 @@
+"""Match conda dependency specs against the packages of a channel.
+
+A dependency such as ``numpy >=1.11,<2 py36*`` names a package, a version
+spec and optionally a build string glob.  compile_version_spec turns a
+version spec into a matcher function once, so that checking it against
+many candidate versions only costs the comparisons themselves, and
+ChannelIndex caches the answer for every distinct dependency.
+
+Versions are ordered the way conda orders them, closely enough for
+deciding whether a spec can be satisfied: an optional epoch (``1!``), dot
+or underscore separated components that are split into numbers and
+strings (``1.1a2`` is ``1, 1a2``), and an optional local version after a
+``+``.  Numbers sort above strings, ``dev`` below any other string and
+``post`` above everything, and missing components count as ``0``.
+"""
+import fnmatch
+import operator as op
+import re
+
+from conda_verify.utilities import lru_cache
+
+_component_pat = re.compile(r"\d+|[^\d]+")
+_digit_re = re.compile(r"\d")
+_word_re = re.compile(r"\w")
+_constraint_pat = re.compile(r"^(==|!=|<=|>=|<|>|~=|=)?\s*(\S+)$")
+_dependency_pat = re.compile(r"^([^\s=<>!~|,]+)\s*(.*)$")
+
+_ZERO = (1, 0)
+
+
+def _element(run):
+    if run.isdigit():
+        return (1, int(run))
+    if run == "post":
+        return (2, 0)
+    if run == "dev":
+        return (0, "")
+    return (0, run)
+
+
+def _components(part):
+    components = []
+    for component in part.replace("_", ".").split("."):
+        runs = _component_pat.findall(component)
+        if not runs or not runs[0].isdigit():
+            # a component always starts with a number, so that 1.a < 1.0
+            runs.insert(0, "0")
+        components.append(tuple(_element(run) for run in runs))
+    return components
+
+
+def _padded_key(items, is_zero, sign):
+    """Return a tuple of items that compares as if padded by zeros.
+
+    Zeros are folded into the item that follows them, which is tagged
+    with whether it sorts above (1) or below (-1) zero, and the end is
+    marked by (0,), standing for the zeros that pad the shorter side.
+    Against items with as many zeros before them, an item compares by
+    itself; against items with fewer, the shorter run of zeros decides.
+    """
+    key = []
+    zeros = 0
+    for item in items:
+        if is_zero(item):
+            zeros += 1
+            continue
+        direction = sign(item)
+        key.append((direction, -zeros if direction > 0 else zeros, item))
+        zeros = 0
+    key.append((0,))
+    return tuple(key)
+
+
+_ZERO_KEY = ((0,),)
+
+
+def _sort_key(components):
+    """Turn components into a tuple whose plain comparison is version order."""
+    return _padded_key(
+        [
+            _padded_key(component, lambda run: run == _ZERO, lambda run: 1 if run > _ZERO else -1)
+            for component in components
+        ],
+        lambda key: key == _ZERO_KEY,
+        lambda key: key[0][0],
+    )
+
+
+class VersionOrder(object):
+    """A parsed version that compares the way conda compares versions."""
+
+    __slots__ = ("version", "epoch", "main", "local", "key")
+
+    def __init__(self, version):
+        self.version = version
+        version = version.strip().lower()
+        epoch, _, rest = version.rpartition("!")
+        self.epoch = int(epoch) if epoch.isdigit() else 0
+        main, _, local = rest.partition("+")
+        self.main = _components(main)
+        self.local = _components(local) if local else []
+        self.key = (self.epoch, _sort_key(self.main), _sort_key(self.local))
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return self.key != other.key
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    def __le__(self, other):
+        return self.key <= other.key
+
+    def __gt__(self, other):
+        return self.key > other.key
+
+    def __ge__(self, other):
+        return self.key >= other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def startswith(self, prefix):
+        """Whether the components of prefix begin the components of this version.
+
+        The last run of prefix may also begin a run: 1.1a* matches 1.1alpha.
+        """
+        if self.epoch != prefix.epoch:
+            return False
+        n = len(prefix.main)
+        main = self.main + [(_ZERO,)] * (n - len(self.main))
+        if main[: n - 1] != prefix.main[:-1]:
+            return False
+        last, candidate = prefix.main[-1], main[n - 1]
+        if candidate[: len(last)] == last:
+            return True
+        k = len(last) - 1
+        return (
+            len(candidate) > k
+            and candidate[:k] == last[:k]
+            and last[k][0] == candidate[k][0] == 0
+            and candidate[k][1].startswith(last[k][1])
+        )
+
+
+parse_version = lru_cache(maxsize=None)(VersionOrder)
+
+
+def _constraint(spec, fuzzy):
+    match = _constraint_pat.match(spec)
+    if match is None:
+        raise ValueError("Invalid version constraint: {}".format(spec))
+    operator, version = match.groups()
+    if version in ("*", ""):
+        return lambda candidate: True
+    prefix = version.endswith("*")
+    version = version.rstrip("*").rstrip(".")
+    target = parse_version(version)
+    if operator is None and fuzzy or operator == "=" or prefix and operator in (None, "=="):
+        return lambda candidate: candidate.startswith(target)
+    if operator == "!=" and prefix:
+        return lambda candidate: not candidate.startswith(target)
+    if operator in (None, "=="):
+        return lambda candidate: candidate == target
+    if operator == "!=":
+        return lambda candidate: candidate != target
+    if operator == "~=":
+        # compatible release: ~=1.4.2 means >=1.4.2 and 1.4.*
+        head = parse_version(version.rsplit(".", 1)[0])
+        return lambda candidate: candidate >= target and candidate.startswith(head)
+    compare = {"<": op.lt, "<=": op.le, ">": op.gt, ">=": op.ge}[operator]
+    key = target.key
+    return lambda candidate: compare(candidate.key, key)
+
+
+@lru_cache(maxsize=None)
+def compile_version_spec(spec, fuzzy=True):
+    """Return a function telling whether a VersionOrder matches spec.
+
+    ``|`` separates alternatives and binds looser than ``,``, which
+    separates constraints that must all hold.  With fuzzy, a bare version
+    such as ``1.11`` matches ``1.11.*``, as it does in a dependency without
+    a build string.  Raises ValueError for specs that cannot be parsed.
+    """
+    if "(" in spec or ")" in spec:
+        raise ValueError("Grouped version specs are not supported: {}".format(spec))
+    alternatives = [
+        [_constraint(constraint, fuzzy) for constraint in alternative.split(",")]
+        for alternative in spec.split("|")
+    ]
+    return lambda candidate: any(
+        all(constraint(candidate) for constraint in constraints)
+        for constraints in alternatives
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_build_spec(spec):
+    """Return a function telling whether a build string matches the glob spec."""
+    return re.compile(fnmatch.translate(spec)).match
+
+
+def parse_dependency(dependency):
+    """Split a dependency into its name, version spec and build spec.
+
+    The specs are None where they are not given.
+    """
+    parts = dependency.split()
+    if len(parts) == 1:
+        match = _dependency_pat.match(parts[0])
+        if match is None:
+            raise ValueError("Invalid dependency: {}".format(dependency))
+        name, version = match.groups()
+        return name, version or None, None
+    parts += [None] * (3 - len(parts))
+    return parts[0], parts[1], parts[2]
+
+
+# Character classes of the version spec syntax checked by is_version_spec
+_OPERATOR, _NUMBER, _SEPARATOR, _WORD, _ALTERNATIVE, _OTHER = range(6)
+
+# The states of is_version_spec: at the start, after one or two operator
+# characters, in a number, in the suffix after a number, and after a | or ,
+_START, _OPERATOR1, _OPERATOR2, _IN_NUMBER, _IN_SUFFIX, _AFTER_ALTERNATIVE = range(6)
+
+# _TRANSITIONS[state][character class] is the next state, or None
+_TRANSITIONS = (
+    (_OPERATOR1, _IN_NUMBER, None, None, None, None),
+    (_OPERATOR2, _IN_NUMBER, None, None, None, None),
+    (None, _IN_NUMBER, None, None, None, None),
+    (_OPERATOR1, _IN_NUMBER, _IN_SUFFIX, _IN_SUFFIX, _AFTER_ALTERNATIVE, None),
+    (_OPERATOR1, _IN_NUMBER, None, _IN_SUFFIX, _AFTER_ALTERNATIVE, None),
+    (_OPERATOR1, _IN_NUMBER, None, None, None, None),
+)
+_ACCEPTING = frozenset([_IN_NUMBER, _IN_SUFFIX, _AFTER_ALTERNATIVE])
+
+_character_classes = {}
+
+
+def _character_class(character):
+    if character not in _character_classes:
+        if character in "><=":
+            cls = _OPERATOR
+        elif character == "*" or _digit_re.match(character):
+            cls = _NUMBER
+        elif character in ".!":
+            cls = _SEPARATOR
+        elif character == "+" or _word_re.match(character):
+            cls = _WORD
+        elif character in "|,":
+            cls = _ALTERNATIVE
+        else:
+            cls = _OTHER
+        _character_classes[character] = cls
+    return _character_classes[character]
+
+
+def is_version_spec(spec):
+    """Whether spec is a well-formed version spec.
+
+    This accepts exactly the strings that checks.ver_spec_pat matches in
+    full, but in one pass over spec, whereas that pattern's nested
+    repetitions make the regex engine backtrack exponentially on some
+    malformed specs.  Its language reduces to the automaton above: up to
+    two of ``><=``, a number made of digits and ``*`` optionally split by
+    ``.``, ``!`` or ``_``, then word characters, ``+`` and ``*``, with the
+    next constraint either following a ``|`` or ``,`` or starting straight
+    after with an operator or digit.
+    """
+    state = _START
+    for character in spec:
+        state = _TRANSITIONS[state][_character_class(character)]
+        if state is None:
+            return False
+    return state in _ACCEPTING
+
+
+class ChannelIndex(object):
+    """The packages of a channel, indexed by name, for resolving dependencies."""
+
+    def __init__(self, records=()):
+        self._packages = {}
+        self._parsed = {}
+        self._resolvable = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        """Add a repodata.json record (anything with a name, version and build)."""
+        name = record.get("name")
+        self._packages.setdefault(name, set()).add(
+            (record.get("version"), record.get("build"))
+        )
+        self._parsed.pop(name, None)
+        self._resolvable.clear()
+
+    def _candidates(self, name):
+        """Return the (VersionOrder, build) pairs of the packages called name."""
+        if name not in self._parsed:
+            candidates = []
+            for version, build in self._packages.get(name, ()):
+                try:
+                    candidates.append((parse_version(str(version)), build or ""))
+                except (TypeError, ValueError):
+                    continue
+            self._parsed[name] = candidates
+        return self._parsed[name]
+
+    def resolvable(self, dependency):
+        """Whether any package in the index satisfies dependency.
+
+        Dependencies on virtual packages (``__glibc`` and the like), and
+        those too unusual to parse, count as resolvable.
+        """
+        if dependency not in self._resolvable:
+            self._resolvable[dependency] = self._resolve(dependency)
+        return self._resolvable[dependency]
+
+    def _resolve(self, dependency):
+        try:
+            name, version_spec, build_spec = parse_dependency(dependency)
+            match_version = (
+                compile_version_spec(version_spec, build_spec is None)
+                if version_spec
+                else None
+            )
+        except ValueError:
+            return True
+        if name.startswith("__"):
+            return True
+        match_build = compile_build_spec(build_spec) if build_spec else None
+        return any(
+            (match_build is None or match_build(build))
+            and (match_version is None or match_version(version))
+            for version, build in self._candidates(name)
+        )
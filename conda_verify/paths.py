@@ -0,0 +1,282 @@
+"""A compact in-memory form of info/paths.json.
+
+paths.json has an entry for every file of a package.  Parsed into Python
+dicts, each entry costs several hundred bytes: the dict itself, a 64
+character hex string for its sha256, and separate strings for its path
+type.  For packages with hundreds of thousands of files, multiplied by the
+number of worker processes, that adds up, so PathsTable keeps the entries
+column by column instead: interned path strings, sha256 digests as raw
+bytes in a single buffer, sizes in an array and path types as small codes.
+The few entries with a prefix placeholder, and any fields that do not fit
+the columns, are kept in side dicts keyed by row.
+
+PathsTable.load fills the table straight from the file, decoding one entry
+of the "paths" array at a time, so the parsed tree of the whole file never
+exists at once: memory while loading is the table itself plus one chunk.
+"""
+import binascii
+import codecs
+import json
+import os
+import re
+from array import array
+
+from six import integer_types
+from six.moves import intern
+
+_MISSING_SIZE = -1
+_DIGEST_SIZE = 32
+# The type code of rows whose path_type did not get a code of its own, as
+# array("B") has room for only so many; their path_type is kept in _extra.
+_EXTRA_TYPE = 255
+
+# Bytes of paths.json read at a time by PathsTable.load
+PATHS_JSON_CHUNK = 1 << 16
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+def _intern(path):
+    try:
+        return intern(path)
+    except TypeError:
+        # unicode strings cannot be interned on Python 2
+        return path
+
+
+class _JSONStream(object):
+    """Decode the values of a JSON document from a binary file, in pieces.
+
+    Only the text of the value being decoded, and of the rest of the chunk
+    it was read in, is held in memory.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, fileobj, chunk_size):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = u""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size=0):
+        """Read the next chunk, of at least size bytes; return False once the
+        file is exhausted."""
+        if self._eof:
+            return False
+        chunk = self._fileobj.read(max(size, self._chunk_size))
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos :] + self._utf8.decode(chunk, self._eof)
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Return the next character that is not whitespace, or "" at the end."""
+        while True:
+            self._pos = _whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, characters):
+        """Consume and return the next character, which must be one of characters."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(
+                "Expected one of {!r} at {!r}".format(characters, character or "end of file")
+            )
+        self._pos += 1
+        return character
+
+    def value(self):
+        """Decode and consume the next value.
+
+        While the value is incomplete, each read is as large as the part
+        of it already buffered, so that a value spanning many chunks is
+        decoded a logarithmic rather than linear number of times.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if not self._fill(len(self._buffer) - self._pos):
+                    raise
+                continue
+            # a number at the end of the buffer may go on in the next chunk
+            if end < len(self._buffer) or not self._fill(len(self._buffer) - self._pos):
+                self._pos = end
+                return value
+
+
+class PathsTable(object):
+    """The entries of info/paths.json.
+
+    Rows are numbered from 0 in the order of the file.
+    """
+
+    def __init__(self, entries=(), paths_version=None):
+        self.paths_version = paths_version
+        self.paths = []
+        self._sha256 = bytearray()
+        self._no_sha256 = set()
+        self._sizes = array("q")
+        self._types = array("B")
+        self._type_names = []
+        self._placeholders = {}
+        self._extra = {}
+        self._index = None
+        for entry in entries:
+            self._append(entry)
+
+    @classmethod
+    def from_json(cls, paths_json):
+        """Build a table from the parsed contents of paths.json."""
+        return cls(paths_json.get("paths", ()), paths_json.get("paths_version"))
+
+    @classmethod
+    def load(cls, fileobj, chunk_size=PATHS_JSON_CHUNK):
+        """Build a table from paths.json read from the binary file fileobj.
+
+        Entries are added as they are decoded.  Raises ValueError if the
+        file is not a JSON object, or its "paths" is not a list of objects.
+        """
+        table = cls()
+        stream = _JSONStream(fileobj, chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            stream.expect("}")
+            return table
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "paths":
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        entry = stream.value()
+                        if not isinstance(entry, dict):
+                            raise ValueError("Expected an object in paths, got {!r}".format(entry))
+                        table._append(entry)
+                        if stream.expect(",]") == "]":
+                            break
+            else:
+                value = stream.value()
+                if key == "paths_version":
+                    table.paths_version = value
+            if stream.expect(",}") == "}":
+                return table
+
+    def _append(self, entry):
+        row = len(self.paths)
+        entry = dict(entry)
+        self.paths.append(_intern(entry.pop("_path")))
+        sha256 = entry.pop("sha256", None)
+        try:
+            digest = binascii.unhexlify(sha256)
+        except (TypeError, ValueError, binascii.Error):
+            digest = b""
+        if len(digest) == _DIGEST_SIZE:
+            self._sha256.extend(digest)
+        else:
+            self._sha256.extend(b"\0" * _DIGEST_SIZE)
+            self._no_sha256.add(row)
+            if sha256 is not None:
+                entry["sha256"] = sha256
+        size = entry.pop("size_in_bytes", None)
+        if isinstance(size, integer_types) and not isinstance(size, bool) and size >= 0:
+            self._sizes.append(size)
+        else:
+            self._sizes.append(_MISSING_SIZE)
+            if size is not None:
+                entry["size_in_bytes"] = size
+        path_type = entry.pop("path_type", None)
+        if path_type in self._type_names:
+            self._types.append(self._type_names.index(path_type))
+        elif len(self._type_names) < _EXTRA_TYPE:
+            self._types.append(len(self._type_names))
+            self._type_names.append(path_type)
+        else:
+            self._types.append(_EXTRA_TYPE)
+            entry["path_type"] = path_type
+        if "prefix_placeholder" in entry:
+            self._placeholders[row] = (
+                entry.pop("prefix_placeholder"),
+                entry.pop("file_mode", "text"),
+            )
+        if entry:
+            self._extra[row] = entry
+
+    def __len__(self):
+        return len(self.paths)
+
+    def sorted_rows(self):
+        """Return the rows in the order of their normalized paths."""
+        return sorted(range(len(self)), key=lambda row: os.path.normpath(self.paths[row]))
+
+    def find(self, path):
+        """Return the row of path, or None.
+
+        The index is built on the first lookup.
+        """
+        if self._index is None:
+            self._index = dict((path, row) for row, path in enumerate(self.paths))
+        return self._index.get(path)
+
+    def sha256(self, row):
+        """Return the sha256 of row as a hex string, or None if it has none."""
+        extra = self._extra.get(row)
+        if extra and "sha256" in extra:
+            return extra["sha256"]
+        if row in self._no_sha256:
+            return None
+        digest = bytes(self._sha256[row * _DIGEST_SIZE : (row + 1) * _DIGEST_SIZE])
+        return binascii.hexlify(digest).decode("ascii")
+
+    def size(self, row):
+        """Return the size_in_bytes of row, or None if it has none."""
+        extra = self._extra.get(row)
+        if extra and "size_in_bytes" in extra:
+            return extra["size_in_bytes"]
+        size = self._sizes[row]
+        return None if size == _MISSING_SIZE else size
+
+    def path_type(self, row):
+        """Return the path_type of row, or None if it has none."""
+        code = self._types[row]
+        if code == _EXTRA_TYPE:
+            return self._extra[row]["path_type"]
+        return self._type_names[code]
+
+    def placeholders(self):
+        """Yield (path, placeholder, file_mode) for the rows that have a placeholder."""
+        for row in sorted(self._placeholders):
+            placeholder, file_mode = self._placeholders[row]
+            yield self.paths[row], placeholder, file_mode
+
+    def entry(self, row):
+        """Return row as the dict it was read from paths.json."""
+        entry = {"_path": self.paths[row]}
+        for field, value in (
+            ("sha256", self.sha256(row)),
+            ("size_in_bytes", self.size(row)),
+            ("path_type", self.path_type(row)),
+        ):
+            if value is not None:
+                entry[field] = value
+        if row in self._placeholders:
+            entry["prefix_placeholder"], entry["file_mode"] = self._placeholders[row]
+        entry.update(self._extra.get(row, {}))
+        return entry
+
+    def to_json(self):
+        """Return the table as the parsed contents of paths.json."""
+        paths_json = {"paths": [self.entry(row) for row in range(len(self))]}
+        if self.paths_version is not None:
+            paths_json["paths_version"] = self.paths_version
+        return paths_json
@@ -1,3 +1,4 @@
+import hashlib
 import re
 import sys
 from os import environ, getcwd, listdir, makedirs, rename, rmdir, unlink
@@ -11,10 +12,6 @@ from six import string_types
 from concurrent.futures import Future, Executor
 from threading import Lock
 
-import future.builtins
-
-from conda_verify.constants import MAGIC_HEADERS, DLL_TYPES
-
 try:
     from functools import lru_cache
 except ImportError:
@@ -121,22 +118,52 @@ def iter_cfgs():
             yield dict(platform=platform, arch=arch, python=py, numpy="1.11")
 
 
-def get_object_type(data):
-    head = data[:4]
-    if head not in MAGIC_HEADERS:
-        return None
-    lookup = MAGIC_HEADERS.get(head)
-    if lookup == "DLL":
-        pos = data.find(b"PE\0\0")
-        if pos < 0:
-            return "<no PE header found>"
-        data = future.builtins.bytes(data)
-        i = data[pos + 4] + 256 * data[pos + 5]
-        return "DLL " + DLL_TYPES.get(i)
-    elif lookup.startswith("MachO"):
-        return lookup
-    elif lookup == "ELF":
-        return "ELF" + {"\x01": "32", "\x02": "64"}.get(data[4])
+def checksums(data, algorithms=("sha256",), buffersize=65536):
+    """Return a dict of the hex digests of a file object or of a bytes-like object.
+
+    All the digests are computed in a single pass over the data, and buffers
+    such as memoryview slices are hashed in place without copying.
+    """
+    hashes = {}
+    for algorithm in algorithms:
+        hash_impl = getattr(hashlib, algorithm, None)
+        if not hash_impl:
+            raise ValueError("Unrecognized hash algorithm: {}".format(algorithm))
+        hashes[algorithm] = hash_impl()
+    if hasattr(data, "read"):
+        for block in iter(lambda: data.read(buffersize), b""):
+            for hash_impl in hashes.values():
+                hash_impl.update(block)
+    else:
+        for hash_impl in hashes.values():
+            hash_impl.update(data)
+    return dict((algorithm, h.hexdigest()) for algorithm, h in hashes.items())
+
+
+def checksum(data, algorithm="sha256", buffersize=65536):
+    """Return the hex digest of a file object or of a bytes-like object."""
+    return checksums(data, (algorithm,), buffersize)[algorithm]
+
+
+def find_first(data, patterns, start=0, end=None):
+    """Return (offset, pattern) for the first of patterns to occur in data, or None.
+
+    data is anything with a find(sub, start, end) method, such as bytes or
+    an mmap, which searches it in place.  Each pattern is a separate
+    bytes.find, which runs at memory speed and so beats one pass of a regex
+    alternation or an Aho-Corasick automaton written in Python, for the
+    handful of patterns this is used with.  Once a pattern has been found,
+    the others are only looked for before it.
+    """
+    end = len(data) if end is None else end
+    first = None
+    for pattern in patterns:
+        # a later pattern only counts if it starts before the first match
+        stop = end if first is None else min(end, first[0] + len(pattern) - 1)
+        offset = data.find(pattern, start, stop)
+        if offset != -1:
+            first = (offset, pattern)
+    return first
 
 
 def get_bad_seq(s):
@@ -146,15 +173,36 @@ def get_bad_seq(s):
     return None
 
 
+# The bytes that count as ascii text: printable characters and LF, and CR
+# for files from Windows packages
+ASCII_TEXT = bytes(bytearray([10] + list(range(32, 127))))
+ASCII_TEXT_CR = ASCII_TEXT + b"\r"
+
+# Data is scanned in chunks of this many bytes, so that an offending byte
+# near the start of a large file is found without scanning the rest
+ASCII_SCAN_CHUNK = 1 << 20
+
+
+def first_non_ascii(data, allow_CR=False):
+    """Return the offset of the first byte of data that is not ascii text, or -1.
+
+    Text strings are scanned as UTF-8.  Each chunk has its ascii bytes
+    deleted by bytes.translate, in C, so only a chunk that has offending
+    bytes is looked at further.
+    """
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    allowed = ASCII_TEXT_CR if allow_CR else ASCII_TEXT
+    for start in range(0, len(data), ASCII_SCAN_CHUNK):
+        chunk = data[start : start + ASCII_SCAN_CHUNK]
+        offending = chunk.translate(None, allowed)
+        if offending:
+            return start + chunk.find(offending[:1])
+    return -1
+
+
 def all_ascii(data, allow_CR=False):
-    newline = [10]  # LF
-    if allow_CR:
-        newline.append(13)  # CR
-    for c in data:
-        n = ord(c) if sys.version_info[0] == 2 else c
-        if not (n in newline or 32 <= n < 127):
-            return False
-    return True
+    return first_non_ascii(data, allow_CR) == -1
 
 
 def ensure_list(argument):
@@ -194,7 +242,7 @@ class DummyExecutor(Executor):
 
             return f
 
-    def shutdown(self, wait=True):
+    def shutdown(self, wait=True, cancel_futures=False):
         with self._shutdownLock:
             self._shutdown = True
 
@@ -1,23 +1,107 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
+import threading
+
+from six.moves import queue
+
+from conda_verify.archive import DEFAULT_LIMITS, LimitExceeded
 from conda_verify.checks import CondaPackageCheck, CondaRecipeCheck
 from conda_verify.errors import PackageError, RecipeError
 from conda_verify.utilities import ensure_list
 from logging import getLogger
 
 
+def prefetch_package_checks(
+    paths, depth=1, records=None, limits=DEFAULT_LIMITS, build_prefixes=None
+):
+    """Yield a (path, CondaPackageCheck) pair for each package in paths.
+
+    Up to depth packages beyond the one most recently yielded are loaded
+    (extracted) on a background thread, so that extracting the next package
+    overlaps with running the checks of the current one while disk usage
+    stays capped.  If loading a package fails, the exception is yielded in
+    place of its CondaPackageCheck.  Each yielded CondaPackageCheck is closed
+    when the next pair is requested.  records optionally maps paths to the
+    repodata.json entries to check the packages against, packages are read
+    in within limits, and build_prefixes replaces the prefixes C1153 looks
+    for.
+    """
+    records = records or {}
+    slots = threading.Semaphore(depth + 1)
+    loaded = queue.Queue()
+    stop = threading.Event()
+
+    def load():
+        for path in paths:
+            slots.acquire()
+            if stop.is_set():
+                break
+            try:
+                package_check = CondaPackageCheck(
+                    path, records.get(path), limits, build_prefixes
+                )
+            except Exception as e:
+                package_check = e
+            loaded.put((path, package_check))
+        loaded.put(None)
+
+    def close(package_check):
+        if isinstance(package_check, CondaPackageCheck):
+            package_check.close()
+
+    loader = threading.Thread(target=load)
+    loader.daemon = True
+    loader.start()
+    try:
+        for path, package_check in iter(loaded.get, None):
+            try:
+                yield path, package_check
+            finally:
+                close(package_check)
+                slots.release()
+    finally:
+        stop.set()
+        slots.release()
+        loader.join()
+        # close anything that was loaded ahead but never handed out
+        while not loaded.empty():
+            item = loaded.get_nowait()
+            if item is not None:
+                close(item[1])
+
+
 class Verify(object):
     """Verify class is called by the CLI but may be used as an API as well."""
 
     @staticmethod
     def verify_package(
-        path_to_package=None, checks_to_ignore=None, exit_on_error=False, **kw
+        path_to_package=None,
+        checks_to_ignore=None,
+        exit_on_error=False,
+        repodata_record=None,
+        limits=DEFAULT_LIMITS,
+        build_prefixes=None,
+        **kw
     ):
         """Run all package checks in order to verify a conda package.
         checks_to_ignore should be a list, tuple, or set of codes, such as ['C1102', 'C1104'].
-        Codes are listed in readme.md.  Package codes follow 1xxx, recipe codes follow 2xxx."""
-        package_check = CondaPackageCheck(path_to_package)
+        Codes are listed in readme.md.  Package codes follow 1xxx, recipe codes follow 2xxx.
+        repodata_record is the package's entry in its channel's repodata.json, to check
+        the archive's size and checksums against.  limits, an archive.Limits, bounds
+        what the package may expand to; going over them is reported as C1154, and
+        ignoring C1154 lifts them.  build_prefixes, if given, replaces the build
+        prefixes that C1153 looks for."""
+        if "C1154" in ensure_list(checks_to_ignore):
+            limits = None
+        try:
+            package_check = CondaPackageCheck(
+                path_to_package, repodata_record, limits, build_prefixes
+            )
+        except LimitExceeded as e:
+            if exit_on_error:
+                raise PackageError(e.error)
+            return path_to_package, [str(e)]
 
         if ("ignore_scripts" in kw and kw["ignore_scripts"]) or (
             "run_scripts" in kw and kw["run_scripts"]
@@ -28,6 +112,15 @@ class Verify(object):
                 "list of codes, documented at https://github.com/conda/conda-verify#checks"
             )
 
+        with package_check:
+            return Verify.run_package_checks(
+                package_check, checks_to_ignore, exit_on_error
+            )
+
+    @staticmethod
+    def run_package_checks(package_check, checks_to_ignore=None, exit_on_error=False):
+        """Run all package checks on an already loaded CondaPackageCheck."""
+        path_to_package = package_check.path
         # collect all CondaPackageCheck methods that start with the word 'check'
         # this should later be a decorator that is placed on each check
         checks_to_display = []
@@ -36,13 +129,16 @@ class Verify(object):
                 # runs the check
                 #  TODO: should have a way to skip checks if a check's codes are all ignored
                 check = getattr(package_check, method)()
-                if check is not None and check.code not in ensure_list(
-                    checks_to_ignore
-                ):
-                    checks_to_display.append(check)
+                # a check returns an Error, None, or a list of every Error found
+                for error in check if isinstance(check, list) else [check]:
+                    if error is not None and error.code not in ensure_list(
+                        checks_to_ignore
+                    ):
+                        if exit_on_error:
+                            # no need to run the remaining checks
+                            raise PackageError(error)
+                        checks_to_display.append(error)
 
-        if checks_to_display and exit_on_error:
-            raise PackageError(check)
         return (
             path_to_package,
             sorted(["[{}] {}".format(*c[1:]) for c in checks_to_display]),
@@ -74,10 +170,10 @@ class Verify(object):
         for method in (_ for _ in dir(recipe_check) if _.startswith("check_")):
             check = getattr(recipe_check, method)()
             if check and check.code not in ensure_list(checks_to_ignore):
+                if exit_on_error:
+                    raise RecipeError(check)
                 checks_to_display.append(check)
 
-        if checks_to_display and exit_on_error:
-            raise RecipeError(checks_to_display[0])
         return (
             recipe_dir,
             sorted(["[{}] {}".format(*c[1:]) for c in checks_to_display]),
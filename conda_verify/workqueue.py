@@ -0,0 +1,245 @@
+"""A work queue of inputs kept in a directory on shared storage.
+
+Several conda-verify processes, on one machine or many sharing a filesystem,
+can take inputs from the same queue, and can join or leave at any time.  The
+queue is a directory of small files, and every state change is a single
+atomic rename, so no locks or coordinator are needed:
+
+``pending/<item>``
+    an input waiting to be verified.  Items are named so that a directory
+    listing sorts the heaviest inputs first.
+``leased/<item>~<owner>``
+    an input claimed by a worker.  The worker renews the lease by touching
+    the file while it works; a lease that has not been renewed for longer
+    than the lease time is moved back to pending by whichever worker notices
+    first, so the work of a worker that died is picked up by the others.
+``done/<item>``
+    the results for an input.
+
+A worker whose lease expired while it was still working only notices when it
+renews the lease.  Both it and the worker that picked the input up again then
+write the same results, which is wasteful but harmless.
+"""
+import errno
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+# Inputs are ordered by weight through the item names, which sort the
+# heaviest first as long as weights stay below this.
+MAX_WEIGHT = 10 ** 20 - 1
+
+DEFAULT_LEASE = 60.0
+
+
+def _ignore_missing(fn, *args):
+    """Call fn, returning False instead of raising if a file has vanished."""
+    try:
+        fn(*args)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return False
+    return True
+
+
+def _write_atomically(path, data):
+    tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.rename(tmp, path)
+
+
+def _items(directory):
+    return [name for name in os.listdir(directory) if not name.endswith(".tmp")]
+
+
+class WorkQueue(object):
+    """A queue of input paths in directory, shared by any number of workers.
+
+    lease is the number of seconds after which an unrenewed claim expires.
+    It has to comfortably exceed the clock skew between the machines using
+    the queue.
+    """
+
+    def __init__(self, directory, lease=DEFAULT_LEASE, poll_interval=None):
+        self.directory = directory
+        self.lease = lease
+        self.poll_interval = lease / 4.0 if poll_interval is None else poll_interval
+        self.owner = "{}-{}-{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._pending = os.path.join(directory, "pending")
+        self._leased = os.path.join(directory, "leased")
+        self._done = os.path.join(directory, "done")
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def create(self):
+        for directory in (self._pending, self._leased, self._done):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    @staticmethod
+    def _digest(name):
+        return name.split("~", 1)[0].rsplit("-", 1)[-1]
+
+    def enqueue(self, inputs):
+        """Add (path, weight) pairs to the queue.
+
+        Paths that are already queued, claimed or done are skipped.  Returns
+        the number of paths added.
+        """
+        known = set(
+            self._digest(name)
+            for directory in (self._pending, self._leased, self._done)
+            for name in _items(directory)
+        )
+        added = 0
+        for path, weight in inputs:
+            digest = hashlib.md5(os.path.normpath(path).encode("utf-8")).hexdigest()
+            if digest in known:
+                continue
+            known.add(digest)
+            name = "{:020d}-{}".format(MAX_WEIGHT - min(weight, MAX_WEIGHT), digest)
+            _write_atomically(os.path.join(self._pending, name), {"path": path})
+            added += 1
+        return added
+
+    def _claim(self, name):
+        pending = os.path.join(self._pending, name)
+        lease = os.path.join(self._leased, "{}~{}".format(name, self.owner))
+        # the lease starts now, not when the item was queued
+        if not _ignore_missing(os.utime, pending, None) or not _ignore_missing(
+            os.rename, pending, lease
+        ):
+            # another worker got there first
+            return None
+        with open(lease) as f:
+            path = json.load(f)["path"]
+        if os.path.exists(os.path.join(self._done, name)):
+            # finished by a worker whose lease had expired
+            os.remove(lease)
+            return None
+        with self._lock:
+            self._held[path] = lease
+        return path
+
+    def _others_leases(self):
+        return [
+            lease for lease in _items(self._leased) if not lease.endswith("~" + self.owner)
+        ]
+
+    def requeue_expired(self):
+        """Move the leases of other workers that have expired back to pending."""
+        now = time.time()
+        for lease in self._others_leases():
+            path = os.path.join(self._leased, lease)
+            try:
+                expired = os.stat(path).st_mtime < now - self.lease
+            except OSError:
+                continue
+            if expired:
+                name = lease.rsplit("~", 1)[0]
+                _ignore_missing(os.rename, path, os.path.join(self._pending, name))
+
+    def _has_pending(self):
+        self.requeue_expired()
+        return bool(_items(self._pending))
+
+    def wait_for_work(self):
+        """Wait until inputs are pending, or until no other worker holds any.
+
+        Returns whether there are inputs to claim.  Inputs other workers hold
+        come back if their leases expire, so they are waited for.
+        """
+        while not self._has_pending():
+            if not self._others_leases():
+                # a lease may have been requeued since the check above
+                return self._has_pending()
+            time.sleep(self.poll_interval)
+        return True
+
+    def claim_iter(self, wait=True):
+        """Claim and yield input paths until the queue is drained.
+
+        The claims are renewed in the background until they are completed or
+        released.  Once nothing is pending, this waits for the inputs other
+        workers hold, in case their leases expire and the inputs come back.
+        Without wait, it returns instead: a caller holding claims it has not
+        completed must not wait, or two workers can wait on each other's
+        claims forever.  It completes its claims, and then claims again if
+        wait_for_work returns True.
+        """
+        self._start_heartbeat()
+        while True:
+            names = sorted(_items(self._pending))
+            for name in names:
+                path = self._claim(name)
+                if path is not None:
+                    yield path
+            if names or self._has_pending():
+                continue
+            if not wait or not self.wait_for_work():
+                return
+
+    def complete(self, path, issues):
+        """Record the results for a claimed path and give up its lease."""
+        with self._lock:
+            lease = self._held.pop(path, None)
+        if lease is None:
+            return
+        # write the results even if the lease expired meanwhile
+        name = os.path.basename(lease).rsplit("~", 1)[0]
+        _write_atomically(
+            os.path.join(self._done, name), {"path": path, "issues": issues or []}
+        )
+        _ignore_missing(os.remove, lease)
+
+    def release(self):
+        """Return every input claimed but not completed to pending."""
+        self._stop.set()
+        with self._lock:
+            held, self._held = self._held, {}
+        for lease in held.values():
+            name = os.path.basename(lease).rsplit("~", 1)[0]
+            _ignore_missing(os.rename, lease, os.path.join(self._pending, name))
+
+    def results(self):
+        """Map each input path that has been verified to its issues."""
+        results = {}
+        for name in _items(self._done):
+            with open(os.path.join(self._done, name)) as f:
+                entry = json.load(f)
+            results[entry["path"]] = entry["issues"]
+        return results
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._renew_leases)
+            self._heartbeat.daemon = True
+            self._heartbeat.start()
+
+    def _renew_leases(self):
+        while not self._stop.wait(self.lease / 3.0):
+            with self._lock:
+                held = list(self._held.items())
+            for path, lease in held:
+                # if the lease expired and the input was requeued, whoever
+                # claims it next verifies it again
+                _ignore_missing(os.utime, lease, None)
+
+    def close(self):
+        self.release()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from conda_verify.channel import lint_records, lint_subdir
+from conda_verify.checks import CondaPackageCheck
+from conda_verify.verify import Verify
+
+
+@pytest.fixture
+def package_dir():
+    return os.path.join(os.path.dirname(__file__), 'test_packages')
+
+
+@pytest.mark.parametrize('filename', [
+    'testfile-0.0.1-py36_0.tar.bz2',
+    'testfile-0.0.10-py36_0.tar.bz2',
+    'testfile-0.0.3-py36_0.tar.bz2',
+    'testfile-0.0.30-py27_0.tar.bz2',
+    'testfile-0.0.41-py36_0.tar.bz2',
+    'testfile-0.0.48-py27_0.tar.bz2',
+    'testfile-0.0.49-py27_0.tar.bz2',
+    'testfile-0.0.50-py36_0.tar.bz2',
+    'testfile-0.0.51-py36_0.tar.bz2',
+    'testfile-0.0.52-py36_0.tar.bz2',
+    'testfile-0.0.53-py36_0.tar.bz2',
+    'testfile-0.0.54-py36_0.tar.bz2',
+    'testfile-0.0.56-py36_0.tar.bz2',
+])
+def test_repodata_lint_matches_package_checks(package_dir, filename):
+    package = os.path.join(package_dir, filename)
+    with CondaPackageCheck(package) as package_check:
+        record = package_check.info
+    _, issues = Verify.verify_package(path_to_package=package)
+
+    [(path, lint_issues)] = lint_records(package_dir, {filename: record})
+
+    assert path == package
+    assert lint_issues == [issue for issue in issues if 'C1101' <= issue[1:6] <= 'C1115']
+
+
+def test_lint_subdir(tmpdir):
+    subdir = tmpdir.mkdir('linux-64')
+    subdir.join('good-1.0-0.tar.bz2').write('')
+    subdir.join('stray-1.0-0.tar.bz2').write('')
+    good = {'name': 'good', 'version': '1.0', 'build': '0', 'build_number': 0,
+            'depends': ['python >=3.6'], 'license_family': 'BSD'}
+    bad = dict(good, name='bad', license_family='FAKELICENSE', depends=['python 3.6@!'])
+    subdir.join('repodata.json').write(json.dumps({
+        'packages': {'good-1.0-0.tar.bz2': good},
+        'packages.conda': {'bad-1.0-0.conda': bad},
+    }))
+
+    results = lint_subdir(str(subdir), checks_to_ignore=['C1115', 'C3104'])
+
+    assert results == [
+        (str(subdir.join('bad-1.0-0.conda')), [
+            '[C1114] Found invalid dependency "python 3.6@!" in info/index.json',
+            '[C3102] Found package listed in repodata.json missing on disk',
+        ]),
+        (str(subdir.join('stray-1.0-0.tar.bz2')), [
+            '[C3101] Found package not listed in repodata.json',
+        ]),
+    ]
+
+
+def test_lint_subdir_unresolvable_dependencies(tmpdir):
+    def write_subdir(name, records):
+        subdir = tmpdir.mkdir(name)
+        for fn in records:
+            subdir.join(fn).write('')
+        subdir.join('repodata.json').write(json.dumps({'packages': records}))
+        return str(subdir)
+
+    def record(name, version, build='0', depends=()):
+        return {'name': name, 'version': version, 'build': build, 'build_number': 0,
+                'depends': list(depends), 'license_family': 'BSD'}
+
+    linux = write_subdir('linux-64', {
+        'python-3.6.5-0.tar.bz2': record('python', '3.6.5'),
+        'numpy-1.11.3-py36_0.tar.bz2': record('numpy', '1.11.3', 'py36_0', [
+            'python >=3.6,<3.7.0a0', 'six', '__glibc >=2.17', 'libfoo 2.*',
+        ]),
+    })
+    noarch = write_subdir('noarch', {
+        'six-1.12.0-0.tar.bz2': record('six', '1.12.0', depends=['python']),
+        'tool-1.0-0.tar.bz2': record('tool', '1.0', depends=[
+            'numpy 1.11.* py36*', 'numpy >=2', 'python 2.7*|>=3.6',
+        ]),
+    })
+
+    assert lint_subdir(linux, checks_to_ignore=['C1115']) == [
+        (os.path.join(linux, 'numpy-1.11.3-py36_0.tar.bz2'), [
+            '[C3104] Found dependency "libfoo 2.*" that no package in the channel satisfies',
+        ]),
+    ]
+    assert lint_subdir(noarch, checks_to_ignore=['C1115']) == [
+        (os.path.join(noarch, 'tool-1.0-0.tar.bz2'), [
+            '[C3104] Found dependency "numpy >=2" that no package in the channel satisfies',
+        ]),
+    ]
+    assert lint_subdir(linux, checks_to_ignore=['C1115', 'C3104']) == []
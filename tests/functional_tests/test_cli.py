@@ -1,9 +1,21 @@
+import hashlib
+import json
 import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
 
 from click.testing import CliRunner
+from concurrent.futures import ThreadPoolExecutor
 import pytest
+import tqdm
 
-from conda_verify.cli import cli
+from conda_verify import cli as cli_module
+from conda_verify.cli import cli, verify
+from conda_verify.executors import DummyExecutor
+from conda_verify.workqueue import WorkQueue
 from conda_verify import __version__
 
 
@@ -17,12 +29,45 @@ def recipe_dir():
     return os.path.join(os.path.dirname(__file__), 'test_recipes')
 
 
+@pytest.fixture
+def record_submissions(monkeypatch):
+    """Stand in for package verification, recording the paths submitted.
+
+    Calling the fixture installs a stand-in that returns issues for every
+    package, and returns the list of paths submitted to it.
+    """
+    def install(issues=None):
+        submitted = []
+
+        def record(path, ignore, *args):
+            submitted.append(path)
+            return path, issues
+
+        monkeypatch.setattr('conda_verify.cli._submit_verify_package', record)
+        return submitted
+    return install
+
+
 def test_package_cli(package_dir):
     package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
     runner = CliRunner()
     result = runner.invoke(cli, [package])
     assert not result.exception
-    assert '0/1' in result.output
+    # progress is reported in bytes of package data rather than in tasks
+    assert '0.00/{}'.format(tqdm.tqdm.format_sizeof(os.path.getsize(package))) in result.output
+
+
+def test_package_cli_largest_first(package_dir, record_submissions):
+    packages = [os.path.join(package_dir, name) for name in (
+        'testfile-0.0.30-py27_0.tar.bz2',
+        'python-0.0.1-py36_0.tar.bz2',
+        'testfile-0.0.34-py27_0.tar.bz2',
+    )]
+    submitted = record_submissions()
+    runner = CliRunner()
+    result = runner.invoke(cli, packages + ['--debug'])
+    assert not result.exception
+    assert submitted == sorted(packages, key=os.path.getsize, reverse=True)
 
 
 def test_recipe_cli(recipe_dir):
@@ -36,3 +81,520 @@ def test_cli_version():
     runner = CliRunner()
     result = runner.invoke(cli, ['--version'])
     assert 'conda-verify, version {}' .format(__version__) in result.output
+
+
+def test_package_cli_files_from_and_out_file(package_dir, tmpdir):
+    packages = [os.path.join(package_dir, name) for name in (
+        'testfile-0.0.30-py27_0.tar.bz2',
+        'testfile-0.0.43-py36_0.tar.bz2',
+        'testfile-0.0.44-py36_0.tar.bz2',
+    )]
+    file_list = tmpdir.join('inputs.txt')
+    file_list.write('\n'.join(packages) + '\n')
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--files-from', str(file_list), '--max-in-flight', '1',
+                                 '--out-file', str(out_file)])
+    assert not result.exception
+    issues = json.loads(out_file.read())
+    assert sorted(issues) == packages[1:]
+
+
+def test_package_cli_walks_directories(package_dir, tmpdir, record_submissions):
+    tmpdir.mkdir('linux-64').join('a-1-0.tar.bz2').write('')
+    tmpdir.mkdir('noarch').join('b-1-0.conda').write('')
+    tmpdir.join('noarch', 'repodata.json').write('{}')
+    submitted = record_submissions()
+    runner = CliRunner()
+    result = runner.invoke(cli, [str(tmpdir), '--debug'])
+    assert not result.exception
+    assert sorted(submitted) == [str(tmpdir.join('linux-64', 'a-1-0.tar.bz2')),
+                                 str(tmpdir.join('noarch', 'b-1-0.conda'))]
+
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_package_cli_executor(package_dir, tmpdir, executor):
+    package = os.path.join(package_dir, 'testfile-0.0.43-py36_0.tar.bz2')
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, [package, '--executor', executor, '--jobs', '2',
+                                 '--out-file', str(out_file)])
+    assert not result.exception
+    assert list(json.loads(out_file.read())) == [package]
+
+
+def test_package_cli_prefetch(package_dir, tmpdir):
+    packages = [os.path.join(package_dir, 'testfile-0.0.{}-py36_0.tar.bz2'.format(i))
+                for i in (40, 41, 42, 43, 44)]
+    plain_out, prefetch_out = tmpdir.join('plain.json'), tmpdir.join('prefetch.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, packages + ['--debug', '--out-file', str(plain_out)])
+    assert not result.exception
+    result = runner.invoke(cli, packages + ['--debug', '--prefetch', '2',
+                                            '--out-file', str(prefetch_out)])
+    assert not result.exception
+    assert json.loads(prefetch_out.read()) == json.loads(plain_out.read())
+
+
+def hang_on_testfile_30(path, ignore, *args):
+    if 'testfile-0.0.30' in path:
+        time.sleep(60)
+    return path, ['[C1146] stand-in issue']
+
+
+def test_package_cli_timeout(package_dir, tmpdir, monkeypatch, record_submissions):
+    packages = [os.path.join(package_dir, name) for name in (
+        'testfile-0.0.30-py27_0.tar.bz2',
+        'testfile-0.0.43-py36_0.tar.bz2',
+    )]
+    monkeypatch.setattr('conda_verify.cli._submit_verify_package', hang_on_testfile_30)
+    out_file, journal = tmpdir.join('out.json'), tmpdir.join('journal.jsonl')
+    runner = CliRunner()
+    result = runner.invoke(cli, packages + ['--executor', 'process', '--package-timeout', '0.5',
+                                            '--out-file', str(out_file),
+                                            '--journal', str(journal)])
+    assert not result.exception
+    assert json.loads(out_file.read()) == {
+        packages[0]: ['[C1149] Verification exceeded its wall-clock budget of 0.5 seconds'],
+        packages[1]: ['[C1146] stand-in issue'],
+    }
+    # inputs that timed out are verified again on resume
+    submitted = record_submissions()
+    result = runner.invoke(cli, packages + ['--debug', '--journal', str(journal), '--resume'])
+    assert not result.exception
+    assert submitted == packages[:1]
+
+
+def die_on_testfile_30(path, ignore, *args):
+    if 'testfile-0.0.30' in path:
+        os._exit(9)
+    return path, ['[C1146] stand-in issue']
+
+
+def test_package_cli_worker_dies(package_dir, tmpdir, monkeypatch):
+    packages = [os.path.join(package_dir, name) for name in (
+        'testfile-0.0.30-py27_0.tar.bz2',
+        'testfile-0.0.43-py36_0.tar.bz2',
+    )]
+    monkeypatch.setattr('conda_verify.cli._submit_verify_package', die_on_testfile_30)
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, packages + ['--executor', 'process', '--jobs', '1',
+                                            '--out-file', str(out_file)])
+    assert not result.exception
+    assert json.loads(out_file.read()) == {
+        packages[0]: ['Verification did not finish: worker process exited with code 9'],
+        packages[1]: ['[C1146] stand-in issue'],
+    }
+
+
+def test_package_cli_reports_worker_memory(package_dir):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    runner = CliRunner()
+    result = runner.invoke(cli, [package, '--executor', 'process', '--max-tasks-per-worker', '1',
+                                 '--max-worker-memory', '4096'])
+    assert not result.exception
+    assert 'peak memory' in result.output
+
+
+@pytest.mark.parametrize('executor', ['serial', 'process'])
+def test_package_cli_fail_fast(package_dir, tmpdir, executor):
+    packages = [os.path.join(package_dir, 'testfile-0.0.{}-py36_0.tar.bz2'.format(i))
+                for i in (40, 41, 42, 43, 44)]
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, packages + ['--fail-fast', '--executor', executor,
+                                            '--max-in-flight', '1', '--out-file', str(out_file)])
+    assert result.exit_code == 1
+    [(package, issues)] = json.loads(out_file.read()).items()
+    assert package in packages
+    assert len(issues) == 1
+
+
+def test_package_cli_resume(package_dir, tmpdir, record_submissions):
+    packages = [os.path.join(package_dir, 'testfile-0.0.{}-py36_0.tar.bz2'.format(i))
+                for i in (40, 41, 42)]
+    journal, first_out, resumed_out = (tmpdir.join(name) for name in
+                                       ('journal.jsonl', 'first.json', 'resumed.json'))
+    runner = CliRunner()
+    result = runner.invoke(cli, packages[:2] + ['--debug', '--journal', str(journal),
+                                                '--out-file', str(first_out)])
+    assert not result.exception
+    submitted = record_submissions(['[C1146] stand-in issue'])
+    result = runner.invoke(cli, packages + ['--debug', '--journal', str(journal), '--resume',
+                                            '--out-file', str(resumed_out)])
+    assert not result.exception
+    assert submitted == packages[2:]
+    expected = json.loads(first_out.read())
+    expected[packages[2]] = ['[C1146] stand-in issue']
+    assert json.loads(resumed_out.read()) == expected
+
+
+def test_cli_resume_requires_journal(package_dir):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    runner = CliRunner()
+    result = runner.invoke(cli, [package, '--resume'])
+    assert result.exit_code == 2
+
+
+@pytest.mark.parametrize('balance', ['hash', 'size'])
+def test_package_cli_shards_partition_inputs(package_dir, record_submissions, balance):
+    packages = [os.path.join(package_dir, 'testfile-0.0.{}-py36_0.tar.bz2'.format(i))
+                for i in range(40, 45)]
+    submitted = record_submissions()
+    runner = CliRunner()
+    shards = []
+    for i in (1, 2, 3):
+        del submitted[:]
+        result = runner.invoke(cli, packages + ['--debug', '--shard', '{}/3'.format(i),
+                                                '--shard-balance', balance])
+        assert not result.exception
+        shards.append(sorted(submitted))
+    assert sorted(sum(shards, [])) == sorted(packages)
+    if balance == 'size':
+        assert all(shards)
+
+
+def test_cli_rejects_bad_shard(package_dir):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    runner = CliRunner()
+    result = runner.invoke(cli, [package, '--shard', '4/3'])
+    assert result.exit_code == 2
+
+
+def test_merge_cli(tmpdir):
+    report, journal, merged = (tmpdir.join(name) for name in
+                               ('shard1.json', 'shard2.jsonl', 'merged.json'))
+    report.write(json.dumps({'a.tar.bz2': ['[C1101] Missing package name in info/index.json']}))
+    journal.write(json.dumps({'path': 'b.tar.bz2', 'size': 1, 'mtime': 0, 'issues': []}) + '\n' +
+                  json.dumps({'path': 'c.tar.bz2', 'size': 1, 'mtime': 0,
+                              'issues': ['[C1146] stand-in issue']}) + '\n')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['merge', str(report), str(journal), '--out-file', str(merged),
+                                 '--exit'])
+    assert result.exit_code == 1
+    assert json.loads(merged.read()) == {
+        'a.tar.bz2': ['[C1101] Missing package name in info/index.json'],
+        'c.tar.bz2': ['[C1146] stand-in issue'],
+    }
+
+
+def test_package_cli_work_queue(package_dir, tmpdir):
+    packages = [os.path.join(package_dir, 'testfile-0.0.{}-py36_0.tar.bz2'.format(i))
+                for i in (40, 41, 42)]
+    queue, direct_out, merged_out = (str(tmpdir.join(name)) for name in
+                                     ('queue', 'direct.json', 'merged.json'))
+    runner = CliRunner()
+    result = runner.invoke(cli, ['enqueue', queue] + packages + packages[:1])
+    assert not result.exception
+    assert 'queued 3 inputs' in result.output
+    result = runner.invoke(cli, ['--queue', queue, '--debug'])
+    assert not result.exception
+    result = runner.invoke(cli, ['merge', queue, '--out-file', merged_out])
+    assert not result.exception
+    result = runner.invoke(cli, packages + ['--debug', '--out-file', direct_out])
+    assert not result.exception
+    with open(merged_out) as merged, open(direct_out) as direct:
+        assert json.load(merged) == json.load(direct)
+
+
+def test_package_cli_work_queue_drains(package_dir, tmpdir):
+    package = os.path.join(package_dir, 'testfile-0.0.40-py36_0.tar.bz2')
+    # neither a package nor a recipe, so it produces no result of its own
+    other = tmpdir.join('notes.txt')
+    other.write('')
+    queue = str(tmpdir.join('queue'))
+    runner = CliRunner()
+    result = runner.invoke(cli, ['enqueue', queue, package, str(other)])
+    assert not result.exception
+    result = runner.invoke(cli, ['--queue', queue, '--debug'])
+    assert not result.exception
+    assert sorted(WorkQueue(queue).results()) == sorted([package, str(other)])
+    assert not os.listdir(os.path.join(queue, 'pending'))
+
+
+def test_package_cli_work_queue_shared_by_runs(package_dir, tmpdir):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    packages = []
+    for i in range(40):
+        packages.append(str(tmpdir.mkdir(str(i)).join(os.path.basename(package))))
+        shutil.copy(package, packages[-1])
+    packages.sort()
+    queue = str(tmpdir.join('queue'))
+    runner = CliRunner()
+    result = runner.invoke(cli, ['enqueue', queue] + packages)
+    assert not result.exception
+    # each run holds claims of its own while the other's are still leased
+    command = [sys.executable, '-m', 'conda_verify', '--queue', queue, '--executor',
+               'process', '-j', '2', '--lease', '5']
+    # output goes to files, as the workers of a killed run keep pipes open
+    logs = [tmpdir.join('run{}.log'.format(i)).open('w') for i in range(2)]
+    runs = [subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT) for log in logs]
+    deadline = time.time() + 60
+    while time.time() < deadline and any(run.poll() is None for run in runs):
+        time.sleep(0.1)
+    for run, log in zip(runs, logs):
+        if run.poll() is None:
+            run.kill()
+            run.wait()
+        log.close()
+    assert [run.returncode for run in runs] == [0, 0]
+    assert sorted(WorkQueue(queue).results()) == packages
+
+
+def test_run_tasks_without_lookahead_pulls_tasks_as_slots_free():
+    pulled = []
+
+    def tasks():
+        for i in range(10):
+            pulled.append(i)
+            yield cli_module._Task('skipped', [str(i)], 1, cli_module._report_issues,
+                                   (str(i), []))
+
+    with tqdm.tqdm(total=0, disable=True) as progress:
+        for n, _ in enumerate(cli_module._run_tasks(DummyExecutor(), tasks(), 2, progress,
+                                                    lookahead=0), 1):
+            assert len(pulled) <= n + 2
+
+
+def test_run_tasks_reports_in_place():
+    submitted = []
+
+    class RecordingExecutor(DummyExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args)
+            return super(RecordingExecutor, self).submit(fn, *args, **kwargs)
+
+    tasks = [
+        cli_module._Task('channel', ['a'], 0, cli_module._report_issues, ('a', ['[C3102] gone'])),
+        cli_module._skipped_task('b'),
+        cli_module._Task('package', ['c'], 1, cli_module._report_issues, ('c', [])),
+    ]
+    with tqdm.tqdm(total=0, disable=True) as progress:
+        results = list(cli_module._run_tasks(RecordingExecutor(), tasks, 2, progress))
+    assert sorted(results) == [('a', ['[C3102] gone']), ('b', []), ('c', [])]
+    assert submitted == [('c', [])]
+
+
+class ShutdownWithoutCancelExecutor(ThreadPoolExecutor):
+    """A thread pool whose shutdown predates cancel_futures (Python < 3.9)."""
+
+    def shutdown(self, wait=True):
+        super(ShutdownWithoutCancelExecutor, self).shutdown(wait)
+
+
+def test_cancel_outstanding_without_cancel_futures():
+    executor = ShutdownWithoutCancelExecutor(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(10)
+
+    running = executor.submit(block)
+    queued = executor.submit(block)
+    started.wait(10)
+    cli_module._cancel_outstanding(executor, {running: None, queued: None})
+    release.set()
+    assert queued.cancelled()
+    assert running.result() is None
+
+
+def test_channel_cli(package_dir, tmpdir):
+    subdir = tmpdir.mkdir('channel').mkdir('linux-64')
+    listed, corrupt, unlisted = ('testfile-0.0.{}-py27_0.tar.bz2'.format(i) for i in (30, 33, 31))
+    for fn in (listed, corrupt, unlisted):
+        shutil.copy(os.path.join(package_dir, fn), str(subdir))
+    with open(os.path.join(package_dir, listed), 'rb') as f:
+        data = f.read()
+    subdir.join('repodata.json').write(json.dumps({'packages': {
+        listed: {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest(),
+                 'md5': hashlib.md5(data).hexdigest()},
+        corrupt: {'size': 1, 'sha256': '0' * 64},
+        'missing-1.0-0.tar.bz2': {'size': 1},
+    }}))
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--executor', 'process',
+                                 '--prefetch', '1', '--out-file', str(out_file)])
+    assert not result.exception
+    results = json.loads(out_file.read())
+    assert sorted(results) == sorted(str(subdir.join(fn)) for fn in
+                                     (corrupt, unlisted, 'missing-1.0-0.tar.bz2'))
+    assert results[str(subdir.join(corrupt))] == [
+        '[C1150] Found package size {} different than 1 listed in repodata.json'.format(
+            os.path.getsize(str(subdir.join(corrupt)))),
+        '[C1151] Found package with sha256 hash different than listed in repodata.json',
+    ]
+    # packages not listed are still verified
+    assert [issue for issue in results[str(subdir.join(unlisted))]
+            if not issue.startswith('[C1155]')] == [
+        '[C1137] Found namespace file "bin/easy-install.pth" in archive',
+        '[C3101] Found package not listed in repodata.json',
+    ]
+    assert results[str(subdir.join('missing-1.0-0.tar.bz2'))] == [
+        '[C3102] Found package listed in repodata.json missing on disk']
+
+
+def test_channel_cli_repodata_only(tmpdir):
+    subdir = tmpdir.mkdir('channel').mkdir('noarch')
+    record = {'name': 'a', 'version': '1.0', 'build': '0', 'build_number': 'one',
+              'depends': [], 'license_family': 'MIT'}
+    subdir.join('repodata.json').write(json.dumps({'packages': {'a-1.0-0.tar.bz2': record}}))
+    # a corrupt archive shows the packages themselves are never opened
+    subdir.join('a-1.0-0.tar.bz2').write('not a package')
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--repodata-only',
+                                 '--out-file', str(out_file)])
+    assert not result.exception
+    assert json.loads(out_file.read()) == {
+        str(subdir.join('a-1.0-0.tar.bz2')): [
+            '[C1108] Build number in info/index.json must be an integer'],
+    }
+
+
+def write_repodata(subdir, filenames):
+    records = {}
+    for fn in filenames:
+        with open(str(subdir.join(fn)), 'rb') as f:
+            records[fn] = {'sha256': hashlib.sha256(f.read()).hexdigest()}
+    subdir.join('repodata.json').write(json.dumps({'packages': records}))
+
+
+def test_channel_cli_incremental(package_dir, tmpdir, record_submissions):
+    subdir = tmpdir.mkdir('channel').mkdir('linux-64')
+    snapshot = tmpdir.mkdir('snapshot').mkdir('linux-64')
+    kept, removed, changed, added = ('testfile-0.0.{}-py27_0.tar.bz2'.format(i)
+                                     for i in (30, 33, 34, 35))
+    for fn in (kept, removed, changed):
+        shutil.copy(os.path.join(package_dir, fn), str(subdir))
+    write_repodata(subdir, [kept, removed, changed])
+    shutil.copy(str(subdir.join('repodata.json')), str(snapshot))
+    manifest = tmpdir.join('manifest.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--debug',
+                                 '--manifest', str(manifest)])
+    assert not result.exception
+    assert sorted(json.loads(manifest.read())) == sorted(str(subdir.join(fn))
+                                                         for fn in (kept, removed, changed))
+
+    subdir.join(removed).remove()
+    shutil.copy(os.path.join(package_dir, 'testfile-0.0.31-py27_0.tar.bz2'),
+                str(subdir.join(changed)))
+    shutil.copy(os.path.join(package_dir, added), str(subdir))
+    write_repodata(subdir, [kept, changed, added])
+    submitted = record_submissions(['[C1146] stand-in issue'])
+    for option, directory in (('--manifest', manifest), ('--since', tmpdir.join('snapshot'))):
+        del submitted[:]
+        result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--debug',
+                                     option, str(directory)])
+        assert not result.exception
+        assert sorted(submitted) == sorted([str(subdir.join(added)), str(subdir.join(changed))])
+    entries = json.loads(manifest.read())
+    assert sorted(entries) == sorted(str(subdir.join(fn)) for fn in (kept, changed, added))
+    assert entries[str(subdir.join(added))]['issues'] == ['[C1146] stand-in issue']
+
+
+def test_channel_cli_clobber(package_dir, tmpdir):
+    subdir = tmpdir.mkdir('channel').mkdir('linux-64')
+    for fn in ('testfile-0.0.30-py27_0.tar.bz2', 'testfile-0.0.35-py27_0.tar.bz2',
+               'python-0.0.1-py27_0.tar.bz2'):
+        shutil.copy(os.path.join(package_dir, fn), str(subdir))
+    write_repodata(subdir, os.listdir(str(subdir)))
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--clobber',
+                                 '--out-file', str(out_file)])
+    assert not result.exception
+    [issue] = json.loads(out_file.read())[str(subdir)]
+    assert issue.startswith('[C3103] Found 1 files installed by both python and testfile, such as '
+                            '"lib/python3.6/site-packages/test/__main__.py" in '
+                            'python-0.0.1-py27_0.tar.bz2 and testfile-0.0.3')
+
+
+def test_package_cli_limits(package_dir, tmpdir):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    out_file = tmpdir.join('out.json')
+    runner = CliRunner()
+    result = runner.invoke(cli, [package, '--debug', '--max-members', '2',
+                                 '--out-file', str(out_file)])
+    assert not result.exception
+    assert json.loads(out_file.read()) == {package: ['[C1154] Package has more than 2 members']}
+    result = runner.invoke(cli, [package, '--debug', '--max-members', '2', '--ignore', 'C1154',
+                                 '--out-file', str(out_file)])
+    assert not result.exception
+    assert not json.loads(out_file.read())
+
+
+def test_verify_options_are_declared_once():
+    names = [opt for param in verify.params for opt in param.opts]
+    assert len(names) == len(set(names))
+
+
+@pytest.mark.parametrize('option', [['--shard', '1/2'], ['--resume']])
+def test_channel_cli_drops_filtered_channel_inputs(package_dir, tmpdir, monkeypatch, option):
+    subdir = tmpdir.mkdir('channel').mkdir('linux-64')
+    filenames = ['testfile-0.0.{}-py36_0.tar.bz2'.format(i) for i in range(40, 45)]
+    for fn in filenames:
+        shutil.copy(os.path.join(package_dir, fn), str(subdir))
+    write_repodata(subdir, filenames)
+    journal = tmpdir.join('journal.jsonl')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--debug',
+                                 '--journal', str(journal)])
+    assert not result.exception
+    iter_tasks = cli_module._iter_tasks
+    leftover = []
+
+    def tracking_iter_tasks(input_paths, ignore, prefetch, fail_fast, channel_inputs, *args):
+        for task in iter_tasks(input_paths, ignore, prefetch, fail_fast, channel_inputs, *args):
+            yield task
+        leftover.append(dict(channel_inputs))
+
+    monkeypatch.setattr('conda_verify.cli._iter_tasks', tracking_iter_tasks)
+    result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--debug',
+                                 '--journal', str(journal)] + option)
+    assert not result.exception
+    assert leftover == [{}]
+
+
+def test_channel_cli_size_shards_with_missing_package(package_dir, tmpdir):
+    subdir = tmpdir.mkdir('channel').mkdir('linux-64')
+    filenames = ['testfile-0.0.{}-py36_0.tar.bz2'.format(i) for i in range(40, 43)]
+    for fn in filenames:
+        shutil.copy(os.path.join(package_dir, fn), str(subdir))
+    write_repodata(subdir, filenames)
+    # listed in repodata.json without a size, and missing on disk
+    repodata = json.loads(subdir.join('repodata.json').read())
+    repodata['packages']['missing-1.0-0.tar.bz2'] = {}
+    subdir.join('repodata.json').write(json.dumps(repodata))
+    runner = CliRunner()
+    results = {}
+    for i in (1, 2):
+        out_file = tmpdir.join('out{}.json'.format(i))
+        result = runner.invoke(cli, ['--channel', str(tmpdir.join('channel')), '--debug',
+                                     '--shard', '{}/2'.format(i), '--shard-balance', 'size',
+                                     '--out-file', str(out_file)])
+        assert not result.exception
+        results.update(json.loads(out_file.read()))
+    assert results[str(subdir.join('missing-1.0-0.tar.bz2'))] == [
+        '[C3102] Found package listed in repodata.json missing on disk']
+
+
+@pytest.mark.parametrize('prefetch', ['0', '1'])
+def test_package_cli_build_prefix(package_dir, monkeypatch, prefetch):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    passed = []
+
+    def record(*args):
+        passed.append(args[-1])
+        return [(package, None)] if prefetch != '0' else (package, None)
+
+    monkeypatch.setattr('conda_verify.cli._submit_verify_package', record)
+    monkeypatch.setattr('conda_verify.cli._submit_verify_packages', record)
+    runner = CliRunner()
+    result = runner.invoke(cli, [package, '--debug', '--prefetch', prefetch,
+                                 '--build-prefix', '/builds/', '--build-prefix', '/ci/'])
+    assert not result.exception
+    assert passed == [('/builds/', '/ci/')]
@@ -1,7 +1,18 @@
+import bz2
+import hashlib
+import io
+import json
 import os
+import shutil
+import struct
+import tarfile
 
 import pytest
+from conda_package_handling.api import InvalidArchiveError
 
+from conda_verify import archive
+from conda_verify.archive import Limits, LimitExceeded
+from conda_verify.checks import CondaPackageCheck
 from conda_verify.errors import PackageError
 from conda_verify.verify import Verify
 
@@ -48,6 +59,17 @@ def test_index_unicode(package_dir, verifier):
     assert '[C1116] Found non-ascii characters inside info/index.json' in errors
 
 
+def test_exit_on_error_stops_at_first_error(package_dir, verifier):
+    package = os.path.join(package_dir, 'testfile-0.0.2-py36_0.tar.bz2')
+
+    with pytest.raises(PackageError) as excinfo:
+        verifier.verify_package(path_to_package=package, exit_on_error=True)
+    package, errors = verifier.verify_package(path_to_package=package, exit_on_error=False)
+
+    check = excinfo.value.args[0]
+    assert '[{}] {}'.format(check.code, check.message) in errors
+
+
 def test_info_in_files_file(package_dir, verifier):
     package = os.path.join(package_dir, 'testfile-0.0.3-py36_0.tar.bz2')
 
@@ -506,3 +528,294 @@ def test_invalid_noarch_files(package_dir, verifier):
     package, errors = verifier.verify_package(path_to_package=package, exit_on_error=False)
 
     assert '[C1148] Found architecture specific file "bin{}testfile.dll" in package.'.format(os.path.sep) in errors
+
+
+@pytest.mark.parametrize('filename', [
+    'testfile-0.0.27-py27_0',
+    'testfile-0.0.43-py36_0',
+    'testfile-0.0.44-py36_0',
+    'testfile-0.0.6-py36_0',
+])
+def test_uncompressed_package_matches_compressed(package_dir, verifier, tmpdir, filename):
+    package = os.path.join(package_dir, filename + '.tar.bz2')
+    tar_package = str(tmpdir.join(filename + '.tar'))
+    with bz2.BZ2File(package) as compressed, open(tar_package, 'wb') as uncompressed:
+        shutil.copyfileobj(compressed, uncompressed)
+
+    _, compressed_errors = verifier.verify_package(path_to_package=package)
+    _, uncompressed_errors = verifier.verify_package(path_to_package=tar_package)
+    assert uncompressed_errors == compressed_errors
+
+
+@pytest.mark.parametrize('extension', ['.tar.bz2', '.tar'])
+def test_package_differs_from_repodata(package_dir, verifier, tmpdir, extension):
+    package = str(tmpdir.join('testfile-0.0.30-py27_0' + extension))
+    with bz2.BZ2File(os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')) as compressed:
+        data = compressed.read()
+    if extension == '.tar':
+        with open(package, 'wb') as f:
+            f.write(data)
+    else:
+        shutil.copy(os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2'), package)
+    record = {'size': os.path.getsize(package), 'md5': '0' * 32}
+
+    package, errors = verifier.verify_package(path_to_package=package, repodata_record=record)
+
+    assert errors == ['[C1152] Found package with md5 hash different than listed in repodata.json']
+
+
+def write_package(path, members):
+    """Write a package at path holding members, a dict of names to text or bytes."""
+    with tarfile.open(path, 'w:bz2' if path.endswith('.tar.bz2') else 'w') as tar:
+        for name, content in sorted(members.items()):
+            data = content if isinstance(content, bytes) else content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def test_every_prefix_entry_is_checked(tmpdir):
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux'}),
+        'info/files': 'bin/first\nbin/third\nlib/libx.so\n',
+        'info/has_prefix': ('/opt/anaconda1anaconda2anaconda3 text bin/first\n'
+                            '/opt/anaconda1anaconda2anaconda3 text bin/second\n'
+                            '/opt/anaconda1anaconda2anaconda3 wrong_mode bin/third\n'),
+        'info/paths.json': json.dumps({'paths': [
+            {'_path': 'bin/first', 'prefix_placeholder': '/opt/anaconda1anaconda2anaconda3',
+             'file_mode': 'text'},
+            {'_path': 'lib/libx.so', 'prefix_placeholder': '/short', 'file_mode': 'binary'},
+        ]}),
+        'bin/first': '', 'bin/third': '', 'lib/libx.so': '',
+    }
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0.tar')), members)
+
+    with CondaPackageCheck(package) as package_check:
+        assert list(package_check.prefix_table) == ['bin/first', 'bin/second', 'bin/third',
+                                                    'lib/libx.so']
+        assert package_check.prefix_file_contents == (
+            '/opt/anaconda1anaconda2anaconda3', 'text', 'bin/first')
+        filename_error = package_check.check_prefix_file_filename()
+        mode_error = package_check.check_prefix_file_mode()
+        binary_error = package_check.check_prefix_file_binary_mode()
+
+    assert filename_error.message == (
+        'Found filename "bin/second" in info/has_prefix not included in archive')
+    assert mode_error.message == 'Found invalid mode "wrong_mode" in info/has_prefix'
+    assert binary_error.code == 'C1133'
+    assert binary_error.message == (
+        'Binary placeholder "/short" found in info/paths.json does not have a length of 255 bytes')
+
+
+@pytest.mark.parametrize('extension', ['.tar', '.tar.bz2'])
+def test_build_prefix_outside_has_prefix(tmpdir, extension):
+    placeholder = '/home/user/miniconda3/envs/_build_placehold_placehold'
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux'}),
+        'info/files': 'bin/listed\nbin/clean\nlib/python3.6/x.pyc\n',
+        'info/has_prefix': '{} text bin/listed\n'.format(placeholder),
+        'bin/listed': 'PREFIX={}\n'.format(placeholder),
+        'bin/clean': '#!/bin/sh\necho clean\n',
+        'lib/python3.6/x.pyc': 'compiled in /home/conda/feedstock_root/build_artifacts',
+    }
+
+    def build(extra):
+        return write_package(
+            str(tmpdir.join('testfile-0.0.1-py36_0' + extension)), dict(members, **extra))
+
+    with CondaPackageCheck(build({})) as package_check:
+        assert package_check.check_for_build_prefix() is None
+
+    with CondaPackageCheck(build({'bin/leak': 'cd /home/conda/feedstock_root/build_artifacts'})) as package_check:
+        error = package_check.check_for_build_prefix()
+    assert error.message == (
+        'Found build prefix "/home/conda/feedstock_root/" in file "bin/leak" not listed in '
+        'info/has_prefix')
+
+    with CondaPackageCheck(build({'lib/libleak.so': '\0\0' + placeholder + '/lib\0'})) as package_check:
+        error = package_check.check_for_build_prefix()
+    assert error.code == 'C1153'
+    assert placeholder in error.message
+
+
+def test_configured_build_prefixes(tmpdir, verifier):
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux',
+                                       'subdir': 'linux-64'}),
+        'info/files': 'bin/ci\nbin/feedstock\n',
+        'bin/ci': 'cd /builds/runner/work',
+        'bin/feedstock': 'cd /home/conda/feedstock_root/build_artifacts',
+    }
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0.tar')), members)
+
+    with CondaPackageCheck(package, build_prefixes=['/builds/runner/']) as package_check:
+        error = package_check.check_for_build_prefix()
+    assert error.message == (
+        'Found build prefix "/builds/runner/" in file "bin/ci" not listed in info/has_prefix')
+
+    _, errors = verifier.verify_package(path_to_package=package, build_prefixes=['/nowhere/'])
+    assert not any(error.startswith('[C1153]') for error in errors)
+
+
+@pytest.mark.parametrize('extension', ['.tar', '.tar.bz2'])
+def test_binary_arch(tmpdir, extension):
+    def elf(machine):
+        return b'\x7fELF\x02\x01' + b'\0' * 10 + struct.pack('<HH', 3, machine) + b'\0' * 40
+
+    # a 32-bit Windows launcher, like those setuptools ships on every platform
+    launcher = b'MZ' + b'\0' * 0x3a + struct.pack('<I', 64) + b'PE\0\0' + struct.pack('<H', 0x14c)
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux', 'arch': 'x86_64',
+                                       'subdir': 'linux-64'}),
+        'info/files': 'bin/tool\nlib/libtool.so\nlib/python3.6/cli-32.exe\n',
+        'bin/tool': elf(62),
+        'lib/libtool.so': elf(62),
+        'lib/python3.6/cli-32.exe': launcher,
+    }
+    package = str(tmpdir.join('testfile-0.0.1-py36_0' + extension))
+
+    with CondaPackageCheck(write_package(package, members)) as package_check:
+        assert package_check.check_binary_arch() is None
+
+    members['lib/libtool.so'] = elf(183)
+    with CondaPackageCheck(write_package(package, members)) as package_check:
+        error = package_check.check_binary_arch()
+    assert error.code == 'C1145'
+    assert error.message == (
+        'Found file "lib{}libtool.so" with object type "ELF64 arm64" but with arch "x86_64"'.format(
+            os.path.sep if extension == '.tar.bz2' else '/'))
+
+
+def test_every_file_mismatch_is_reported(tmpdir, verifier):
+    def entry(path, content, **fields):
+        return dict({'_path': path, 'path_type': 'hardlink', 'size_in_bytes': len(content),
+                     'sha256': hashlib.sha256(content.encode('utf-8')).hexdigest()}, **fields)
+
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux', 'depends': [],
+                                       'license_family': 'BSD', 'subdir': 'linux-64'}),
+        'info/files': 'bin/a\nbin/b\nbin/c\nbin/missing1\nbin/missing2\n',
+        'info/paths.json': json.dumps({'paths': [
+            entry('bin/a', 'a'),
+            entry('bin/b', 'b', size_in_bytes=5),
+            entry('bin/c', 'c', sha256='0' * 64),
+        ]}),
+        'bin/a': 'a', 'bin/b': 'b', 'bin/c': 'c', 'bin/extra': 'extra',
+    }
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0.tar')), members)
+
+    _, errors = verifier.verify_package(path_to_package=package)
+
+    assert [error for error in errors if error[1:6] in ('C1122', 'C1123', 'C1146', 'C1147')] == [
+        '[C1122] Found filename in info/files missing from tar archive: bin/missing1',
+        '[C1122] Found filename in info/files missing from tar archive: bin/missing2',
+        '[C1123] Found filename in tar archive missing from info/files: bin/extra',
+        '[C1146] Found file "bin/c" with sha256 hash different than listed in paths.json',
+        '[C1147] Found file "bin/b" with filesize different than listed in paths.json',
+    ]
+    with pytest.raises(PackageError):
+        verifier.verify_package(path_to_package=package, exit_on_error=True)
+
+
+def test_paths_json_disagrees_with_files_file(tmpdir, verifier):
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux', 'depends': [],
+                                       'license_family': 'BSD', 'subdir': 'linux-64'}),
+        'info/files': 'bin/a\nbin/b\n',
+        # bin/gone is in neither info/files nor the archive
+        'info/paths.json': json.dumps({'paths': [
+            {'_path': 'bin/a', 'path_type': 'hardlink'},
+            {'_path': 'bin/gone', 'path_type': 'hardlink'},
+        ]}),
+        'bin/a': 'a', 'bin/b': 'b',
+    }
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0.tar')), members)
+
+    _, errors = verifier.verify_package(path_to_package=package)
+
+    assert [error for error in errors if error.startswith('[C1155]')] == [
+        '[C1155] Found filename in info/files missing from info/paths.json: bin/b',
+        '[C1155] Found filename in info/paths.json missing from info/files: bin/gone',
+    ]
+    with pytest.raises(PackageError):
+        verifier.verify_package(path_to_package=package, exit_on_error=True)
+
+
+@pytest.mark.parametrize('extension', ['.tar', '.tar.bz2'])
+@pytest.mark.parametrize('limits,message', [
+    (Limits(None, 2, None, None), 'Package has more than 2 members'),
+    (Limits(1000, None, None, None), 'Package expands to more than 1000 bytes'),
+    (Limits(None, None, None, 20), 'Found member path longer than 20 characters'),
+])
+def test_package_over_limits(tmpdir, verifier, extension, limits, message):
+    members = {
+        'info/index.json': json.dumps({'name': 'testfile', 'version': '0.0.1', 'build': 'py36_0',
+                                       'build_number': 0, 'platform': 'linux',
+                                       'subdir': 'linux-64'}),
+        'info/files': 'lib/python3.6/site-packages/data.bin\n',
+        'lib/python3.6/site-packages/data.bin': b'\0' * 4096,
+    }
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0' + extension)), members)
+
+    _, errors = verifier.verify_package(path_to_package=package, limits=limits)
+    assert len(errors) == 1
+    assert errors[0].startswith('[C1154] ' + message)
+    with pytest.raises(PackageError) as excinfo:
+        verifier.verify_package(path_to_package=package, limits=limits, exit_on_error=True)
+    assert excinfo.value.args[0].code == 'C1154'
+    # ignoring C1154 lifts the limits
+    _, errors = verifier.verify_package(path_to_package=package, limits=limits,
+                                        checks_to_ignore=['C1154'])
+    assert not any(error.startswith('[C1154]') for error in errors)
+
+
+def test_package_over_compression_ratio(tmpdir, monkeypatch):
+    monkeypatch.setattr(archive, 'RATIO_FLOOR', 0)
+    members = {'info/index.json': '{}', 'lib/zeros': b'\0' * (1 << 20)}
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0.tar.bz2')), members)
+
+    with pytest.raises(LimitExceeded) as excinfo:
+        CondaPackageCheck(package, limits=Limits(None, None, 100, None))
+    assert excinfo.value.error.code == 'C1154'
+    assert 'more than 100 times' in excinfo.value.error.message
+
+
+@pytest.mark.parametrize('limits', [None, archive.DEFAULT_LIMITS])
+def test_truncated_package(package_dir, tmpdir, limits):
+    with open(os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2'), 'rb') as f:
+        data = f.read()
+    package = tmpdir.join('testfile-0.0.30-py27_0.tar.bz2')
+    package.write(data[:len(data) // 2], 'wb')
+
+    with pytest.raises(InvalidArchiveError):
+        archive.extract(str(package), str(tmpdir.mkdir('extracted')), limits)
+
+
+def test_extract_closes_component_streams(tmpdir, monkeypatch):
+    package = write_package(str(tmpdir.join('testfile-0.0.1-py36_0.tar.bz2')),
+                            {'info/index.json': '{}'})
+    streams, closed = [], []
+
+    def iter_component(f, component):
+        with tarfile.open(fileobj=f, mode='r|*') as tar:
+            try:
+                for member in tar:
+                    yield tar, member
+            finally:
+                closed.append(component)
+
+    def stream_conda_component(path, f, component):
+        # held on to, so that dropping it does not close it
+        streams.append(iter_component(f, component))
+        return streams[-1]
+
+    monkeypatch.setattr(archive, 'stream_conda_component', stream_conda_component)
+    archive.extract(package, str(tmpdir.mkdir('extracted')), archive.DEFAULT_LIMITS)
+    assert closed == ['pkg']
@@ -1,8 +1,12 @@
+import bz2
 import os
+import shutil
 
 import pytest
 
-from conda_verify.verify import Verify
+from conda_verify.checks import CondaPackageCheck
+from conda_verify.errors import PackageError
+from conda_verify.verify import Verify, prefetch_package_checks
 
 
 @pytest.fixture
@@ -89,3 +93,53 @@ def test_passing_legacy_arguments_to_package_shows_warning(package_dir, verifier
     verifier.verify_package(path_to_package=package, ignore_scripts='abc.py')
     # actually only one more, but we still have the earlier one in the pipe, too.
     assert caplog.text.count('Ignoring legacy ignore_scripts or run_scripts.') == 2
+
+
+def test_valid_uncompressed_package(package_dir, verifier, tmpdir):
+    """Uncompressed .tar packages are verified in place from a memory map."""
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    tar_package = str(tmpdir.join('testfile-0.0.30-py27_0.tar'))
+    with bz2.BZ2File(package) as compressed, open(tar_package, 'wb') as uncompressed:
+        shutil.copyfileobj(compressed, uncompressed)
+
+    _, errors = verifier.verify_package(path_to_package=tar_package)
+    assert errors == []
+    assert not tmpdir.join('testfile-0.0.30-py27_0').check()
+
+
+@pytest.mark.parametrize('filename', ['testfile-0.0.30-py27_0.tar.bz2',
+                                      'testfile-0.0.30-py27_0.tar'])
+def test_verify_package_closes_check(package_dir, verifier, tmpdir, monkeypatch, filename):
+    package = os.path.join(package_dir, 'testfile-0.0.30-py27_0.tar.bz2')
+    if filename.endswith('.tar'):
+        package, compressed = str(tmpdir.join(filename)), package
+        with bz2.BZ2File(compressed) as f, open(package, 'wb') as uncompressed:
+            shutil.copyfileobj(f, uncompressed)
+    closed = []
+    close = CondaPackageCheck.close
+    monkeypatch.setattr(CondaPackageCheck, 'close',
+                        lambda package_check: closed.append(package_check) or close(package_check))
+
+    verifier.verify_package(path_to_package=package)
+    [package_check] = closed
+    if package_check.tmpdir is not None:
+        assert not os.path.exists(package_check.tmpdir)
+
+
+def test_prefetch_package_checks(package_dir):
+    packages = [os.path.join(package_dir, name) for name in (
+        'testfile-0.0.30-py27_0.tar.bz2',
+        'testfile.zip',
+        'testfile-0.0.33-py27_0.tar.bz2',
+    )]
+    loaded = list(prefetch_package_checks(packages, depth=1))
+    assert [path for path, _ in loaded] == packages
+    assert isinstance(loaded[1][1], PackageError)
+    # checks are closed once the caller has moved past them
+    assert not os.path.exists(loaded[0][1].tmpdir)
+
+    # stopping early does not leave the background loader behind
+    for path, package_check in prefetch_package_checks(packages, depth=2):
+        tmpdir = package_check.tmpdir
+        break
+    assert not os.path.exists(tmpdir)
@@ -0,0 +1,67 @@
+import struct
+
+import pytest
+
+from conda_verify.binaries import Binary, inspect, package_arch
+
+
+def elf(ei_class, order, machine):
+    ident = b'\x7fELF' + struct.pack('BB', ei_class, 1 if order == '<' else 2) + b'\0' * 10
+    return ident + struct.pack(order + 'HH', 3, machine) + b'\0' * 40
+
+
+def pe(machine, offset=0x80):
+    stub = b'MZ' + b'\0' * 0x3a + struct.pack('<I', offset)
+    return stub.ljust(offset, b'\0') + b'PE\0\0' + struct.pack('<H', machine) + b'\0' * 20
+
+
+def fat(*cpu_types):
+    entries = b''.join(struct.pack('>iiIII', cpu_type, 3, 4096, 4096, 12) for cpu_type in cpu_types)
+    return b'\xca\xfe\xba\xbe' + struct.pack('>I', len(cpu_types)) + entries
+
+
+@pytest.mark.parametrize('data,binary', [
+    (elf(2, '<', 62), Binary('ELF', 64, ('x86_64',))),
+    (elf(1, '<', 3), Binary('ELF', 32, ('x86',))),
+    (elf(2, '<', 183), Binary('ELF', 64, ('arm64',))),
+    (elf(2, '<', 21), Binary('ELF', 64, ('ppc64le',))),
+    (elf(2, '>', 21), Binary('ELF', 64, ('ppc64',))),
+    (b'\xcf\xfa\xed\xfe' + struct.pack('<i', 0x0100000c) + b'\0' * 24,
+     Binary('MachO', 64, ('arm64',))),
+    (fat(0x01000007, 0x0100000c), Binary('MachO', None, ('x86_64', 'arm64'))),
+    (pe(0x8664), Binary('PE', None, ('x86_64',))),
+    (pe(0x14c, offset=2048), Binary('PE', None, ('x86',))),
+    # a Java class file, which shares the fat Mach-O magic
+    (b'\xca\xfe\xba\xbe\x00\x00\x00\x34' + b'\0' * 40, None),
+    (b'MZ not a PE file', None),
+    (b'#!/bin/sh\n', None),
+    (b'', None),
+])
+def test_inspect(data, binary):
+    reads = []
+
+    def head(size):
+        reads.append(size)
+        return data[:size]
+
+    assert inspect(head) == binary
+    # one read, or two for headers beyond the first read
+    assert len(reads) <= 2
+
+
+def test_binary_str():
+    assert str(Binary('ELF', 64, ('x86_64',))) == 'ELF64 x86_64'
+    assert str(Binary('MachO', None, ('x86_64', 'arm64'))) == 'MachO x86_64+arm64'
+
+
+@pytest.mark.parametrize('info,arch', [
+    ({'subdir': 'linux-64', 'arch': 'x86_64'}, 'x86_64'),
+    ({'subdir': 'linux-aarch64', 'arch': 'aarch64'}, 'arm64'),
+    ({'subdir': 'osx-arm64', 'arch': 'arm64'}, 'arm64'),
+    ({'subdir': 'win-32', 'arch': 'x86'}, 'x86'),
+    ({'arch': 'ppc64le'}, 'ppc64le'),
+    ({'subdir': 'noarch', 'arch': None}, None),
+    ({}, None),
+])
+def test_package_arch(info, arch):
+    assert package_arch(info) == arch
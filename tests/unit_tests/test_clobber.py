@@ -0,0 +1,29 @@
+import hashlib
+
+from conda_verify.clobber import BloomFilter, ClobberIndex
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000)
+    digests = [hashlib.md5(str(i).encode('ascii')).digest() for i in range(1000)]
+    assert not any(bloom.add(digest) for digest in digests[::2])
+    assert all(digest in bloom for digest in digests[::2])
+    assert all(bloom.add(digest) for digest in digests[::2])
+    # about 1% of the absent digests are false positives
+    assert sum(digest in bloom for digest in digests[1::2]) < 50
+
+
+def test_clobber_index():
+    # a tiny capacity saturates the filters, so every path is checked in sqlite
+    with ClobberIndex(capacity=8) as index:
+        index.add('linux-64', 'a-1-0.tar.bz2', 'a', ['bin/a', 'share/common', 'share/x'])
+        index.add('linux-64', 'a-2-0.tar.bz2', 'a', ['bin/a', 'share/common'])
+        index.add('linux-64', 'b-1-0.tar.bz2', 'b', ['bin/b', 'share/common', 'share/x'])
+        index.add('linux-64', 'c-1-0.tar.bz2', 'c', ['share/common'])
+        index.add('osx-64', 'd-1-0.tar.bz2', 'd', ['bin/a'])
+        clobbers = index.clobbers()
+    assert clobbers == {'linux-64': [
+        ('a', 'b', 2, ('share/common', 'a-1-0.tar.bz2', 'b-1-0.tar.bz2')),
+        ('a', 'c', 1, ('share/common', 'a-1-0.tar.bz2', 'c-1-0.tar.bz2')),
+        ('b', 'c', 1, ('share/common', 'b-1-0.tar.bz2', 'c-1-0.tar.bz2')),
+    ]}
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from conda_verify import executors
+
+
+@pytest.mark.parametrize('files, expected', [
+    ({'/sys/fs/cgroup/cpu.max': '150000 100000'}, 1.5),
+    ({'/sys/fs/cgroup/cpu.max': 'max 100000'}, None),
+    ({'/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '400000',
+      '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000'}, 4.0),
+    ({'/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '-1',
+      '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000'}, None),
+    ({}, None),
+])
+def test_cgroup_cpu_limit(monkeypatch, files, expected):
+    monkeypatch.setattr(executors, '_read_first_line', files.get)
+    assert executors.cgroup_cpu_limit() == expected
+
+
+def test_cpu_count_honours_quota(monkeypatch):
+    monkeypatch.setattr(executors, 'cgroup_cpu_limit', lambda: 1.5)
+    assert executors.cpu_count() <= 2
+    monkeypatch.setattr(executors, 'cgroup_cpu_limit', lambda: 0.1)
+    assert executors.cpu_count() == 1
+
+
+@pytest.mark.parametrize('kind, jobs, weights, exhausted, expected', [
+    ('thread', 8, [1], True, 'thread'),
+    ('auto', 8, [1 << 30], True, 'serial'),
+    ('auto', 8, [1, 2, 3], True, 'serial'),
+    ('auto', 8, [1 << 30, 1 << 30], True, 'process'),
+    ('auto', 8, [1] * 16, False, 'process'),
+    ('auto', 1, [1 << 30] * 16, False, 'serial'),
+])
+def test_select_executor_kind(kind, jobs, weights, exhausted, expected):
+    assert executors.select_executor_kind(kind, jobs, weights, exhausted) == expected
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def spin_for(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def fail():
+    raise ValueError('failed in worker')
+
+
+def test_worker_pool_runs_tasks():
+    with executors.WorkerPool(max_workers=2) as pool:
+        futures = [pool.submit(sleep_for, n / 100.0) for n in range(4)]
+        failing = pool.submit(fail)
+        assert [f.result() for f in futures] == [0, 0.01, 0.02, 0.03]
+        with pytest.raises(ValueError):
+            failing.result()
+
+
+def test_worker_pool_wall_clock_budget():
+    with executors.WorkerPool(max_workers=1) as pool:
+        start = time.time()
+        stuck = pool.submit_with_budget(executors.Budget(0.5, None), sleep_for, 60)
+        after = pool.submit(sleep_for, 0)
+        with pytest.raises(executors.TaskTimeout) as excinfo:
+            stuck.result()
+        assert excinfo.value.kind == 'wall-clock'
+        # the worker was replaced and the pool carries on
+        assert after.result() == 0
+    assert time.time() - start < 30
+
+
+@pytest.mark.skipif(executors.resource is None, reason='CPU budgets need the resource module')
+def test_worker_pool_cpu_budget():
+    with executors.WorkerPool(max_workers=1) as pool:
+        spinning = pool.submit_with_budget(executors.Budget(None, 1), spin_for, 60)
+        with pytest.raises(executors.TaskTimeout) as excinfo:
+            spinning.result(timeout=30)
+        assert excinfo.value.kind == 'CPU'
+        assert pool.submit(sleep_for, 0).result() == 0
+
+
+def current_pid():
+    return os.getpid()
+
+
+def test_worker_pool_recycles_workers():
+    with executors.WorkerPool(max_workers=1, max_tasks=2) as pool:
+        pids = [pool.submit(current_pid).result() for _ in range(5)]
+    assert len(set(pids)) == 3
+    [stats] = pool.stats()
+    assert (stats.slot, stats.processes, stats.tasks) == (0, 3, 5)
+    if executors.resource is not None:
+        assert stats.peak_rss > 0
+
+
+def test_worker_pool_memory_ceiling():
+    # every worker is over a 1 byte ceiling, so each runs exactly one task
+    with executors.WorkerPool(max_workers=2, max_rss=1) as pool:
+        pids = [pool.submit(current_pid).result() for _ in range(3)]
+    assert len(set(pids)) == 3
+
+
+def test_worker_pool_terminate():
+    pool = executors.WorkerPool(max_workers=1)
+    running = pool.submit(sleep_for, 60)
+    queued = pool.submit(sleep_for, 60)
+    time.sleep(0.5)
+    start = time.time()
+    pool.terminate()
+    assert time.time() - start < 10
+    assert running.cancelled() or isinstance(running.exception(), executors.CancelledError)
+    assert queued.cancelled()
@@ -0,0 +1,74 @@
+import os
+
+from conda_verify.journal import Journal
+
+
+def test_journal_replays_unchanged_inputs(tmpdir):
+    unchanged, changed, new = (tmpdir.join(name) for name in ('a.tar.bz2', 'b.tar.bz2', 'c.tar.bz2'))
+    for path in (unchanged, changed, new):
+        path.write('package')
+    journal_path = str(tmpdir.join('journal.jsonl'))
+    with Journal(journal_path) as journal:
+        journal.record(str(unchanged), ['[C1101] Missing package name in info/index.json'])
+        journal.record(str(changed), None)
+    changed.write('a different package')
+
+    replayed = []
+    with Journal(journal_path, resume=True) as journal:
+        remaining = list(journal.skip_unchanged(
+            [str(unchanged), str(changed), str(new)], lambda *result: replayed.append(result)))
+    assert remaining == [str(changed), str(new)]
+    assert replayed == [(str(unchanged), ['[C1101] Missing package name in info/index.json'])]
+
+
+def test_journal_ignores_torn_last_line(tmpdir):
+    package = tmpdir.join('a.tar.bz2')
+    package.write('package')
+    journal_path = str(tmpdir.join('journal.jsonl'))
+    with Journal(journal_path) as journal:
+        journal.record(str(package), [])
+    with open(journal_path, 'a') as f:
+        f.write('{"path": "b.tar.b')
+    assert list(Journal.load(journal_path)) == [str(package)]
+
+
+def test_journal_resumes_after_torn_last_line(tmpdir):
+    packages = [tmpdir.join(name) for name in ('a.tar.bz2', 'b.tar.bz2')]
+    for package in packages:
+        package.write('package')
+    journal_path = str(tmpdir.join('journal.jsonl'))
+    with Journal(journal_path) as journal:
+        journal.record(str(packages[0]), [])
+    with open(journal_path, 'a') as f:
+        f.write('{"path": "b.tar.b')
+    with Journal(journal_path, resume=True) as journal:
+        journal.record(str(packages[1]), [])
+    assert sorted(Journal.load(journal_path)) == [str(package) for package in packages]
+
+
+def test_journal_retries_inputs(tmpdir):
+    finished, timed_out = (tmpdir.join(name) for name in ('a.tar.bz2', 'b.tar.bz2'))
+    for package in (finished, timed_out):
+        package.write('package')
+    journal_path = str(tmpdir.join('journal.jsonl'))
+    with Journal(journal_path) as journal:
+        journal.record(str(finished), [])
+        journal.record(str(timed_out), ['[C1149] Verification exceeded its budget'])
+
+    replayed = []
+    with Journal(journal_path, resume=True) as journal:
+        remaining = list(journal.skip_unchanged(
+            [str(finished), str(timed_out)], lambda *result: replayed.append(result),
+            lambda issues: any(issue.startswith('[C1149]') for issue in issues)))
+    assert remaining == [str(timed_out)]
+    assert replayed == [(str(finished), [])]
+
+
+def test_journal_without_resume_starts_over(tmpdir):
+    package = tmpdir.join('a.tar.bz2')
+    package.write('package')
+    journal_path = str(tmpdir.join('journal.jsonl'))
+    with Journal(journal_path) as journal:
+        journal.record(str(package), [])
+    Journal(journal_path).close()
+    assert os.path.getsize(journal_path) == 0
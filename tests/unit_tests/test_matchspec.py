@@ -0,0 +1,65 @@
+import pytest
+
+from conda_verify.matchspec import (
+    ChannelIndex,
+    compile_version_spec,
+    parse_dependency,
+    parse_version,
+)
+
+
+def test_version_order():
+    versions = [
+        '0.4', '0.4.1.rc', '0.5a1', '0.5b3', '0.5', '0.9.6', '1.0', '1.1dev1', '1.1a1',
+        '1.1.0dev1', '1.1.a1', '1.1.0rc1', '1.1.0', '1.1.0post1', '1.1post1', '1996.07.12',
+        '1!0.4.1', '1!3.1.1.6',
+    ]
+    parsed = [parse_version(version) for version in versions]
+    assert all(a < b for a, b in zip(parsed, parsed[1:]))
+    assert parse_version('1.0') == parse_version('1.0.0')
+    assert parse_version('1.0_1') == parse_version('1.0.1')
+
+
+@pytest.mark.parametrize('spec,matching,other', [
+    ('>=1.11,<2|3.0.*', ['1.11', '1.99', '3.0.5'], ['1.10', '2.0', '3.1']),
+    ('1.11', ['1.11', '1.11.3'], ['1.12', '1.1']),
+    ('==1.11', ['1.11', '1.11.0'], ['1.11.3']),
+    ('~=1.4.2', ['1.4.2', '1.4.9'], ['1.4.1', '1.5']),
+    ('!=1.4.*', ['1.5'], ['1.4.1']),
+    ('3.6*', ['3.6', '3.6.5'], ['3.7']),
+    ('*', ['0.1'], []),
+])
+def test_compile_version_spec(spec, matching, other):
+    match = compile_version_spec(spec)
+    assert all(match(parse_version(version)) for version in matching)
+    assert not any(match(parse_version(version)) for version in other)
+
+
+def test_compile_version_spec_grouped():
+    with pytest.raises(ValueError):
+        compile_version_spec('(>=1,<2)|>3')
+
+
+def test_parse_dependency():
+    assert parse_dependency('python >=3.6,<3.7.0a0') == ('python', '>=3.6,<3.7.0a0', None)
+    assert parse_dependency('numpy>=1.2') == ('numpy', '>=1.2', None)
+    assert parse_dependency('libgcc') == ('libgcc', None, None)
+    assert parse_dependency('openssl 1.1.1 h7b6447c_0') == ('openssl', '1.1.1', 'h7b6447c_0')
+
+
+def test_channel_index():
+    index = ChannelIndex([
+        {'name': 'python', 'version': '3.6.5', 'build': 'h1_0'},
+        {'name': 'numpy', 'version': '1.11.3', 'build': 'py36_0'},
+    ])
+
+    assert index.resolvable('python >=3.6,<3.7.0a0')
+    assert index.resolvable('python')
+    assert index.resolvable('numpy 1.11.* py36*')
+    assert index.resolvable('__glibc >=2.17')
+    assert not index.resolvable('python 2.7*')
+    assert not index.resolvable('numpy 1.11.* py27*')
+    assert not index.resolvable('zlib')
+
+    index.add({'name': 'zlib', 'version': '1.2.11', 'build': '0'})
+    assert index.resolvable('zlib 1.2.*')
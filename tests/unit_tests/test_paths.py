@@ -0,0 +1,127 @@
+import io
+import json
+
+import pytest
+
+from conda_verify.paths import PathsTable
+
+
+SHA256 = 'a' * 64
+
+PATHS_JSON = {
+    'paths': [
+        {'_path': 'lib/libz.so', 'path_type': 'hardlink',
+         'sha256': SHA256, 'size_in_bytes': 1024},
+        {'_path': 'bin/./python', 'path_type': 'softlink',
+         'sha256': 'b' * 64, 'size_in_bytes': 0, 'no_link': True},
+        {'_path': 'etc/config', 'path_type': 'hardlink',
+         'prefix_placeholder': '/opt/anaconda1anaconda2anaconda3', 'file_mode': 'text'},
+        {'_path': 'share/odd', 'sha256': 'not-a-digest', 'size_in_bytes': '12'},
+        {'_path': 'share/zero', 'sha256': '0' * 64, 'size_in_bytes': 0},
+    ],
+    'paths_version': 1,
+}
+
+
+def test_rows():
+    table = PathsTable.from_json(PATHS_JSON)
+    assert len(table) == 5
+    assert table.paths == ['lib/libz.so', 'bin/./python', 'etc/config', 'share/odd', 'share/zero']
+    assert table.sorted_rows() == [1, 2, 0, 3, 4]
+    assert table.find('lib/libz.so') == 0
+    assert table.find('lib/missing.so') is None
+
+
+def test_columns():
+    table = PathsTable.from_json(PATHS_JSON)
+    row = table.find('lib/libz.so')
+    assert table.sha256(row) == SHA256
+    assert table.size(row) == 1024
+    assert table.path_type(row) == 'hardlink'
+    row = table.find('etc/config')
+    assert table.sha256(row) is None
+    assert table.size(row) is None
+    # values that do not fit a column are kept as they were
+    row = table.find('share/odd')
+    assert table.sha256(row) == 'not-a-digest'
+    assert table.size(row) == '12'
+    assert table.path_type(row) is None
+    row = table.find('share/zero')
+    assert table.sha256(row) == '0' * 64
+    assert table.size(row) == 0
+
+
+def test_many_path_types():
+    paths_json = {'paths': [{'_path': 'file{}'.format(i), 'path_type': 'type{}'.format(i % 300)}
+                            for i in range(600)]}
+    table = PathsTable.from_json(paths_json)
+    assert [table.path_type(row) for row in range(600)] == [
+        'type{}'.format(i % 300) for i in range(600)]
+    assert table.to_json() == paths_json
+
+
+def test_placeholders():
+    table = PathsTable.from_json(PATHS_JSON)
+    assert list(table.placeholders()) == [
+        ('etc/config', '/opt/anaconda1anaconda2anaconda3', 'text'),
+    ]
+
+
+def test_round_trip():
+    table = PathsTable.from_json(PATHS_JSON)
+    key = lambda entry: entry['_path']
+    paths_json = table.to_json()
+    assert paths_json['paths_version'] == 1
+    assert sorted(paths_json['paths'], key=key) == sorted(PATHS_JSON['paths'], key=key)
+    assert PathsTable().to_json() == {'paths': []}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64, 1 << 16])
+def test_load(chunk_size):
+    paths_json = dict(PATHS_JSON, paths=PATHS_JSON['paths'] + [
+        {'_path': u'share/caf\xe9', 'size_in_bytes': 123456789},
+    ])
+    text = json.dumps(paths_json, indent=1, ensure_ascii=False).encode('utf-8')
+    table = PathsTable.load(io.BytesIO(text), chunk_size)
+    assert table.to_json() == PathsTable.from_json(paths_json).to_json()
+    assert table.size(table.find(u'share/caf\xe9')) == 123456789
+
+
+def test_load_large_value():
+    class CountingReader(io.BytesIO):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            return super(CountingReader, self).read(size)
+
+    description = 'x' * (1 << 20)
+    paths_json = dict(PATHS_JSON, description=description, paths=PATHS_JSON['paths'] + [
+        {'_path': 'share/' + description},
+    ])
+    f = CountingReader(json.dumps(paths_json).encode('utf-8'))
+    table = PathsTable.load(f, 64)
+    assert table.find('share/' + description) == len(PATHS_JSON['paths'])
+    # reads grow with the value rather than staying at 64 bytes
+    assert f.reads < 100
+
+
+@pytest.mark.parametrize('text', [
+    b'{}',
+    b'{"paths": []}',
+    b' {"paths_version": 1, "paths": [] } ',
+])
+def test_load_empty(text):
+    assert len(PathsTable.load(io.BytesIO(text), 2)) == 0
+
+
+@pytest.mark.parametrize('text', [
+    b'',
+    b'[]',
+    b'{"paths": [1]}',
+    b'{"paths": [{"_path": "a"}',
+    b'{"paths": [{"_path": "a"} {"_path": "b"}]}',
+])
+def test_load_invalid(text):
+    with pytest.raises(ValueError):
+        PathsTable.load(io.BytesIO(text), 4)
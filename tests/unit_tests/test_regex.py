@@ -3,6 +3,7 @@ import os
 import pytest
 
 from conda_verify import checks, utilities
+from conda_verify.matchspec import is_version_spec
 
 
 @pytest.fixture
@@ -51,3 +52,17 @@ def test_ver_spec_pat(package_dir, recipe_dir):
     assert utilities.fullmatch(recipe_ver_spec_pat, or_version)
     assert utilities.fullmatch(recipe_ver_spec_pat, regex_version)
     assert utilities.fullmatch(recipe_ver_spec_pat, python_version)
+
+
+@pytest.mark.parametrize('spec', [
+    '>===3.5', '>=1.2', '==1.2.2', '>=2,<3', '<=2.0.0*,<3.0.0*', '2.0rc1', '>=1.9.3,<2.0.0a0',
+    '1.0|1.2.*', '3.6*', '3.6.*', '1.2.', '.1', '1..2', '1_2', '>=1.2,', '|1', '1,,2', '>=1.2<2',
+    '1.0+abc', '1.0-1', '', '>=', 'rc1',
+])
+def test_is_version_spec_agrees_with_ver_spec_pat(spec):
+    assert is_version_spec(spec) == bool(utilities.fullmatch(checks.ver_spec_pat, spec))
+
+
+def test_is_version_spec_pathological():
+    # ver_spec_pat takes minutes to reject this; is_version_spec is linear
+    assert not is_version_spec('1' * 100000 + '@')
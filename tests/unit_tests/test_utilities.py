@@ -0,0 +1,36 @@
+import pytest
+
+from conda_verify import utilities
+from conda_verify.utilities import all_ascii, find_first, first_non_ascii
+
+
+@pytest.mark.parametrize('data,allow_CR,offset', [
+    (b'', False, -1),
+    (b'bin/python\ninfo/index.json\n', False, -1),
+    (b'bin/python\r\n', False, 10),
+    (b'bin/python\r\n', True, -1),
+    (b'bin/p\xc3\xbfthon\n', False, 5),
+    (b'bin/\tpython', True, 4),
+    (b'bin/\x7fpython', False, 4),
+    (u'bin/p\xffthon', False, 5),
+])
+def test_first_non_ascii(data, allow_CR, offset):
+    assert first_non_ascii(data, allow_CR) == offset
+    assert all_ascii(data, allow_CR) == (offset == -1)
+
+
+def test_first_non_ascii_across_chunks(monkeypatch):
+    monkeypatch.setattr(utilities, 'ASCII_SCAN_CHUNK', 4)
+    assert first_non_ascii(b'abcdefghij') == -1
+    assert first_non_ascii(b'abcdefg\xffij') == 7
+    assert first_non_ascii(b'abcd\xff') == 4
+
+
+def test_find_first():
+    data = b'xx/conda-bld/yy/home/conda/feedstock_root/zz'
+    patterns = [b'/home/conda/feedstock_root/', b'/conda-bld/', b'/missing/']
+    assert find_first(data, patterns) == (2, b'/conda-bld/')
+    assert find_first(data, patterns, start=3) == (15, b'/home/conda/feedstock_root/')
+    assert find_first(data, patterns, end=12) is None
+    # a longer pattern that starts first wins over a shorter one found earlier in the list
+    assert find_first(b'abcdef', [b'cd', b'bcdef']) == (1, b'bcdef')
@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import time
+
+from conda_verify.workqueue import WorkQueue
+
+
+def make_queue(tmpdir, paths_and_weights, **kwargs):
+    queue = WorkQueue(str(tmpdir.join('queue')), **kwargs)
+    queue.create()
+    queue.enqueue(paths_and_weights)
+    return queue
+
+
+def test_work_queue_claims_heaviest_first(tmpdir):
+    queue = make_queue(tmpdir, [('small', 1), ('large', 100), ('medium', 10)])
+    assert queue.enqueue([('small', 1), ('other', 5)]) == 1
+    with queue:
+        claimed = []
+        for path in queue.claim_iter():
+            claimed.append(path)
+            queue.complete(path, ['[C1146] stand-in issue'] if path == 'large' else [])
+    assert claimed == ['large', 'medium', 'other', 'small']
+    assert queue.results() == {'large': ['[C1146] stand-in issue'], 'medium': [],
+                               'other': [], 'small': []}
+
+
+def test_work_queue_requeues_expired_leases(tmpdir):
+    queue = make_queue(tmpdir, [('orphan', 1)], lease=1, poll_interval=0.1)
+    # a worker on another node claimed the input and then died
+    [name] = os.listdir(str(tmpdir.join('queue', 'pending')))
+    lease = str(tmpdir.join('queue', 'leased', name + '~dead-node'))
+    os.rename(str(tmpdir.join('queue', 'pending', name)), lease)
+    os.utime(lease, (time.time() - 60, time.time() - 60))
+    with queue:
+        assert list(queue.claim_iter()) == ['orphan']
+
+
+def test_work_queue_claims_without_waiting(tmpdir):
+    queue = make_queue(tmpdir, [('a', 1), ('b', 1)], lease=60)
+    with queue, WorkQueue(queue.directory) as other:
+        held = next(other.claim_iter())
+        # returns although the other claim is live, rather than waiting on it
+        assert list(queue.claim_iter(wait=False)) == [path for path in ('a', 'b')
+                                                      if path != held]
+        other.complete(held, [])
+        assert not queue.wait_for_work()
+
+
+def test_work_queue_release_returns_claims(tmpdir):
+    queue = make_queue(tmpdir, [('a', 1), ('b', 1)])
+    with queue:
+        next(queue.claim_iter())
+    with WorkQueue(queue.directory) as other:
+        assert sorted(other.claim_iter()) == ['a', 'b']
+
+
+def drain(directory):
+    claimed = []
+    with WorkQueue(directory, lease=5, poll_interval=0.05) as queue:
+        for path in queue.claim_iter():
+            time.sleep(0.01)
+            queue.complete(path, [])
+            claimed.append(path)
+    return claimed
+
+
+def test_work_queue_shared_by_processes(tmpdir):
+    paths = ['package-{}'.format(i) for i in range(40)]
+    queue = make_queue(tmpdir, [(path, i) for i, path in enumerate(paths)])
+    pool = multiprocessing.Pool(3)
+    try:
+        claimed = pool.map(drain, [queue.directory] * 3)
+    finally:
+        pool.close()
+        pool.join()
+    assert sorted(sum(claimed, [])) == sorted(paths)
+    assert sorted(queue.results()) == sorted(paths)